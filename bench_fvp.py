@@ -0,0 +1,646 @@
+#!/usr/bin/env python3
+"""
+FVP Tools benchmarks
+Measures fvp_tools.py throughput on synthetic inputs, no game files needed
+"""
+
+import json
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import resource  # Peak RSS, not available on Windows
+except ImportError:
+    resource = None
+
+import numpy as np
+from PIL import Image
+
+import fvp_tools
+from fvp_tools import (
+    HCB_OPCODES, OPARG_NULL, OPARG_X32, OPARG_I32, OPARG_I16, OPARG_I8,
+    OPARG_I8I8, OPARG_STRING, NVSG_CHANNELS, get_opcode_info,
+)
+
+
+# =============================================================================
+# Synthetic corpus generators (HCB, BIN, NVSG)
+# =============================================================================
+
+SAMPLE_TEXTS = [
+    "こんにちは", "星空のメモリア", "I loved her.",
+    "It was a sort of love~that wasn't quite romantic.", "",
+]
+
+def make_hcb(function_count: int, seed: int = 1) -> bytes:
+    """
+    Builds a synthetic HCB script using every opcode in HCB_OPCODES.
+    Branches and calls point at real instruction and function addresses,
+    and the data section starts with the address of the first function.
+    """
+    rng = random.Random(seed)
+    texts = [t.encode('cp932') + b'\x00' for t in SAMPLE_TEXTS]
+    body_ops = [(op, arg) for op, name, arg in HCB_OPCODES if name != "initstack"]
+
+    code = bytearray(4)  # Entry point, patched at the end
+    functions = []
+    instructions = []
+    fixups = []  # (operand position, opcode)
+
+    for _ in range(function_count):
+        functions.append(len(code))
+        code += bytes((0x01, rng.randint(0, 8), rng.randint(0, 8)))
+        for _ in range(rng.randint(8, 48)):
+            instructions.append(len(code))
+            op, arg = rng.choice(body_ops)
+            code.append(op)
+            if arg == OPARG_X32:
+                if op in fvp_tools.HCB_BRANCH_OPCODES:
+                    fixups.append((len(code), op))
+                    code += bytes(4)
+                else:
+                    code += struct.pack('<f', rng.uniform(-100, 100))
+            elif arg == OPARG_I32:
+                code += struct.pack('<i', rng.randint(-2**31, 2**31 - 1))
+            elif arg in (OPARG_I16, OPARG_I8I8):
+                code += struct.pack('<h', rng.randint(-2**15, 2**15 - 1))
+            elif arg == OPARG_I8:
+                code += struct.pack('<b', rng.randint(-128, 127))
+            elif arg == OPARG_STRING:
+                text = rng.choice(texts)
+                code.append(len(text))
+                code += text
+        code.append(0x04)  # ret
+
+    for pos, op in fixups:
+        target = rng.choice(functions) if op == 0x02 else rng.choice(instructions)
+        struct.pack_into('<I', code, pos, target)
+    struct.pack_into('<I', code, 0, len(code))
+
+    title = "Benchmark".encode('cp932') + b'\x00'
+    data = struct.pack('<IHHH', functions[0], 16, 16, 0) + bytes((len(title),)) + title
+    data += struct.pack('<H', 0)
+    return bytes(code) + data
+
+
+def make_bin(entry_count: int, seed: int = 1) -> bytes:
+    """
+    Builds a synthetic BIN archive with entry_count files: a mix of OGG/WAV
+    headed audio blobs, small NVSG images and raw data, 0.5-32 KB each.
+    """
+    rng = random.Random(seed)
+    kinds = [(b'OggS', "voice"), (b'RIFF', "se"), (None, "bg"), (b'', "data")]
+    
+    names = []
+    contents = []
+    for i in range(entry_count):
+        magic, prefix = kinds[i % len(kinds)]
+        names.append(f"{prefix}{i:05d}".encode('shift_jis') + b'\x00')
+        if magic is None:
+            contents.append(make_nvsg(rng.choice((0, 1, 3)), 64, 48, seed=seed + i))
+        else:
+            contents.append(magic + rng.randbytes(rng.randint(512, 32 * 1024)))
+    
+    table_size = entry_count * 12
+    names_size = sum(len(n) for n in names)
+    offset = 8 + table_size + names_size
+    
+    table = bytearray()
+    name_offset = 0
+    for name, content in zip(names, contents):
+        table += struct.pack('<III', name_offset, offset, len(content))
+        name_offset += len(name)
+        offset += len(content)
+    return b''.join([struct.pack('<II', entry_count, names_size), bytes(table)] + names + contents)
+
+
+def make_nvsg(fmt: int, width: int, height: int, image_count: int = 1, seed: int = 1,
+              x: int = 0, y: int = 0, **fields: int) -> bytes:
+    """
+    Builds a synthetic NVSG image (formats 0-3). Pixels are smooth gradients
+    with light noise, so they compress about like real CGs.
+    Format 2 stacks image_count frames of width x height vertically; fields
+    sets header_size and unk1-unk4.
+    """
+    rng = np.random.default_rng(seed)
+    rows = height * max(image_count, 1) if fmt == 2 else height
+    channels = NVSG_CHANNELS[fmt]
+    
+    ys, xs = np.mgrid[0:rows, 0:width]
+    pixels = np.empty((rows, width, channels), dtype=np.uint8)
+    for c in range(channels):
+        gradient = (xs * (c + 1) + ys * (channels - c)) // 4
+        pixels[:, :, c] = (gradient + rng.integers(0, 8, size=(rows, width))) & 0xFF
+    data = pixels.tobytes()
+    
+    header = struct.pack('<4sII4sHHHHHHHHIII', b'hzc1', len(data), fields.get('header_size', 0x20),
+                         b'NVSG', 256, fmt, width, height, x, y, fields.get('unk1', 0),
+                         fields.get('unk2', 0), image_count if fmt == 2 else 0,
+                         fields.get('unk3', 0), fields.get('unk4', 0))
+    return header + zlib.compress(data, 6)
+
+
+# =============================================================================
+# Reference: the original per-instruction if/elif decode loop
+# =============================================================================
+
+def legacy_decode(data: bytes) -> List[str]:
+    """Two-pass decoder as it was before the shared scanner/dispatch table."""
+    code_end = struct.unpack_from('<I', data, 0)[0]
+    functions = {}
+    labels = {}
+
+    pos = 4
+    func_num = 0
+    while pos < code_end:
+        opcode = data[pos]
+        if opcode > 0x27:
+            pos += 1
+            continue
+        name, arg_type = get_opcode_info(opcode)
+        if name == "initstack":
+            functions[pos] = func_num
+            func_num += 1
+        pos += 1
+        if arg_type == OPARG_X32:
+            if name in ("jmp", "jmpcond", "call"):
+                target = struct.unpack_from('<I', data, pos)[0]
+                if target < code_end and target not in labels and target not in functions:
+                    labels[target] = f"label_{target:08x}"
+            pos += 4
+        elif arg_type == OPARG_I32:
+            pos += 4
+        elif arg_type in (OPARG_I16, OPARG_I8I8):
+            pos += 2
+        elif arg_type == OPARG_I8:
+            pos += 1
+        elif arg_type == OPARG_STRING:
+            pos += 1 + data[pos]
+
+    lines = []
+    string_id = 0
+    pos = 4
+    current_func = -1
+    while pos < code_end:
+        if pos in functions:
+            if current_func >= 0:
+                lines.append("")
+            current_func = functions[pos]
+            lines.append(f"# ===== FUNCTION {current_func} =====")
+        if pos in labels:
+            lines.append(f"{labels[pos]}:")
+        opcode = data[pos]
+        if opcode > 0x27:
+            pos += 1
+            continue
+        name, arg_type = get_opcode_info(opcode)
+        pos += 1
+        if arg_type == OPARG_NULL:
+            lines.append(f"  {name}")
+        elif arg_type == OPARG_X32:
+            val = struct.unpack_from('<I', data, pos)[0]
+            pos += 4
+            if name in ("jmp", "jmpcond"):
+                target_label = labels.get(val, functions.get(val))
+                if isinstance(target_label, int):
+                    lines.append(f"  {name} FUNCTION_{target_label}")
+                elif target_label is not None:
+                    lines.append(f"  {name} {target_label}")
+                else:
+                    lines.append(f"  {name} 0x{val:08X}")
+            elif name == "call":
+                func_id = functions.get(val)
+                if func_id is not None:
+                    lines.append(f"  {name} FUNCTION_{func_id}")
+                else:
+                    lines.append(f"  {name} 0x{val:08X}")
+            elif name == "pushfloat":
+                float_val = struct.unpack('<f', struct.pack('<I', val))[0]
+                lines.append(f"  {name} {float_val}")
+            else:
+                lines.append(f"  {name} 0x{val:08X}")
+        elif arg_type == OPARG_I32:
+            lines.append(f"  {name} {struct.unpack_from('<i', data, pos)[0]}")
+            pos += 4
+        elif arg_type == OPARG_I16:
+            lines.append(f"  {name} {struct.unpack_from('<h', data, pos)[0]}")
+            pos += 2
+        elif arg_type == OPARG_I8:
+            lines.append(f"  {name} {struct.unpack_from('<b', data, pos)[0]}")
+            pos += 1
+        elif arg_type == OPARG_I8I8:
+            val1 = struct.unpack_from('<b', data, pos)[0]
+            val2 = struct.unpack_from('<b', data, pos + 1)[0]
+            pos += 2
+            lines.append(f"  {name} {val1}, {val2}")
+        elif arg_type == OPARG_STRING:
+            str_len = data[pos]
+            pos += 1
+            string = data[pos:pos + str_len].decode('cp932', errors='replace').rstrip('\x00')
+            pos += str_len
+            escaped = string.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+            lines.append(f'  {name} "{escaped}"  ; [STR_{string_id:04d}]')
+            string_id += 1
+    return lines
+
+
+def dispatch_decode(data: bytes) -> int:
+    """Scanner + dispatch-table listing, as used by hcb-decode."""
+    index = fvp_tools.hcb_scan(data)
+    lines = fvp_tools._hcb_listing(data, index, index.functions(), index.labels())
+    return sum(1 for _ in lines)
+
+
+# =============================================================================
+# Benchmarks
+# =============================================================================
+
+def best_time(func, *args, repeat: int = 5) -> float:
+    """Returns the best wall time of repeat calls."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_hcb_dispatch(function_count: int, repeat: int):
+    """Instructions per second of the legacy decode loop vs the dispatch engine."""
+    data = make_hcb(function_count)
+    instructions = len(fvp_tools.hcb_scan(data))
+    print(f"HCB dispatch benchmark: {len(data)} bytes, {instructions} instructions")
+
+    legacy = best_time(legacy_decode, data, repeat=repeat)
+    scan = best_time(fvp_tools.hcb_scan, data, repeat=repeat)
+    dispatch = best_time(dispatch_decode, data, repeat=repeat)
+
+    print(f"  legacy if/elif decode:   {instructions / legacy:12,.0f} instr/s ({legacy:.3f}s)")
+    print(f"  dispatch scan only:      {instructions / scan:12,.0f} instr/s ({scan:.3f}s)")
+    print(f"  dispatch scan + listing: {instructions / dispatch:12,.0f} instr/s ({dispatch:.3f}s)")
+    print(f"  Speedup: {legacy / dispatch:.2f}x")
+
+
+# =============================================================================
+# NVSG compression levels: encode time and output size per setting
+# =============================================================================
+
+def load_level_images(folder: Optional[str]) -> List[tuple]:
+    """
+    (name, image, image_count) for the PNGs in folder, with image_count
+    from its metadata.jsonl or decode_log.txt. Without a folder, two synthetic 1920x1080
+    BGRA CGs and an 8-frame sprite sheet are used.
+    """
+    if folder is None:
+        images = []
+        for name, fmt, w, h, count in (("cg_a", 1, 1920, 1080, 1), ("cg_b", 1, 1920, 1080, 1),
+                                       ("sprite", 2, 256, 256, 8)):
+            img, _ = fvp_tools.nvsg_decode_bytes(make_nvsg(fmt, w, h, image_count=count, seed=len(images)))
+            images.append((name, img, count))
+        return images
+    
+    folder = Path(folder)
+    log_map = {}
+    for log_name in (fvp_tools.METADATA_NAME, "decode_log.txt"):
+        if (folder / log_name).exists():
+            log_map = fvp_tools.read_metadata(folder / log_name)
+            break
+    images = []
+    for f in sorted(folder.glob('*.png')):
+        with Image.open(f) as img:
+            img.load()
+            images.append((f.name, img.copy(), log_map.get(f.name, {}).get('image_count', 1)))
+    return images
+
+
+def bench_nvsg_levels(folder: Optional[str], levels: List[int], strategies: List[str], repeat: int):
+    """Total encode time and NVSG size of a folder for each level/strategy."""
+    images = load_level_images(folder)
+    if not images:
+        print("Error: No PNG files found")
+        return
+    raw = sum(len(img.tobytes()) for _, img, _ in images)
+    print(f"NVSG levels benchmark: {len(images)} images, {raw / (1024 * 1024):.1f} MB raw pixels")
+    
+    def encode_all(level, strategy):
+        return sum(len(fvp_tools.nvsg_encode_image(img, 0, 0, count, level, strategy)[0])
+                   for _, img, count in images)
+    
+    print(f"  {'Level':>5} {'Strategy':<9} {'Time s':>8} {'MB/s':>8} {'Size MB':>9} {'Ratio':>7}")
+    for strategy in strategies:
+        for level in levels:
+            seconds = best_time(encode_all, level, strategy, repeat=repeat)
+            size = encode_all(level, strategy)
+            print(f"  {level:>5} {strategy:<9} {seconds:>8.3f} {raw / (1024 * 1024) / seconds:>8.1f} "
+                  f"{size / (1024 * 1024):>9.2f} {size / raw:>7.1%}")
+
+
+# =============================================================================
+# Start-up time: module imports and short HCB/BIN commands
+# =============================================================================
+
+HEAVY_MODULES = ('numpy', 'PIL', 'multiprocessing')
+
+def import_times(code: str) -> Dict[str, tuple]:
+    """
+    Runs code under python -X importtime in a fresh interpreter and returns
+    {module: (self us, cumulative us)} from its report.
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          capture_output=True, text=True, check=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+    times = {}
+    for line in proc.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            if self_us.strip().isdigit():
+                times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def command_time(argv: List[str], repeat: int) -> float:
+    """Best wall time in ms of running argv in a new process, repeat times."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(argv, stdout=subprocess.DEVNULL, check=True,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench_startup(repeat: int):
+    """Import cost of fvp_tools and wall time of short HCB/BIN commands."""
+    times = import_times('import fvp_tools')
+    total = times['fvp_tools'][1] / 1000
+    loaded = [name for name in HEAVY_MODULES if name in times]
+    print(f"import fvp_tools: {total:.1f} ms (python -X importtime)")
+    print(f"  Heavy modules loaded: {', '.join(loaded) if loaded else 'none'}")
+    print("  Slowest imports (self time):")
+    for name, (self_us, _) in sorted(times.items(), key=lambda item: -item[1][0])[:5]:
+        print(f"    {self_us / 1000:7.1f} ms  {name}")
+    
+    imaging = import_times('import fvp_tools; fvp_tools._require_imaging()')
+    extra = sum(imaging[name][1] for name in ('PIL.Image', 'numpy') if name in imaging) / 1000
+    print(f"  Pillow + NumPy on first NVSG use: +{extra:.1f} ms")
+    
+    tool = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fvp_tools.py')
+    python = command_time([sys.executable, '-c', 'pass'], repeat)
+    with tempfile.TemporaryDirectory(prefix="fvp_bench_") as tmp:
+        workdir = Path(tmp)
+        (workdir / "script.hcb").write_bytes(make_hcb(200))
+        (workdir / "archive.bin").write_bytes(make_bin(50))
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            fvp_tools.hcb_extract_strings(workdir / "script.hcb", workdir / "strings.txt", use_cache=False)
+        
+        commands = [
+            ('usage', []),
+            ('hcb-strings', ['hcb-strings', str(workdir / "script.hcb"), str(workdir / "out.txt"),
+                             '--no-cache']),
+            ('hcb-rebuild', ['hcb-rebuild', str(workdir / "script.hcb"), str(workdir / "strings.txt"),
+                             str(workdir / "out.hcb"), '--no-cache']),
+            ('bin-list', ['bin-list', str(workdir / "archive.bin")]),
+            ('bin-extract', ['bin-extract', str(workdir / "archive.bin"), str(workdir / "files"),
+                             '--quiet']),
+        ]
+        # A script is compiled on every run; -m loads fvp_tools from its cached bytecode
+        print(f"\nCommand wall time, best of {repeat} (python -c pass: {python:.1f} ms)")
+        print(f"  {'Command':<13} {'fvp_tools.py':>13} {'-m fvp_tools':>13}")
+        for label, args in commands:
+            script = command_time([sys.executable, tool] + args, repeat)
+            module = command_time([sys.executable, '-m', 'fvp_tools'] + args, repeat)
+            print(f"  {label:<13} {script:>10.1f} ms {module:>10.1f} ms")
+
+
+# =============================================================================
+# Command suite: throughput and peak RSS per fvp_tools command
+# =============================================================================
+
+def build_corpus(workdir: Path, scale: int) -> Dict[str, dict]:
+    """
+    Writes the synthetic corpus into workdir and returns, per command,
+    the input size in bytes and the number of items it processes.
+    """
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        hcb = make_hcb(20000 * scale)
+        (workdir / "script.hcb").write_bytes(hcb)
+        index = fvp_tools.hcb_scan(hcb)
+        fvp_tools.hcb_extract_strings(workdir / "script.hcb", workdir / "strings.txt", use_cache=False)
+        
+        # Every third string grows, so the rebuild has to relocate
+        lines = (workdir / "strings.txt").read_text(encoding='cp932').splitlines()
+        lines = [line + " (edited)" if i % 3 == 0 else line for i, line in enumerate(lines)]
+        (workdir / "modified.txt").write_text('\n'.join(lines) + '\n', encoding='cp932')
+        
+        archive = make_bin(2000 * scale)
+        (workdir / "archive.bin").write_bytes(archive)
+        fvp_tools.bin_extract(workdir / "archive.bin", workdir / "archive_files")
+        
+        nvsg_dir = workdir / "nvsg"
+        nvsg_dir.mkdir()
+        images = 0
+        for fmt in range(4):
+            for i in range(2 * scale):
+                if fmt == 2:
+                    data = make_nvsg(fmt, 256, 256, image_count=8, seed=i)
+                else:
+                    data = make_nvsg(fmt, 1280, 720, seed=i)
+                (nvsg_dir / f"fmt{fmt}_{i:03d}").write_bytes(data)
+                images += 1
+        fvp_tools.batch_decode(nvsg_dir, workdir / "png")
+    
+    nvsg_bytes = sum(f.stat().st_size for f in nvsg_dir.iterdir())
+    png_bytes = sum(f.stat().st_size for f in (workdir / "png").glob('*.png'))
+    return {
+        'hcb-decode': {'bytes': len(hcb), 'items': len(index), 'unit': 'instr'},
+        'hcb-rebuild': {'bytes': len(hcb), 'items': len(index.str_offsets), 'unit': 'strings'},
+        'bin-extract': {'bytes': len(archive), 'items': 2000 * scale, 'unit': 'files'},
+        'bin-pack': {'bytes': len(archive), 'items': 2000 * scale, 'unit': 'files'},
+        'nvsg-decode': {'bytes': nvsg_bytes, 'items': images, 'unit': 'images'},
+        'nvsg-encode': {'bytes': png_bytes, 'items': images, 'unit': 'images'},
+    }
+
+
+def run_command(command: str, workdir: Path):
+    """Runs one suite command on the corpus in workdir (output goes to workdir/out)."""
+    out = workdir / "out"
+    if out.exists():
+        shutil.rmtree(out)
+    out.mkdir()
+    
+    if command == 'hcb-decode':
+        fvp_tools.hcb_decode(workdir / "script.hcb", out / "script.txt", out / "strings.txt",
+                             use_cache=False)
+    elif command == 'hcb-rebuild':
+        fvp_tools.hcb_rebuild(workdir / "script.hcb", workdir / "modified.txt", out / "script.hcb",
+                              use_cache=False)
+    elif command == 'bin-extract':
+        fvp_tools.bin_extract(workdir / "archive.bin", out)
+    elif command == 'bin-pack':
+        fvp_tools.bin_pack(workdir / "archive_files", out / "archive.bin")
+    elif command == 'nvsg-decode':
+        for f in sorted((workdir / "nvsg").iterdir()):
+            fvp_tools.nvsg_decode(f, out / (f.name + ".png"))
+    elif command == 'nvsg-encode':
+        fvp_tools.batch_encode(workdir / "png", out, workdir / "png" / fvp_tools.METADATA_NAME,
+                               use_cache=False)
+    else:
+        raise ValueError(f"Unknown suite command: {command}")
+
+
+SUITE_COMMANDS = ['hcb-decode', 'hcb-rebuild', 'bin-extract', 'bin-pack', 'nvsg-decode', 'nvsg-encode']
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, None where unsupported."""
+    # Linux keeps ru_maxrss across fork/exec, so a child would report the
+    # parent's peak; VmHWM belongs to the new address space only
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024  # bytes / KB
+
+
+def measure(command: str, workdir: Path):
+    """
+    Child process side of the suite: runs one command and prints its wall
+    time and the process' peak RSS as JSON. A fresh process per command
+    keeps peak RSS from leaking between measurements.
+    """
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        start = time.perf_counter()
+        run_command(command, workdir)
+        seconds = time.perf_counter() - start
+    print(json.dumps({'seconds': seconds, 'peak_rss_mb': peak_rss_mb()}))
+
+
+def bench_suite(scale: int, repeat: int, commands: List[str], json_path: Optional[str],
+                keep: Optional[str]):
+    """MB/s, items/s and peak RSS of each command on a generated corpus."""
+    with tempfile.TemporaryDirectory(prefix="fvp_bench_") as tmp:
+        workdir = Path(keep) if keep else Path(tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        
+        print(f"Generating corpus (scale {scale}) in {workdir}...")
+        corpus = build_corpus(workdir, scale)
+        
+        print(f"{'Command':<13} {'Input MB':>9} {'Items':>9} {'Time s':>8} "
+              f"{'MB/s':>8} {'Items/s':>10}  {'Peak RSS':>9}")
+        results = []
+        for command in commands:
+            runs = []
+            for _ in range(repeat):
+                proc = subprocess.run([sys.executable, __file__, 'measure', command, str(workdir)],
+                                      capture_output=True, text=True, check=True)
+                runs.append(json.loads(proc.stdout.splitlines()[-1]))
+            
+            info = corpus[command]
+            seconds = min(run['seconds'] for run in runs)
+            peaks = [run['peak_rss_mb'] for run in runs if run['peak_rss_mb'] is not None]
+            result = {
+                'command': command, 'scale': scale, 'bytes': info['bytes'],
+                'items': info['items'], 'unit': info['unit'], 'seconds': seconds,
+                'mb_per_s': info['bytes'] / (1024 * 1024) / seconds,
+                'items_per_s': info['items'] / seconds,
+                'peak_rss_mb': max(peaks) if peaks else None,
+            }
+            results.append(result)
+            
+            rss = f"{result['peak_rss_mb']:.1f} MB" if peaks else "n/a"
+            print(f"{command:<13} {info['bytes'] / (1024 * 1024):>9.1f} {info['items']:>9} "
+                  f"{seconds:>8.3f} {result['mb_per_s']:>8.1f} {result['items_per_s']:>10,.0f}  "
+                  f"{rss:>9}  ({info['unit']})")
+    
+    if json_path:
+        # One JSON object per line, appended so CI can keep a history
+        with open(json_path, 'a', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+        print(f"Results appended to {json_path}")
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def print_usage():
+    print("""
+FVP Tools benchmarks
+
+Usage:
+    python bench_fvp.py hcb-dispatch [--functions <N>] [--repeat <N>]
+    python bench_fvp.py nvsg-levels [<png_folder>] [--levels <N,...>] [--strategies <name,...>] [--repeat <N>]
+    python bench_fvp.py startup [--repeat <N>]
+    python bench_fvp.py suite [--scale <N>] [--repeat <N>] [--only <cmd,...>] [--json <results.jsonl>] [--keep <dir>]
+
+Options:
+  --functions Number of functions in the synthetic HCB (default: 5000)
+  --repeat    Runs per measurement, best time is reported
+              (default: 5, startup: 10, nvsg-levels/suite: 1)
+  --levels    zlib levels to compare (default: 1,3,6,9)
+  --strategies  zlib strategies to compare (default: default)
+              default, filtered, rle, huffman, fixed
+  --scale     Corpus size multiplier: 20000 HCB functions, 2000 BIN entries
+              and 8 NVSG images per unit (default: 1)
+  --only      Comma-separated suite commands (default: all)
+              hcb-decode, hcb-rebuild, bin-extract, bin-pack, nvsg-decode, nvsg-encode
+  --json      Append one JSON result per command to this file
+  --keep      Generate the corpus in this folder and keep it
+""")
+
+
+def get_option(args: List[str], name: str, default):
+    if name in args:
+        i = args.index(name)
+        if i + 1 < len(args):
+            return type(default)(args[i + 1]) if default is not None else args[i + 1]
+    return default
+
+
+def main():
+    args = sys.argv[1:]
+
+    if len(args) < 1:
+        print_usage()
+        return
+
+    cmd = args[0].lower()
+
+    if cmd == 'hcb-dispatch':
+        bench_hcb_dispatch(get_option(args, '--functions', 5000), get_option(args, '--repeat', 5))
+    elif cmd == 'nvsg-levels':
+        folder = args[1] if len(args) >= 2 and not args[1].startswith('--') else None
+        levels = [int(level) for level in get_option(args, '--levels', '1,3,6,9').split(',')]
+        bench_nvsg_levels(folder, levels, get_option(args, '--strategies', 'default').split(','),
+                          get_option(args, '--repeat', 1))
+    elif cmd == 'startup':
+        bench_startup(get_option(args, '--repeat', 10))
+    elif cmd == 'suite':
+        commands = get_option(args, '--only', ','.join(SUITE_COMMANDS)).split(',')
+        bench_suite(get_option(args, '--scale', 1), get_option(args, '--repeat', 1), commands,
+                    get_option(args, '--json', None), get_option(args, '--keep', None))
+    elif cmd == 'measure' and len(args) >= 3:
+        measure(args[1], Path(args[2]))
+    else:
+        print_usage()
+
+
+if __name__ == '__main__':
+    main()
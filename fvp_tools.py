@@ -4,21 +4,45 @@ FVP Tools - Tools for the Favorite View Point System visual novel engine
 Extracts/packs BIN archives, converts NVSG images, and handles HCB scripts
 """
 
+import os
+import errno
 import struct
 import zlib
 import sys
 import re
+import mmap
+import hashlib
+import json
+import time
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager, redirect_stdout, ExitStack
 from pathlib import Path
-from io import BytesIO
-from typing import Dict, List, Tuple, Optional
-
-try:
-    from PIL import Image
-    import numpy as np
-except ImportError:
-    print("Error: Requires Pillow and NumPy")
-    print("Install with: pip install pillow numpy")
-    sys.exit(1)
+from io import BytesIO, StringIO
+from collections import deque
+from itertools import islice
+from typing import Dict, List, Tuple, Optional, Iterator, Callable, NamedTuple
+
+__version__ = "1.1.0"
+
+# Pillow and NumPy are only needed by the NVSG image code and take most of
+# the start-up time, so they are imported on first use (_require_imaging).
+# concurrent.futures (which pulls in logging and multiprocessing) is imported
+# by the functions that use a pool, for the same reason.
+Image = None
+np = None
+
+def _require_imaging():
+    """Imports Pillow and NumPy into the module globals, once."""
+    global Image, np
+    if Image is None:
+        try:
+            from PIL import Image as pil_image
+            import numpy
+        except ImportError:
+            raise ImportError("NVSG images require Pillow and NumPy "
+                              "(install with: pip install pillow numpy)") from None
+        Image, np = pil_image, numpy
 
 
 # =============================================================================
@@ -78,13 +102,68 @@ HCB_OPCODES = [
     (0x27, "ge", OPARG_NULL),
 ]
 
-HCB_LAST_OPCODE = 0x27
+HCB_LAST_OPCODE = max(op for op, _, _ in HCB_OPCODES)
+
+# Precompiled operand decoders (operands are kept as raw unsigned bits)
+_U8 = struct.Struct('<B')
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+_F32 = struct.Struct('<f')
+
+# Operand size and decoder per argument type (-1: length-prefixed string)
+OPARG_LAYOUT = {
+    OPARG_NULL: (0, None),
+    OPARG_X32: (4, _U32),
+    OPARG_I32: (4, _U32),
+    OPARG_I16: (2, _U16),
+    OPARG_I8: (1, _U8),
+    OPARG_I8I8: (2, _U16),
+    OPARG_STRING: (-1, _U8),
+}
+
+class HcbOpcode(NamedTuple):
+    """Dispatch table entry for one opcode byte."""
+    opcode: int
+    name: str
+    arg_type: int
+    size: int                          # operand size in bytes, -1 for strings
+    operand: Optional[struct.Struct]   # operand decoder
+
+def _build_dispatch(opcodes) -> List[Optional[HcbOpcode]]:
+    """Builds the 256-entry dispatch table (None: byte is not an opcode)."""
+    table: List[Optional[HcbOpcode]] = [None] * 256
+    for op, name, arg_type in opcodes:
+        size, operand = OPARG_LAYOUT[arg_type]
+        table[op] = HcbOpcode(op, name, arg_type, size, operand)
+    return table
+
+HCB_DISPATCH = _build_dispatch(HCB_OPCODES)
+
+# Opcodes sharing a mnemonic (pushint), keyed by name
+HCB_VARIANTS: Dict[str, List[HcbOpcode]] = {}
+for _entry in HCB_DISPATCH:
+    if _entry is not None:
+        HCB_VARIANTS.setdefault(_entry.name, []).append(_entry)
+
+# Mnemonic suffix selecting one variant explicitly (pushint.i32)
+OPARG_SUFFIXES = {
+    OPARG_NULL: "", OPARG_X32: "x32", OPARG_I32: "i32", OPARG_I16: "i16",
+    OPARG_I8: "i8", OPARG_I8I8: "i8i8", OPARG_STRING: "str",
+}
+
+# pushint encodings whose value is treated as a function pointer when it
+# matches a function start (ThreadStart etc.). The bytecode does not tell
+# pointers from integers, so a constant that happens to equal a function
+# start is listed as FUNCTION_n by hcb-decode and relocated by hcb-rebuild
+# and hcb-assemble like a real pointer; hcb-rebuild reports how many it moved
+HCB_POINTER_OPCODES = frozenset((0x0A,))
 
 def get_opcode_info(opcode: int) -> Tuple[str, int]:
     """Returns (name, arg_type) for an opcode."""
-    if opcode > HCB_LAST_OPCODE:
+    entry = HCB_DISPATCH[opcode] if 0 <= opcode < 256 else None
+    if entry is None:
         return (None, None)
-    return (HCB_OPCODES[opcode][1], HCB_OPCODES[opcode][2])
+    return (entry.name, entry.arg_type)
 
 def get_opcode_by_name(name: str) -> List[Tuple[int, int]]:
     """Returns list of (opcode, arg_type) matching the name."""
@@ -96,243 +175,582 @@ def get_opcode_by_name(name: str) -> List[Tuple[int, int]]:
 
 
 # =============================================================================
-# HCB Decoder - Decompiles HCB bytecode to readable text
+# HCB Scanner - Single pass instruction index shared by all HCB commands
 # =============================================================================
 
-def hcb_decode(hcb_path: str, output_path: str, strings_path: Optional[str] = None):
+# Opcodes whose X32 operand is an address inside the code section
+HCB_BRANCH_OPCODES = frozenset((0x02, 0x06, 0x07))  # call, jmp, jmpcond
+
+# Operand size and decoder per opcode byte, flattened from HCB_DISPATCH
+_HCB_SIZES = [None if entry is None else entry.size for entry in HCB_DISPATCH]
+_HCB_READERS = [None if entry is None or entry.operand is None else entry.operand.unpack_from
+                for entry in HCB_DISPATCH]
+
+def _write_arrays(f, arrays):
+    """Writes arrays back to back in little-endian order."""
+    for arr in arrays:
+        if sys.byteorder == 'big' and arr.itemsize > 1:
+            arr = array(arr.typecode, arr)
+            arr.byteswap()
+        arr.tofile(f)
+
+
+def _read_arrays(raw, pos: int, arrays, counts) -> int:
+    """Fills arrays from little-endian data at raw[pos:]. Returns the end position."""
+    for arr, count in zip(arrays, counts):
+        end = pos + count * arr.itemsize
+        arr.frombytes(raw[pos:end])
+        if sys.byteorder == 'big' and arr.itemsize > 1:
+            arr.byteswap()
+        pos = end
+    return pos
+
+
+# Sidecar instruction index cache (<script.hcb>.idx)
+HCB_INDEX_MAGIC = b'FVPI'
+HCB_INDEX_VERSION = 1
+# magic, format version, content digest, tool version, entry point, file size,
+# then the length of each array in HcbIndex._ARRAYS order
+_INDEX_HEADER = struct.Struct('<4sH16s16sII7I')
+
+class HcbIndex:
     """
-    Decompiles an HCB script file to readable text format.
-    Optionally extracts strings to a separate file for translation.
+    Compact instruction index of an HCB code section, built by hcb_scan().
     
-    HCB format notes:
-    - First 4 bytes: entry point offset (also marks end of code section)
-    - Code section: bytes 4 to entry_point
-    - String format: 1 byte length + string data (NOT 2 bytes!)
+    Instructions are stored as parallel arrays rather than Python tuples:
+    - offsets: address of each instruction (stray bytes included)
+    - opcodes: opcode byte (no HCB_DISPATCH entry: stray byte)
+    - values:  raw unsigned operand bits (sign is applied when decoding;
+               string length for pushstring)
+    
+    Strings, function starts and branch instructions are indexed separately
+    so each command only walks the entries it needs.
     """
-    hcb_path = Path(hcb_path)
-    output_path = Path(output_path)
     
-    with open(hcb_path, 'rb') as f:
-        data = f.read()
+    _ARRAYS = ('offsets', 'opcodes', 'values', 'str_offsets', 'str_lengths',
+               'func_offsets', 'branch_indices')
     
+    def __init__(self, entry_point: int, file_size: int):
+        self.entry_point = entry_point
+        self.file_size = file_size
+        self.offsets = array('I')
+        self.opcodes = array('B')
+        self.values = array('I')
+        self.str_offsets = array('I')   # pushstring instruction addresses
+        self.str_lengths = array('B')   # string byte length (incl. null)
+        self.func_offsets = array('I')  # initstack addresses, in order
+        self.branch_indices = array('I')  # instruction indices of call/jmp/jmpcond
+    
+    def __len__(self):
+        return len(self.offsets)
+    
+    @staticmethod
+    def cache_path_for(hcb_path: Path) -> Path:
+        return hcb_path.with_name(hcb_path.name + '.idx')
+    
+    def save(self, path: Path, digest: bytes):
+        """Writes the index as a header followed by the raw arrays."""
+        arrays = [getattr(self, name) for name in self._ARRAYS]
+        header = _INDEX_HEADER.pack(
+            HCB_INDEX_MAGIC, HCB_INDEX_VERSION, digest, __version__.encode('ascii'),
+            self.entry_point, self.file_size, *(len(arr) for arr in arrays))
+        with open(path, 'wb') as f:
+            f.write(header)
+            _write_arrays(f, arrays)
+    
+    @classmethod
+    def load(cls, path: Path, digest: bytes) -> Optional['HcbIndex']:
+        """
+        Loads a cached index in one read. Returns None if the cache is missing,
+        was written by another tool version or belongs to different contents.
+        """
+        try:
+            raw = path.read_bytes()
+            header = _INDEX_HEADER.unpack_from(raw, 0)
+        except (OSError, struct.error):
+            return None
+        magic, version, cached_digest, tool_version, entry_point, file_size = header[:6]
+        counts = header[6:]
+        if (magic != HCB_INDEX_MAGIC or version != HCB_INDEX_VERSION or cached_digest != digest
+                or tool_version.rstrip(b'\x00') != __version__.encode('ascii')):
+            return None
+        
+        index = cls(entry_point, file_size)
+        arrays = [getattr(index, name) for name in cls._ARRAYS]
+        size = _INDEX_HEADER.size + sum(arr.itemsize * n for arr, n in zip(arrays, counts))
+        if len(raw) != size:
+            return None
+        _read_arrays(raw, _INDEX_HEADER.size, arrays, counts)
+        return index
+    
+    def functions(self) -> Dict[int, int]:
+        """Returns {addr: func_number} for every initstack."""
+        return {addr: num for num, addr in enumerate(self.func_offsets)}
+    
+    def labels(self) -> Dict[int, str]:
+        """
+        Returns {addr: label_name} for branch targets inside the code section.
+        A target only becomes a label if it is not a function start that
+        appears before the branch (same rule as the original decoder).
+        """
+        functions = self.functions()
+        labels: Dict[int, str] = {}
+        code_end = self.entry_point
+        offsets, values = self.offsets, self.values
+        for i in self.branch_indices:
+            target = values[i]
+            if target >= code_end or target in labels:
+                continue
+            if target in functions and target < offsets[i]:
+                continue
+            labels[target] = f"label_{target:08x}"
+        return labels
+
+
+def hcb_scan(data) -> HcbIndex:
+    """
+    Walks the code section once and returns its HcbIndex.
+    Scanning stops at the entry point or at the first truncated instruction.
+    """
     if len(data) < 4:
         raise ValueError("File too small to be valid HCB")
     
-    # Entry point is at offset stored in first 4 bytes
     entry_point = struct.unpack_from('<I', data, 0)[0]
-    code_end = entry_point  # Code section ends at entry point offset
+    index = HcbIndex(entry_point, len(data))
+    code_end = min(entry_point, len(data))
+    data_len = len(data)
     
-    print(f"HCB file: {hcb_path.name}")
-    print(f"  Size: {len(data)} bytes")
-    print(f"  Entry point: 0x{entry_point:08X}")
-    print(f"  Code section: 0x0004 - 0x{code_end:08X}")
-    
-    # First pass: find all function starts (initstack) and jump targets
-    functions: Dict[int, int] = {}  # addr -> func_number
-    labels: Dict[int, str] = {}     # addr -> label_name
+    add_offset = index.offsets.append
+    add_opcode = index.opcodes.append
+    add_value = index.values.append
+    add_branch = index.branch_indices.append
+    offsets = index.offsets
+    sizes = _HCB_SIZES
+    readers = _HCB_READERS
     
     pos = 4
-    func_num = 0
-    
     while pos < code_end:
-        if pos >= len(data):
-            break
         opcode = data[pos]
-        if opcode > HCB_LAST_OPCODE:
+        size = sizes[opcode]
+        if size is None:
+            # Stray byte, not part of any instruction
+            add_offset(pos)
+            add_opcode(opcode)
+            add_value(0)
             pos += 1
             continue
         
-        name, arg_type = get_opcode_info(opcode)
+        arg_pos = pos + 1
         
-        # Mark function starts
-        if name == "initstack":
-            functions[pos] = func_num
-            func_num += 1
+        if size > 0:
+            next_pos = arg_pos + size
+            if next_pos > data_len:
+                break
+            value = readers[opcode](data, arg_pos)[0]
+            if opcode in HCB_BRANCH_OPCODES:
+                add_branch(len(offsets))
+        elif size == 0:
+            value = 0
+            next_pos = arg_pos
+        else:  # OPARG_STRING: 1 byte length + string data
+            if arg_pos >= data_len:
+                break
+            value = data[arg_pos]
+            next_pos = arg_pos + 1 + value
+            if next_pos > data_len:
+                break
+            index.str_offsets.append(pos)
+            index.str_lengths.append(value)
         
-        # Calculate instruction size and collect jump targets
-        pos += 1
-        if arg_type == OPARG_NULL:
-            pass
-        elif arg_type == OPARG_X32:
-            if pos + 4 <= len(data):
-                if name in ("jmp", "jmpcond", "call"):
-                    target = struct.unpack_from('<I', data, pos)[0]
-                    if target < code_end and target not in labels and target not in functions:
-                        labels[target] = f"label_{target:08x}"
-            pos += 4
-        elif arg_type == OPARG_I32:
-            pos += 4
-        elif arg_type == OPARG_I16:
-            pos += 2
-        elif arg_type == OPARG_I8:
-            pos += 1
-        elif arg_type == OPARG_I8I8:
-            pos += 2
-        elif arg_type == OPARG_STRING:
-            # String format: 1 byte length + string data
-            if pos < len(data):
-                str_len = data[pos]
-                pos += 1 + str_len
-            else:
-                pos += 1
+        if opcode == 0x01:  # initstack marks a function start
+            index.func_offsets.append(pos)
+        
+        add_offset(pos)
+        add_opcode(opcode)
+        add_value(value)
+        pos = next_pos
     
-    print(f"  Functions: {len(functions)}")
-    print(f"  Labels: {len(labels)}")
+    return index
+
+
+@contextmanager
+def _open_hcb(path: Path, use_mmap: bool = False):
+    """
+    Yields the contents of an HCB file. With use_mmap the file is mapped
+    read-only and a memoryview over the mapping is yielded instead of bytes,
+    so operands and strings are decoded straight from the mapped pages.
+    Slices of the view must not outlive the with block.
+    """
+    if not use_mmap:
+        with open(path, 'rb') as f:
+            yield f.read()
+        return
     
-    # Second pass: decode to text
-    lines = []
-    strings_list = []
-    string_id = 0
-    pos = 4
-    current_func = -1
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < 4:
+            raise ValueError("File too small to be valid HCB")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mm)
+        try:
+            yield view
+        finally:
+            view.release()
+            try:
+                mm.close()
+            except BufferError:
+                pass  # Still referenced from a traceback, closed on collection
+
+
+def hcb_load_index(hcb_path: Path, data, use_cache: bool = True) -> HcbIndex:
+    """
+    Returns the HcbIndex for data (the contents of hcb_path). With use_cache,
+    the index is loaded from the <hcb>.idx sidecar when it matches the file's
+    hash and the tool version; otherwise the script is scanned and the sidecar
+    is (re)written.
+    """
+    if not use_cache:
+        return hcb_scan(data)
     
-    while pos < code_end:
-        if pos >= len(data):
-            break
+    digest = hashlib.blake2b(data, digest_size=16).digest()
+    cache_path = HcbIndex.cache_path_for(hcb_path)
+    index = HcbIndex.load(cache_path, digest)
+    if index is not None:
+        return index
+    
+    index = hcb_scan(data)
+    try:
+        index.save(cache_path, digest)
+    except OSError as e:
+        print(f"  [WARN] Could not write index cache {cache_path.name}: {e}")
+    return index
+
+
+def _hcb_read_string(data, addr: int, length: int) -> str:
+    """Decodes the pushstring at instruction address addr."""
+    start = addr + 2
+    return str(data[start:start + length], 'cp932', 'replace').rstrip('\x00')
+
+
+def _hcb_iter_strings(data, index: HcbIndex) -> Iterator[Tuple[int, int, str]]:
+    """Yields (string_id, addr, text) for every string in the index."""
+    for sid, (addr, length) in enumerate(zip(index.str_offsets, index.str_lengths)):
+        yield sid, addr, _hcb_read_string(data, addr, length)
+
+
+def _hcb_strings_line(sid: int, addr: int, text: str) -> str:
+    """Formats one ID|ADDRESS|TEXT line of a strings file."""
+    escaped = text.replace('\\', '\\\\').replace('\n', '\\n').replace('\r', '\\r')
+    return f"{sid:04d}|0x{addr:08X}|{escaped}\n"
+
+
+# Buffer size for the text writers of the decoders
+HCB_WRITE_BUFFER = 1 << 20
+
+
+# =============================================================================
+# HCB Decoder - Decompiles HCB bytecode to readable text
+# =============================================================================
+
+def _hcb_formatters(data, functions: Dict[int, int], labels: Dict[int, str],
+                    strings_out=None, first_string_id: int = 0) -> List[Callable[[int, int], str]]:
+    """
+    Returns the 256-entry table of listing handlers, one per opcode byte.
+    Each handler takes (addr, value) and returns the instruction line.
+    Handlers are picked by opcode name first, then by argument type.
+    
+    Wherever the plain form would not assemble back to the same bytes, the
+    listing says so explicitly: stray bytes become .byte, non-minimal integer
+    encodings get a width suffix (pushint.i32), NaN floats are written as raw
+    bits and strings that do not survive a cp932 round trip as x"hex".
+    String IDs are numbered from first_string_id.
+    """
+    string_id = first_string_id
+    
+    def fmt_byte(opcode):
+        line = f"  .byte 0x{opcode:02X}\n"
+        return lambda addr, val: line
+    
+    def fmt_null(entry):
+        line = f"  {entry.name}\n"
+        return lambda addr, val: line
+    
+    def fmt_hex(entry):
+        name = entry.name
+        return lambda addr, val: f"  {name} 0x{val:08X}\n"
+    
+    def fmt_jump(entry):
+        name = entry.name
+        def fmt(addr, val):
+            target_label = labels.get(val, functions.get(val))
+            if target_label is None:
+                return f"  {name} 0x{val:08X}\n"
+            if isinstance(target_label, int):
+                return f"  {name} FUNCTION_{target_label}\n"
+            return f"  {name} {target_label}\n"
+        return fmt
+    
+    def fmt_call(entry):
+        name = entry.name
+        def fmt(addr, val):
+            func_id = functions.get(val)
+            if func_id is None:
+                return f"  {name} 0x{val:08X}\n"
+            return f"  {name} FUNCTION_{func_id}\n"
+        return fmt
+    
+    def fmt_float(entry):
+        name = entry.name
+        unpack_from = _F32.unpack_from
+        def fmt(addr, val):
+            float_val = unpack_from(data, addr + 1)[0]
+            if float_val != float_val:  # NaN: keep the exact bits
+                return f"  {name} 0x{val:08X}\n"
+            return f"  {name} {float_val}\n"
+        return fmt
+    
+    def fmt_int(entry):
+        name = entry.name
+        wide_name = f"{name}.{OPARG_SUFFIXES[entry.arg_type]}"
+        bits = entry.size * 8
+        sign, wrap = 1 << (bits - 1), 1 << bits
+        # Values a smaller encoding of the same mnemonic could hold
+        smaller = [other.size * 8 for other in HCB_VARIANTS[name] if other.size < entry.size]
+        limit = 1 << (max(smaller) - 1) if smaller else 0
+        pointer = entry.opcode in HCB_POINTER_OPCODES
+        def fmt(addr, val):
+            if pointer and val in functions:
+                return f"  {name} FUNCTION_{functions[val]}\n"
+            if val & sign:
+                val -= wrap
+            if -limit <= val < limit:
+                return f"  {wide_name} {val}\n"
+            return f"  {name} {val}\n"
+        return fmt
+    
+    def fmt_i8i8(entry):
+        name = entry.name
+        def fmt(addr, val):
+            val1 = (val & 0xFF) - 0x100 if val & 0x80 else val & 0xFF
+            val2 = (val >> 8) - 0x100 if val & 0x8000 else val >> 8
+            return f"  {name} {val1}, {val2}\n"
+        return fmt
+    
+    def fmt_string(entry):
+        name = entry.name
+        def fmt(addr, val):
+            nonlocal string_id
+            string = _hcb_read_string(data, addr, val)
+            if strings_out is not None:
+                strings_out.write(_hcb_strings_line(string_id, addr, string))
             
-        # Check for function start
-        if pos in functions:
-            if current_func >= 0:
-                lines.append("")  # Blank line between functions
-            current_func = functions[pos]
-            lines.append(f"# ===== FUNCTION {current_func} =====")
-        
-        # Check for label
-        if pos in labels:
-            lines.append(f"{labels[pos]}:")
-        
-        inst_addr = pos
-        opcode = data[pos]
-        
-        if opcode > HCB_LAST_OPCODE:
-            pos += 1
-            continue
-        
-        name, arg_type = get_opcode_info(opcode)
-        pos += 1
-        
-        # Decode arguments
-        if arg_type == OPARG_NULL:
-            lines.append(f"  {name}")
-        
-        elif arg_type == OPARG_X32:
-            if pos + 4 > len(data):
-                break
-            val = struct.unpack_from('<I', data, pos)[0]
-            pos += 4
-            if name in ("jmp", "jmpcond"):
-                target_label = labels.get(val, functions.get(val))
-                if target_label is not None:
-                    if isinstance(target_label, int):
-                        lines.append(f"  {name} FUNCTION_{target_label}")
-                    else:
-                        lines.append(f"  {name} {target_label}")
-                else:
-                    lines.append(f"  {name} 0x{val:08X}")
-            elif name == "call":
-                func_id = functions.get(val)
-                if func_id is not None:
-                    lines.append(f"  {name} FUNCTION_{func_id}")
-                else:
-                    lines.append(f"  {name} 0x{val:08X}")
-            elif name == "pushfloat":
-                float_val = struct.unpack('<f', struct.pack('<I', val))[0]
-                lines.append(f"  {name} {float_val}")
+            raw = data[addr + 2:addr + 2 + val]
+            if string.encode('cp932', errors='replace') + b'\x00' != raw:
+                line = f'  {name} x"{bytes(raw).hex().upper()}"  ; [STR_{string_id:04d}]\n'
             else:
-                lines.append(f"  {name} 0x{val:08X}")
+                # Escape special characters for text output
+                escaped = string.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+                line = f'  {name} "{escaped}"  ; [STR_{string_id:04d}]\n'
+            string_id += 1
+            return line
+        return fmt
+    
+    by_name = {"jmp": fmt_jump, "jmpcond": fmt_jump, "call": fmt_call, "pushfloat": fmt_float}
+    by_arg = {
+        OPARG_NULL: fmt_null,
+        OPARG_X32: fmt_hex,
+        OPARG_I32: fmt_int,
+        OPARG_I16: fmt_int,
+        OPARG_I8: fmt_int,
+        OPARG_I8I8: fmt_i8i8,
+        OPARG_STRING: fmt_string,
+    }
+    return [fmt_byte(opcode) if entry is None else by_name.get(entry.name, by_arg[entry.arg_type])(entry)
+            for opcode, entry in enumerate(HCB_DISPATCH)]
+
+
+def _hcb_listing(data, index: HcbIndex, functions: Dict[int, int], labels: Dict[int, str],
+                 strings_out=None, start: int = 0, stop: Optional[int] = None,
+                 first_string_id: int = 0) -> Iterator[str]:
+    """
+    Yields the disassembly listing one line at a time (newline included).
+    Each string is also written to strings_out as it is reached, if given.
+    start/stop restrict the listing to a range of instruction indices, whose
+    first string is numbered first_string_id.
+    """
+    formatters = _hcb_formatters(data, functions, labels, strings_out, first_string_id)
+    
+    # Function headers and labels, merged so each address needs one lookup
+    markers: Dict[int, str] = {}
+    for addr, func_num in functions.items():
+        blank = "\n" if func_num > 0 else ""  # Blank line between functions
+        markers[addr] = f"{blank}# ===== FUNCTION {func_num} =====\n"
+    for addr, label in labels.items():
+        markers[addr] = markers.get(addr, "") + f"{label}:\n"
+    get_marker = markers.get
+    
+    offsets, opcodes, values = index.offsets, index.opcodes, index.values
+    if start or stop is not None:
+        offsets, opcodes, values = offsets[start:stop], opcodes[start:stop], values[start:stop]
+    
+    for pos, opcode, val in zip(offsets, opcodes, values):
+        marker = get_marker(pos)
+        if marker is not None:
+            yield marker
         
-        elif arg_type == OPARG_I32:
-            if pos + 4 > len(data):
-                break
-            val = struct.unpack_from('<i', data, pos)[0]
-            pos += 4
-            lines.append(f"  {name} {val}")
+        yield formatters[opcode](pos, val)
+
+
+# Chunks per worker: small enough to balance uneven functions, large enough
+# that per-task overhead stays negligible
+HCB_CHUNKS_PER_JOB = 4
+
+_hcb_worker: Dict[str, object] = {}
+
+def _hcb_decode_worker_init(hcb_path: Path, use_mmap: bool, index: HcbIndex):
+    """Process pool initializer: opens the script once per worker."""
+    stack = ExitStack()
+    _hcb_worker['stack'] = stack  # Keeps the file/mapping open for the worker's lifetime
+    _hcb_worker['data'] = stack.enter_context(_open_hcb(hcb_path, use_mmap))
+    _hcb_worker['index'] = index
+    _hcb_worker['functions'] = index.functions()
+    _hcb_worker['labels'] = index.labels()
+
+
+def _hcb_decode_chunk(task: Tuple[int, int, int, bool]) -> Tuple[str, str]:
+    """Decodes instructions [start, stop) in a worker, returns (listing, strings)."""
+    start, stop, first_string_id, with_strings = task
+    strings_out = StringIO() if with_strings else None
+    listing = ''.join(_hcb_listing(
+        _hcb_worker['data'], _hcb_worker['index'], _hcb_worker['functions'],
+        _hcb_worker['labels'], strings_out, start, stop, first_string_id))
+    return listing, strings_out.getvalue() if with_strings else ''
+
+
+def _hcb_function_chunks(index: HcbIndex, chunk_count: int) -> List[Tuple[int, int, int]]:
+    """
+    Splits the instruction index into about chunk_count ranges of similar
+    size, cutting only at function starts. Returns (start, stop, first
+    string ID) per range, so every range numbers its strings globally.
+    """
+    offsets = index.offsets
+    func_starts = [bisect_left(offsets, addr) for addr in index.func_offsets]
+    target = max(1, len(offsets) // chunk_count)
+    
+    bounds = [0]
+    for i in func_starts:
+        if i - bounds[-1] >= target:
+            bounds.append(i)
+    bounds.append(len(offsets))
+    
+    return [(start, stop, bisect_left(index.str_offsets, offsets[start]))
+            for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+
+def _hcb_decode_parallel(hcb_path: Path, use_mmap: bool, index: HcbIndex, jobs: int,
+                         with_strings: bool) -> Iterator[Tuple[str, str]]:
+    """
+    Decodes function ranges in a process pool and yields (listing, strings)
+    per range in file order. At most two ranges per worker are in flight,
+    so finished text does not pile up while the caller writes it.
+    """
+    chunks = _hcb_function_chunks(index, jobs * HCB_CHUNKS_PER_JOB)
+    tasks = iter([(start, stop, first_id, with_strings) for start, stop, first_id in chunks])
+    
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_hcb_decode_worker_init,
+                             initargs=(hcb_path, use_mmap, index)) as pool:
+        pending = deque(pool.submit(_hcb_decode_chunk, task)
+                        for task in islice(tasks, jobs * 2))
+        while pending:
+            result = pending.popleft().result()
+            for task in islice(tasks, 1):
+                pending.append(pool.submit(_hcb_decode_chunk, task))
+            yield result
+
+
+def hcb_decode(hcb_path: str, output_path: str, strings_path: Optional[str] = None,
+               use_mmap: bool = False, use_cache: bool = True, jobs: int = 1):
+    """
+    Decompiles an HCB script file to readable text format.
+    Optionally extracts strings to a separate file for translation.
+    
+    The listing and strings file are written incrementally while the
+    script is decoded, so memory use does not grow with the output.
+    With jobs > 1 the code section is split at function starts and the
+    ranges are decoded in a process pool, then written in order.
+    
+    HCB format notes:
+    - First 4 bytes: entry point offset (also marks end of code section)
+    - Code section: bytes 4 to entry_point
+    - String format: 1 byte length + string data (NOT 2 bytes!)
+    """
+    hcb_path = Path(hcb_path)
+    output_path = Path(output_path)
+    strings_path = Path(strings_path) if strings_path else None
+    
+    with _open_hcb(hcb_path, use_mmap) as data:
+        index = hcb_load_index(hcb_path, data, use_cache)
+        entry_point = index.entry_point
         
-        elif arg_type == OPARG_I16:
-            if pos + 2 > len(data):
-                break
-            val = struct.unpack_from('<h', data, pos)[0]
-            pos += 2
-            lines.append(f"  {name} {val}")
+        print(f"HCB file: {hcb_path.name}")
+        print(f"  Size: {len(data)} bytes")
+        print(f"  Entry point: 0x{entry_point:08X}")
+        print(f"  Code section: 0x0004 - 0x{entry_point:08X}")
         
-        elif arg_type == OPARG_I8:
-            if pos >= len(data):
-                break
-            val = struct.unpack_from('<b', data, pos)[0]
-            pos += 1
-            lines.append(f"  {name} {val}")
+        functions = index.functions()
+        labels = index.labels()
         
-        elif arg_type == OPARG_I8I8:
-            if pos + 2 > len(data):
-                break
-            val1 = struct.unpack_from('<b', data, pos)[0]
-            val2 = struct.unpack_from('<b', data, pos + 1)[0]
-            pos += 2
-            lines.append(f"  {name} {val1}, {val2}")
+        print(f"  Functions: {len(functions)}")
+        print(f"  Labels: {len(labels)}")
         
-        elif arg_type == OPARG_STRING:
-            # String format: 1 byte length + string data
-            if pos >= len(data):
-                break
-            str_len = data[pos]
-            pos += 1
-            if pos + str_len > len(data):
-                break
-            try:
-                string = data[pos:pos + str_len].decode('cp932', errors='replace').rstrip('\x00')
-            except:
-                string = data[pos:pos + str_len].decode('utf-8', errors='replace').rstrip('\x00')
-            pos += str_len
+        # Write output
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with ExitStack() as stack:
+            out = stack.enter_context(
+                open(output_path, 'w', encoding='cp932', buffering=HCB_WRITE_BUFFER))
+            strings_out = None
+            if strings_path:
+                strings_out = stack.enter_context(
+                    open(strings_path, 'w', encoding='cp932', buffering=HCB_WRITE_BUFFER))
             
-            # Escape special characters for text output
-            escaped = string.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
-            lines.append(f'  {name} "{escaped}"  ; [STR_{string_id:04d}]')
-            strings_list.append((string_id, inst_addr, string))
-            string_id += 1
-    
-    # Add entry point info
-    lines.append("")
-    lines.append(f"# ENTRY_POINT: 0x{entry_point:08X}")
-    
-    # Write output
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_path, 'w', encoding='cp932') as f:
-        f.write('\n'.join(lines))
+            if jobs > 1 and len(functions) > 1:
+                for listing, strings in _hcb_decode_parallel(
+                        hcb_path, use_mmap, index, jobs, strings_out is not None):
+                    out.write(listing)
+                    if strings_out is not None:
+                        strings_out.write(strings)
+            else:
+                out.writelines(_hcb_listing(data, index, functions, labels, strings_out))
+            
+            # Add entry point info
+            out.write(f"\n# ENTRY_POINT: 0x{entry_point:08X}")
     
     print(f"  Output: {output_path}")
-    print(f"  Strings found: {len(strings_list)}")
-    
-    # Write strings file if requested
+    print(f"  Strings found: {len(index.str_offsets)}")
     if strings_path:
-        strings_path = Path(strings_path)
-        with open(strings_path, 'w', encoding='cp932') as f:
-            for sid, addr, text in strings_list:
-                # Format: ID|ADDRESS|TEXT (one per line)
-                escaped = text.replace('\\', '\\\\').replace('\n', '\\n').replace('\r', '\\r')
-                f.write(f"{sid:04d}|0x{addr:08X}|{escaped}\n")
         print(f"  Strings file: {strings_path}")
     
-    return len(functions), len(strings_list)
+    return len(functions), len(index.str_offsets)
 
 
 # =============================================================================
 # HCB Rebuilder - Compiles text back to HCB bytecode
 # =============================================================================
 
-def hcb_rebuild(original_hcb: str, strings_path: str, output_hcb: str):
-    """
-    Rebuilds an HCB file with replaced strings.
-    Reads original HCB, replaces strings from strings file, writes new HCB.
-    """
-    original_hcb = Path(original_hcb)
-    strings_path = Path(strings_path)
-    output_hcb = Path(output_hcb)
-    
-    # Read original HCB
-    with open(original_hcb, 'rb') as f:
-        data = bytearray(f.read())
-    
-    # Read replacement strings
+HCB_MAX_STRING = 255  # 1 byte length prefix, null terminator included
+
+_UNESCAPE_MAP = {'n': '\n', 'r': '\r', '\\': '\\'}
+_UNESCAPE_PATTERN = re.compile(r'\\([nr\\])')
+
+def _hcb_unescape(text: str) -> str:
+    """Reverses the escaping used in strings files (\\n, \\r, \\\\)."""
+    if '\\' not in text:
+        return text
+    return _UNESCAPE_PATTERN.sub(lambda m: _UNESCAPE_MAP[m.group(1)], text)
+
+
+def hcb_load_strings(strings_path: str) -> Dict[int, str]:
+    """Reads an ID|ADDRESS|TEXT strings file. Returns {addr: text}."""
     replacements: Dict[int, str] = {}  # addr -> new_string
     with open(strings_path, 'r', encoding='cp932') as f:
         for line_num, line in enumerate(f, 1):
@@ -348,12 +766,279 @@ def hcb_rebuild(original_hcb: str, strings_path: str, output_hcb: str):
             try:
                 sid = int(parts[0])
                 addr = int(parts[1], 16) if parts[1].startswith('0x') else int(parts[1])
-                text = parts[2]
-                # Unescape
-                text = text.replace('\\n', '\n').replace('\\r', '\r').replace('\\\\', '\\')
-                replacements[addr] = text
+                replacements[addr] = _hcb_unescape(parts[2])
             except ValueError as e:
                 print(f"  [WARN] Parse error line {line_num}: {e}")
+    return replacements
+
+
+def _hcb_encode_string(addr: int, text: str, old_str: bytes, fixed_size: bool) -> bytes:
+    """
+    Encodes a replacement string for the slot at addr (null terminator included).
+    In fixed-size mode the result is padded/truncated to the original length,
+    otherwise it is only cut down to the 255 byte limit of the length prefix.
+    """
+    old_str_len = len(old_str)
+    try:
+        # Strict Shift-JIS encoding - game engine only supports this
+        new_str = text.encode('cp932', errors='strict')
+    except UnicodeEncodeError as e:
+        print(f"  WARNING: String at 0x{addr:08X} contains characters not supported by Shift-JIS")
+        print(f"           Keeping original string. Problem char: {e.object[e.start:e.end]!r}")
+        return old_str
+    
+    # Ensure null terminator
+    if not new_str.endswith(b'\x00'):
+        new_str = new_str + b'\x00'
+    
+    if fixed_size:
+        # Keep same size to avoid address shifting
+        # Pad with spaces or truncate to match original length
+        if len(new_str) < old_str_len:
+            # Pad with spaces before null terminator
+            padding = old_str_len - len(new_str)
+            new_str = new_str[:-1] + (b' ' * padding) + b'\x00'
+        elif len(new_str) > old_str_len:
+            # Truncate (keep null at end)
+            new_str = new_str[:old_str_len - 1] + b'\x00'
+    elif len(new_str) > HCB_MAX_STRING:
+        # Cut on a character boundary (a split lead byte is dropped)
+        cut = new_str[:HCB_MAX_STRING - 1].decode('cp932', errors='ignore')
+        new_str = cut.encode('cp932') + b'\x00'
+        print(f"  [WARN] 0x{addr:08X}: String longer than {HCB_MAX_STRING} bytes, truncated")
+    
+    return new_str
+
+
+class HcbShiftTable:
+    """
+    Cumulative address shift caused by resized string slots.
+    
+    addrs holds the instruction address of each resized pushstring (ascending)
+    and totals the running size delta after it. Addresses are relocated in
+    ascending batches by walking both lists together, so the cost is linear
+    in the number of addresses plus shifts.
+    """
+    
+    def __init__(self):
+        self.addrs = array('I')
+        self.totals = array('q')
+    
+    def add(self, addr: int, delta: int):
+        total = self.totals[-1] if self.totals else 0
+        self.addrs.append(addr)
+        self.totals.append(total + delta)
+    
+    @property
+    def total(self) -> int:
+        return self.totals[-1] if self.totals else 0
+    
+    def relocate_sorted(self, addrs) -> array:
+        """Maps ascending old code addresses to their addresses in the rebuilt file."""
+        result = array('I')
+        shift_addrs, totals = self.addrs, self.totals
+        k, count, total = 0, len(shift_addrs), 0
+        for addr in addrs:
+            while k < count and shift_addrs[k] < addr:
+                total = totals[k]
+                k += 1
+            result.append(addr + total)
+        return result
+
+
+def _hcb_relocate(output_data: bytearray, data, index: HcbIndex,
+                  shifts: HcbShiftTable) -> Tuple[int, int]:
+    """
+    Patches every code address in output_data after strings were resized:
+    the header, call/jmp/jmpcond targets, pushint function pointers and the
+    script start address at the beginning of the data section.
+    Returns (relocated references, of which pushint function pointers).
+    """
+    pack_into = struct.pack_into
+    offsets, opcodes, values = index.offsets, index.opcodes, index.values
+    code_end = index.entry_point
+    
+    # Header: offset of the data section
+    new_code_end = code_end + shifts.total
+    pack_into('<I', output_data, 0, new_code_end)
+    
+    # Collect (instruction index, target) of every reference in code order:
+    # call/jmp/jmpcond targets, and pushint with a function address, which is
+    # a function pointer (ThreadStart etc.)
+    func_starts = set(index.func_offsets)
+    refs = [i for i in index.branch_indices if values[i] <= code_end]
+    branches = len(refs)
+    refs.extend(i for i, opcode in enumerate(opcodes)
+                if opcode in HCB_POINTER_OPCODES and values[i] in func_starts)
+    pointers = len(refs) - branches
+    refs.sort()
+    
+    # Data section starts with the address of the script's start function
+    start_addr = None
+    if code_end + 4 <= len(data):
+        start_addr = struct.unpack_from('<I', data, code_end)[0]
+        if start_addr not in func_starts:
+            start_addr = None
+    
+    # Instruction offsets are ascending, so their new addresses come from one
+    # merge with the shift table; targets are sorted once and merged the same way
+    sites = shifts.relocate_sorted(offsets[i] for i in refs)
+    targets = sorted({values[i] for i in refs} | ({start_addr} - {None}))
+    new_targets = dict(zip(targets, shifts.relocate_sorted(targets)))
+    
+    for i, site in zip(refs, sites):
+        pack_into('<I', output_data, site + 1, new_targets[values[i]])
+    if start_addr is not None:
+        pack_into('<I', output_data, new_code_end, new_targets[start_addr])
+    
+    return len(refs) + (start_addr is not None), pointers
+
+
+# Sidecar manifest for incremental rebuilds (<output.hcb>.manifest)
+HCB_MANIFEST_MAGIC = b'FVPM'
+HCB_MANIFEST_VERSION = 1
+_MANIFEST_HEADER = struct.Struct('<4sHBxQQQQI')  # magic, version, fixed_size, src/out size+mtime, count
+_NO_REPLACEMENT = bytes(8)  # digest slot of strings without a replacement line
+
+def _hcb_text_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+
+
+class HcbManifest:
+    """
+    Record of the strings applied to a rebuilt HCB, one entry per string slot:
+    original address, address in the output, slot length in the output and
+    a digest of the replacement text that was applied.
+    
+    The source and output file size/mtime are stored too, so the manifest is
+    only trusted while neither file was touched by anything else.
+    """
+    
+    def __init__(self, fixed_size: bool):
+        self.fixed_size = fixed_size
+        self.source_stat = (0, 0)
+        self.output_stat = (0, 0)
+        self.str_offsets = array('I')
+        self.str_lengths = array('B')  # original slot lengths
+        self.out_offsets = array('I')
+        self.out_lengths = array('B')
+        self.digests = bytearray()
+    
+    @staticmethod
+    def path_for(output_hcb: Path) -> Path:
+        return output_hcb.with_name(output_hcb.name + '.manifest')
+    
+    @staticmethod
+    def file_stat(path: Path) -> Tuple[int, int]:
+        st = path.stat()
+        return (st.st_size, st.st_mtime_ns)
+    
+    def save(self, path: Path):
+        with open(path, 'wb') as f:
+            f.write(_MANIFEST_HEADER.pack(
+                HCB_MANIFEST_MAGIC, HCB_MANIFEST_VERSION, int(self.fixed_size),
+                *self.source_stat, *self.output_stat, len(self.str_offsets)))
+            _write_arrays(f, (self.str_offsets, self.out_offsets, self.str_lengths, self.out_lengths))
+            f.write(self.digests)
+    
+    @classmethod
+    def load(cls, path: Path) -> Optional['HcbManifest']:
+        """Loads a manifest, or returns None if missing or unreadable."""
+        try:
+            raw = path.read_bytes()
+            magic, version, fixed_size, src_size, src_mtime, out_size, out_mtime, count = \
+                _MANIFEST_HEADER.unpack_from(raw, 0)
+        except (OSError, struct.error):
+            return None
+        if magic != HCB_MANIFEST_MAGIC or version != HCB_MANIFEST_VERSION:
+            return None
+        if len(raw) != _MANIFEST_HEADER.size + count * (4 + 4 + 1 + 1 + 8):
+            return None
+        
+        manifest = cls(bool(fixed_size))
+        manifest.source_stat = (src_size, src_mtime)
+        manifest.output_stat = (out_size, out_mtime)
+        pos = _read_arrays(raw, _MANIFEST_HEADER.size,
+                           (manifest.str_offsets, manifest.out_offsets,
+                            manifest.str_lengths, manifest.out_lengths), (count,) * 4)
+        manifest.digests = bytearray(raw[pos:])
+        return manifest
+
+
+def _hcb_rebuild_incremental(original_hcb: Path, replacements: Dict[int, str],
+                             output_hcb: Path, fixed_size: bool) -> bool:
+    """
+    Patches only the strings that changed since the last rebuild directly
+    into the existing output through mmap. Returns False when a full rebuild
+    is needed (no valid manifest, files changed, or a string changed size).
+    """
+    manifest_path = HcbManifest.path_for(output_hcb)
+    manifest = HcbManifest.load(manifest_path)
+    if manifest is None or manifest.fixed_size != fixed_size or not output_hcb.exists():
+        print("  [INFO] No usable manifest, doing a full rebuild")
+        return False
+    if (HcbManifest.file_stat(original_hcb) != manifest.source_stat or
+            HcbManifest.file_stat(output_hcb) != manifest.output_stat):
+        print("  [INFO] Original or output changed since last rebuild, doing a full rebuild")
+        return False
+    
+    # Find slots whose replacement text differs from what was applied
+    patches = []  # (manifest index, new bytes, digest)
+    digests = manifest.digests
+    with open(original_hcb, 'rb') as src:
+        for i, addr in enumerate(manifest.str_offsets):
+            text = replacements.get(addr)
+            digest = _NO_REPLACEMENT if text is None else _hcb_text_digest(text)
+            if digest == digests[i * 8:i * 8 + 8]:
+                continue
+            
+            src.seek(addr + 2)
+            old_str = src.read(manifest.str_lengths[i])
+            new_str = old_str if text is None else _hcb_encode_string(addr, text, old_str, fixed_size)
+            if len(new_str) != manifest.out_lengths[i]:
+                print(f"  [INFO] String at 0x{addr:08X} changed size, doing a full rebuild")
+                return False
+            patches.append((i, new_str, digest))
+    
+    if patches:
+        with open(output_hcb, 'r+b') as f, mmap.mmap(f.fileno(), 0) as mm:
+            for i, new_str, digest in patches:
+                start = manifest.out_offsets[i] + 2
+                mm[start:start + len(new_str)] = new_str
+                manifest.digests[i * 8:i * 8 + 8] = digest
+            mm.flush()
+        manifest.output_stat = HcbManifest.file_stat(output_hcb)
+        manifest.save(manifest_path)
+    
+    print(f"  Incremental: patched {len(patches)} strings in place")
+    print(f"  Output: {output_hcb}")
+    return True
+
+
+def hcb_rebuild(original_hcb: str, strings_path: str, output_hcb: str,
+                fixed_size: bool = False, incremental: bool = False, use_mmap: bool = False,
+                use_cache: bool = True):
+    """
+    Rebuilds an HCB file with replaced strings.
+    Reads original HCB, replaces strings from strings file, writes new HCB.
+    
+    Strings may grow or shrink: every code address is relocated through a
+    cumulative shift table. With fixed_size, strings are padded/truncated
+    to their original length instead and nothing moves.
+    
+    With incremental, a manifest is kept next to the output and later runs
+    only patch the strings that changed (see _hcb_rebuild_incremental).
+    Without fixed_size, any edit that changes a string's byte length still
+    needs a full rebuild, since everything after it moves.
+    With use_mmap, the original is read through a memory map. With
+    use_cache, its instruction index is reused from the .idx sidecar.
+    """
+    original_hcb = Path(original_hcb)
+    strings_path = Path(strings_path)
+    output_hcb = Path(output_hcb)
+    
+    # Read replacement strings
+    replacements = hcb_load_strings(strings_path)
     
     print(f"HCB rebuild: {original_hcb.name}")
     print(f"  Replacements: {len(replacements)}")
@@ -372,114 +1057,87 @@ def hcb_rebuild(original_hcb: str, strings_path: str, output_hcb: str):
     if encoding_warnings > 0:
         print(f"  [INFO] {encoding_warnings} strings have unsupported characters - will keep originals")
     
-    if not replacements:
-        # No replacements, just copy
-        output_hcb.parent.mkdir(parents=True, exist_ok=True)
-        with open(output_hcb, 'wb') as f:
-            f.write(data)
-        print(f"  [WARN] No replacements found, copied original")
+    if incremental and _hcb_rebuild_incremental(original_hcb, replacements, output_hcb, fixed_size):
         return
     
-    # Get entry point
-    entry_point = struct.unpack_from('<I', data, 0)[0]
-    code_end = entry_point
-    
-    # Build new code section with replaced strings (keeping same sizes)
-    new_code = bytearray()
-    
-    pos = 4
-    while pos < code_end:
-        old_addr = pos
-        
-        opcode = data[pos]
-        if opcode > HCB_LAST_OPCODE:
-            new_code.append(opcode)
-            pos += 1
-            continue
-        
-        name, arg_type = get_opcode_info(opcode)
-        new_code.append(opcode)
-        pos += 1
+    with _open_hcb(original_hcb, use_mmap) as data:
+        if use_mmap and output_hcb.exists() and output_hcb.samefile(original_hcb):
+            raise ValueError("Output must not overwrite the original HCB when using --mmap")
         
-        if arg_type == OPARG_NULL:
-            pass
-        
-        elif arg_type == OPARG_X32:
-            # Copy, will fix up later
-            new_code.extend(data[pos:pos + 4])
-            pos += 4
-        
-        elif arg_type == OPARG_I32:
-            new_code.extend(data[pos:pos + 4])
-            pos += 4
-        
-        elif arg_type == OPARG_I16:
-            new_code.extend(data[pos:pos + 2])
-            pos += 2
+        output_hcb.parent.mkdir(parents=True, exist_ok=True)
+        if not replacements and not incremental:
+            # No replacements, just copy
+            with open(output_hcb, 'wb') as f:
+                f.write(data)
+            print(f"  [WARN] No replacements found, copied original")
+            return
         
-        elif arg_type == OPARG_I8:
-            new_code.append(data[pos])
-            pos += 1
+        index = hcb_load_index(original_hcb, data, use_cache)
         
-        elif arg_type == OPARG_I8I8:
-            new_code.extend(data[pos:pos + 2])
-            pos += 2
+        # Build output with replaced strings. Bytes between string slots are
+        # copied as-is, so only the string slots are visited. The output is
+        # written as it is built and addresses are patched afterwards.
+        shifts = HcbShiftTable()
+        out_lengths = array('B', index.str_lengths)
+        copy_from = 0
+        changed = 0
         
-        elif arg_type == OPARG_STRING:
-            old_str_len = data[pos]  # 1 byte length
-            pos += 1
-            old_str = data[pos:pos + old_str_len]
-            pos += old_str_len
-            
-            # Check for replacement
-            if old_addr in replacements:
-                try:
-                    # Strict Shift-JIS encoding - game engine only supports this
-                    new_str = replacements[old_addr].encode('cp932', errors='strict')
-                except UnicodeEncodeError as e:
-                    print(f"  WARNING: String at 0x{old_addr:08X} contains characters not supported by Shift-JIS")
-                    print(f"           Keeping original string. Problem char: {e.object[e.start:e.end]!r}")
-                    new_str = bytes(old_str)
+        with open(output_hcb, 'wb') as out:
+            for slot, (old_addr, old_str_len) in enumerate(zip(index.str_offsets, index.str_lengths)):
+                if old_addr not in replacements:
+                    continue
                 
-                # Ensure null terminator
-                if not new_str.endswith(b'\x00'):
-                    new_str = new_str + b'\x00'
+                str_start = old_addr + 2
+                old_str = bytes(data[str_start:str_start + old_str_len])
+                new_str = _hcb_encode_string(old_addr, replacements[old_addr], old_str, fixed_size)
+                if new_str == old_str:
+                    continue
                 
-                # IMPORTANT: Keep same size to avoid address shifting
-                # Pad with spaces or truncate to match original length
-                if len(new_str) < old_str_len:
-                    # Pad with spaces before null terminator
-                    padding = old_str_len - len(new_str)
-                    new_str = new_str[:-1] + (b' ' * padding) + b'\x00'
-                elif len(new_str) > old_str_len:
-                    # Truncate (keep null at end)
-                    new_str = new_str[:old_str_len - 1] + b'\x00'
-            else:
-                new_str = bytes(old_str)
+                out.write(data[copy_from:old_addr + 1])  # Up to and incl. opcode
+                out.write(bytes((len(new_str),)))  # 1 byte length
+                out.write(new_str)
+                copy_from = str_start + old_str_len
+                changed += 1
+                out_lengths[slot] = len(new_str)
+                if len(new_str) != old_str_len:
+                    shifts.add(old_addr, len(new_str) - old_str_len)
             
-            new_code.append(len(new_str))  # 1 byte length (same as original)
-            new_code.extend(new_str)
-    
-    # Since we keep string sizes fixed, entry point stays the same
-    # and no address fix-up is needed
-    
-    # Build final output - just replace code section, keep rest intact
-    output_data = bytearray()
-    output_data.extend(struct.pack('<I', entry_point))  # Same entry point
-    output_data.extend(new_code)
-    output_data.extend(data[entry_point:])  # Copy data section unchanged
+            # Rest of the file (data section) is copied unchanged
+            out.write(data[copy_from:])
+        
+        if shifts.addrs:
+            with open(output_hcb, 'r+b') as f, mmap.mmap(f.fileno(), 0) as mm:
+                relocated, pointers = _hcb_relocate(mm, data, index, shifts)
+            print(f"  Resized strings: {len(shifts.addrs)} ({shifts.total:+d} bytes)")
+            print(f"  Relocated references: {relocated}")
+            if pointers:
+                # Any pushint equal to a function start, see HCB_POINTER_OPCODES
+                print(f"  Relocated pushint function pointers: {pointers} "
+                      f"(integer constants equal to a function address included)")
+        
+        original_size = len(data)
     
-    # Write output
-    output_hcb.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_hcb, 'wb') as f:
-        f.write(output_data)
+    if incremental:
+        manifest = HcbManifest(fixed_size)
+        manifest.source_stat = HcbManifest.file_stat(original_hcb)
+        manifest.output_stat = HcbManifest.file_stat(output_hcb)
+        manifest.str_offsets = index.str_offsets
+        manifest.str_lengths = index.str_lengths
+        manifest.out_offsets = shifts.relocate_sorted(index.str_offsets)
+        manifest.out_lengths = out_lengths
+        for addr in index.str_offsets:
+            text = replacements.get(addr)
+            manifest.digests += _NO_REPLACEMENT if text is None else _hcb_text_digest(text)
+        manifest.save(HcbManifest.path_for(output_hcb))
     
-    print(f"  Original size: {len(data)} bytes")
-    print(f"  New size: {len(output_data)} bytes")
+    print(f"  Changed strings: {changed}")
+    print(f"  Original size: {original_size} bytes")
+    print(f"  New size: {original_size + shifts.total} bytes")
     print(f"  Output: {output_hcb}")
 
 
-def hcb_extract_strings(hcb_path: str, output_path: str):
+def hcb_extract_strings(hcb_path: str, output_path: str, use_mmap: bool = False,
+                        use_cache: bool = True):
     """
     Extracts only the strings from an HCB file for translation.
     Simpler alternative to full decompilation when you only need strings.
@@ -487,61 +1145,19 @@ def hcb_extract_strings(hcb_path: str, output_path: str):
     hcb_path = Path(hcb_path)
     output_path = Path(output_path)
     
-    with open(hcb_path, 'rb') as f:
-        data = f.read()
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with _open_hcb(hcb_path, use_mmap) as data:
+        index = hcb_load_index(hcb_path, data, use_cache)
+        
+        # Write strings file
+        with open(output_path, 'w', encoding='cp932', buffering=HCB_WRITE_BUFFER) as f:
+            f.writelines(_hcb_strings_line(sid, addr, text)
+                         for sid, addr, text in _hcb_iter_strings(data, index))
     
-    entry_point = struct.unpack_from('<I', data, 0)[0]
-    code_end = entry_point
+    print(f"Extracted {len(index.str_offsets)} strings from {hcb_path.name}")
+    print(f"  Output: {output_path}")
     
-    strings_list = []
-    string_id = 0
-    pos = 4
-    
-    while pos < code_end:
-        opcode = data[pos]
-        if opcode > HCB_LAST_OPCODE:
-            pos += 1
-            continue
-        
-        name, arg_type = get_opcode_info(opcode)
-        inst_addr = pos
-        pos += 1
-        
-        if arg_type == OPARG_NULL:
-            pass
-        elif arg_type == OPARG_X32:
-            pos += 4
-        elif arg_type == OPARG_I32:
-            pos += 4
-        elif arg_type == OPARG_I16:
-            pos += 2
-        elif arg_type == OPARG_I8:
-            pos += 1
-        elif arg_type == OPARG_I8I8:
-            pos += 2
-        elif arg_type == OPARG_STRING:
-            str_len = data[pos]  # 1 byte length
-            pos += 1
-            try:
-                string = data[pos:pos + str_len].decode('cp932', errors='replace').rstrip('\x00')
-            except:
-                string = data[pos:pos + str_len].decode('utf-8', errors='replace').rstrip('\x00')
-            pos += str_len
-            
-            strings_list.append((string_id, inst_addr, string))
-            string_id += 1
-    
-    # Write strings file
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_path, 'w', encoding='cp932') as f:
-        for sid, addr, text in strings_list:
-            escaped = text.replace('\\', '\\\\').replace('\n', '\\n').replace('\r', '\\r')
-            f.write(f"{sid:04d}|0x{addr:08X}|{escaped}\n")
-    
-    print(f"Extracted {len(strings_list)} strings from {hcb_path.name}")
-    print(f"  Output: {output_path}")
-    
-    return len(strings_list)
+    return len(index.str_offsets)
 
 
 def hcb_split_strings(strings_path: str):
@@ -668,6 +1284,226 @@ def hcb_merge_strings(build_script_path: str, output_path: str):
     return len(all_strings)
 
 
+# =============================================================================
+# HCB Assembler - Compiles a hcb-decode listing back to bytecode
+# =============================================================================
+
+_FUNCTION_HEADER = re.compile(r'#\s*=+\s*FUNCTION\s+(\d+)\s*=+')
+_SYMBOL_PATTERN = re.compile(r'[A-Za-z_]\w*')
+_UNRESOLVED_LABEL = re.compile(r'label_([0-9A-Fa-f]{8})')
+_STRING_OPERAND = re.compile(r'(x?)"((?:[^"\\]|\\.)*)"')
+_STRING_ESCAPES = {'n': '\n', 'r': '\r', '\\': '\\', '"': '"'}
+_STRING_ESCAPE_PATTERN = re.compile(r'\\(.)')
+
+# Mnemonic -> candidate encodings, smallest first ("pushint.i16" selects one)
+_HCB_MNEMONICS: Dict[str, List[HcbOpcode]] = {}
+for _name, _variants in HCB_VARIANTS.items():
+    _HCB_MNEMONICS[_name] = sorted(_variants, key=lambda entry: entry.size)
+    for _entry in _variants:
+        _HCB_MNEMONICS[f"{_name}.{OPARG_SUFFIXES[_entry.arg_type]}"] = [_entry]
+
+
+def _hcb_parse_int(text: str, bits: int, lineno: int) -> int:
+    """Parses a signed or unsigned integer literal and returns its raw bits."""
+    try:
+        value = int(text, 0)
+    except ValueError:
+        raise ValueError(f"Line {lineno}: invalid integer '{text}'")
+    if not -(1 << (bits - 1)) <= value < (1 << bits):
+        raise ValueError(f"Line {lineno}: {value} does not fit in {bits} bits")
+    return value & ((1 << bits) - 1)
+
+
+def _hcb_parse_string(operand: str, lineno: int) -> bytes:
+    """Parses "text" or x"hex" and returns the string bytes incl. null terminator."""
+    if operand[:1] == '"' and '\\' not in operand:
+        # Common case, nothing escaped: the next quote closes the string
+        end = operand.find('"', 1)
+        if end < 0:
+            raise ValueError(f"Line {lineno}: unterminated string")
+        hex_form, text = False, operand[1:end]
+    else:
+        match = _STRING_OPERAND.match(operand)
+        if match is None:
+            raise ValueError(f"Line {lineno}: expected a quoted string")
+        hex_form, text = match.groups()
+    if hex_form:
+        raw = bytes.fromhex(text)
+    else:
+        if '\\' in text:
+            text = _STRING_ESCAPE_PATTERN.sub(
+                lambda m: _STRING_ESCAPES.get(m.group(1), m.group(0)), text)
+        try:
+            raw = text.encode('cp932') + b'\x00'
+        except UnicodeEncodeError as e:
+            raise ValueError(f"Line {lineno}: string cannot be encoded in CP932 ({e.reason})")
+    if len(raw) > HCB_MAX_STRING:
+        raise ValueError(f"Line {lineno}: string is {len(raw)} bytes (max {HCB_MAX_STRING})")
+    return raw
+
+
+def _hcb_parse_instruction(line: str, lineno: int) -> Tuple[bytes, Optional[str]]:
+    """
+    Parses one instruction line into (encoded bytes, symbol).
+    If the operand is a symbol its 4 bytes are left zeroed and the symbol
+    name is returned so the second pass can patch it in.
+    """
+    mnemonic, _, operand = line.partition(' ')
+    operand = operand.strip()
+    
+    if mnemonic == '.byte':
+        operand = operand.split(';', 1)[0]
+        return bytes(_hcb_parse_int(part.strip(), 8, lineno) for part in operand.split(',')), None
+    
+    variants = _HCB_MNEMONICS.get(mnemonic)
+    if variants is None:
+        raise ValueError(f"Line {lineno}: unknown instruction '{mnemonic}'")
+    entry = variants[-1]
+    if entry.arg_type == OPARG_STRING:
+        raw = _hcb_parse_string(operand, lineno)
+        return bytes((entry.opcode, len(raw))) + raw, None
+    
+    operand = operand.split(';', 1)[0].strip()
+    if entry.arg_type == OPARG_NULL:
+        if operand:
+            raise ValueError(f"Line {lineno}: {mnemonic} takes no operand")
+        return bytes((entry.opcode,)), None
+    if not operand:
+        raise ValueError(f"Line {lineno}: {mnemonic} needs an operand")
+    
+    if entry.arg_type == OPARG_I8I8:
+        parts = operand.split(',')
+        if len(parts) != 2:
+            raise ValueError(f"Line {lineno}: {mnemonic} takes two operands")
+        low, high = (_hcb_parse_int(part.strip(), 8, lineno) for part in parts)
+        return bytes((entry.opcode, low, high)), None
+    
+    if _SYMBOL_PATTERN.fullmatch(operand) and operand not in ('inf', 'nan'):
+        # Symbols are addresses, always encoded with the widest variant
+        if entry.size != 4:
+            raise ValueError(f"Line {lineno}: {mnemonic} cannot take a symbol")
+        return bytes((entry.opcode, 0, 0, 0, 0)), operand
+    
+    if entry.name == "pushfloat" and not operand.lower().startswith('0x'):
+        try:
+            return bytes((entry.opcode,)) + _F32.pack(float(operand)), None
+        except (ValueError, OverflowError):
+            raise ValueError(f"Line {lineno}: invalid float '{operand}'")
+    
+    value = _hcb_parse_int(operand, entry.size * 8, lineno)
+    if len(variants) > 1:
+        # Smallest encoding the value fits in (signed), like the original compiler
+        signed = value - (1 << entry.size * 8) if value >> (entry.size * 8 - 1) else value
+        for variant in variants:
+            bits = variant.size * 8
+            if -(1 << (bits - 1)) <= signed < (1 << (bits - 1)):
+                entry, value = variant, signed & ((1 << bits) - 1)
+                break
+    return bytes((entry.opcode,)) + entry.operand.pack(value), None
+
+
+def hcb_assemble(listing_path: str, base_hcb: str, output_hcb: str, use_cache: bool = True):
+    """
+    Assembles a listing written by hcb-decode back into an HCB script.
+    
+    Pass 1 encodes every line, records FUNCTION_n and label definitions in
+    a dict and leaves a fixup for each symbolic operand; pass 2 patches the
+    fixups with one lookup each. Repeated lines (ret, add, syscall 53...)
+    are parsed once and reused. The data section is taken from base_hcb,
+    with its start function address moved to the new FUNCTION_n location.
+    
+    An unmodified listing assembles to a byte-identical file. Branch targets
+    that never got a label line (mid-instruction targets) keep their raw
+    address and are reported.
+    """
+    listing_path = Path(listing_path)
+    base_hcb = Path(base_hcb)
+    output_hcb = Path(output_hcb)
+    
+    # Pass 1: encode, collect symbols and fixups
+    code = bytearray(4)  # Entry point, patched below
+    symbols: Dict[str, int] = {}
+    fixups = []  # (operand position, symbol, lineno)
+    parsed: Dict[str, Tuple[bytes, Optional[str]]] = {}
+    instruction_count = 0
+    function_count = 0
+    
+    def define(name: str, lineno: int):
+        if name in symbols:
+            raise ValueError(f"Line {lineno}: {name} is defined twice")
+        symbols[name] = len(code)
+    
+    with open(listing_path, 'r', encoding='cp932') as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line[0] == '#':
+                match = _FUNCTION_HEADER.match(line)
+                if match:
+                    define(f"FUNCTION_{int(match.group(1))}", lineno)
+                    function_count += 1
+                continue
+            if line[-1] == ':' and _SYMBOL_PATTERN.fullmatch(line, 0, len(line) - 1):
+                define(line[:-1], lineno)
+                continue
+            
+            instruction = parsed.get(line)
+            if instruction is None:
+                instruction = parsed[line] = _hcb_parse_instruction(line, lineno)
+            encoded, symbol = instruction
+            if symbol is not None:
+                fixups.append((len(code) + 1, symbol, lineno))
+            code += encoded
+            instruction_count += 1
+    code_end = len(code)
+    _U32.pack_into(code, 0, code_end)
+    
+    # Pass 2: resolve symbolic operands
+    unresolved = 0
+    for pos, symbol, lineno in fixups:
+        target = symbols.get(symbol)
+        if target is None:
+            match = _UNRESOLVED_LABEL.fullmatch(symbol)
+            if match is None:
+                raise ValueError(f"Line {lineno}: undefined symbol '{symbol}'")
+            target = int(match.group(1), 16)
+            unresolved += 1
+        _U32.pack_into(code, pos, target)
+    
+    # Data section from the base script
+    with _open_hcb(base_hcb) as base:
+        base_index = hcb_load_index(base_hcb, base, use_cache)
+        data_section = bytearray(base[base_index.entry_point:])
+        base_size = len(base)
+        start_func = None
+        if len(data_section) >= 4:
+            start_func = base_index.functions().get(_U32.unpack_from(data_section, 0)[0])
+    
+    if start_func is not None:
+        start_addr = symbols.get(f"FUNCTION_{start_func}")
+        if start_addr is None:
+            raise ValueError(f"Start function FUNCTION_{start_func} is not defined in the listing")
+        _U32.pack_into(data_section, 0, start_addr)
+    
+    output_hcb.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_hcb, 'wb') as f:
+        f.write(code)
+        f.write(data_section)
+    
+    print(f"Assembled {listing_path.name}")
+    print(f"  Instructions: {instruction_count}")
+    print(f"  Functions: {function_count}")
+    print(f"  Labels: {len(symbols) - function_count}")
+    if unresolved:
+        print(f"  [WARN] {unresolved} branches to undefined labels kept their raw address")
+    print(f"  Code section: 0x0004 - 0x{code_end:08X} (base: 0x{base_index.entry_point:08X})")
+    print(f"  Size: {len(code) + len(data_section)} bytes (base: {base_size} bytes)")
+    print(f"  Output: {output_hcb}")
+    
+    return instruction_count
+
+
 # =============================================================================
 # Format detection by magic bytes
 # =============================================================================
@@ -692,290 +1528,1695 @@ def detect_extension(data: bytes) -> str:
 # BIN Tool - Extractor/Packer for .bin archives
 # =============================================================================
 
-def bin_extract(bin_path: str, output_folder: str, auto_ext: bool = True):
-    """Extracts files from a .bin archive"""
+_BIN_HEADER = struct.Struct('<II')   # file count, name block size
+_BIN_ENTRY = struct.Struct('<III')   # name offset, data offset, data size
+
+def _bin_split_entries(table, names) -> List[Tuple[str, int, int]]:
+    """
+    Splits a raw entry table and name block into (name, offset, size) tuples.
+    Names are Shift_JIS, null-terminated, addressed by offset into the block.
+    """
+    names = bytes(names)
+    find = names.find
+    entries = []
+    for name_offset, offset, size in _BIN_ENTRY.iter_unpack(table):
+        end = find(b'\x00', name_offset)
+        if end < 0:
+            end = len(names)
+        entries.append((names[name_offset:end].decode('shift_jis', errors='replace'), offset, size))
+    return entries
+
+
+BIN_COPY_CHUNK = 1 << 20  # Bytes per write when streaming an entry to a file
+BIN_STAT_WORKERS = 16     # Threads for stat() calls while laying out an archive
+
+# errno values meaning "not supported for these files", not a real I/O error
+_COPY_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                         errno.ENOTSUP, errno.EBADF, errno.EPERM}
+_kernel_copy_calls = {
+    'copy_file_range': hasattr(os, 'copy_file_range'),
+    'sendfile': hasattr(os, 'sendfile') and sys.platform.startswith('linux'),
+}
+
+def _kernel_copy(src_fd: int, dst_fd: int, offset: int, size: int) -> int:
+    """
+    Copies size bytes of src_fd at offset to dst_fd's current position
+    without passing them through Python (copy_file_range, then sendfile).
+    Returns the bytes copied; the caller writes the rest itself when the
+    platform or filesystem supports neither call.
+    Never moves src_fd's position, so one source fd can serve many threads.
+    """
+    copied = 0
+    if _kernel_copy_calls['copy_file_range']:
+        try:
+            while copied < size:
+                n = os.copy_file_range(src_fd, dst_fd, size - copied, offset + copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+            if copied == 0:
+                _kernel_copy_calls['copy_file_range'] = False
+    
+    if copied < size and _kernel_copy_calls['sendfile']:
+        try:
+            while copied < size:
+                n = os.sendfile(dst_fd, src_fd, offset + copied, size - copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+            if copied == 0:
+                _kernel_copy_calls['sendfile'] = False
+    return copied
+
+
+class BinEntry(NamedTuple):
+    """One file of a .bin archive."""
+    index: int
+    name: str
+    offset: int
+    size: int
+
+
+class BinArchive:
+    """
+    Random access to a .bin archive through a read-only memory map.
+    
+    Opening only parses the entry table and name block; entry data is
+    never read until asked for, and read() returns a zero-copy memoryview
+    of the mapped bytes. Views must not outlive the archive.
+    
+        with BinArchive("graph_bg.bin") as archive:
+            entry = archive["bg001"]          # or archive[12]
+            data = archive.read(entry)        # memoryview
+            archive.extract(entry, "bg001")   # stream to a file
+    """
+    
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        try:
+            file_size = os.fstat(self._file.fileno()).st_size
+            if file_size < _BIN_HEADER.size:
+                raise ValueError("File too small to be a BIN archive")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)
+            
+            file_count, file_names_size = _BIN_HEADER.unpack_from(self._view, 0)
+            table_end = _BIN_HEADER.size + file_count * _BIN_ENTRY.size
+            if table_end > file_size:
+                raise ValueError(f"Truncated file table ({file_count} entries expected)")
+            self.file_size = file_size
+            self.header_size = min(table_end + file_names_size, file_size)  # Header, table and names
+            raw = _bin_split_entries(self._view[_BIN_HEADER.size:table_end],
+                                     self._view[table_end:table_end + file_names_size])
+        except Exception:
+            self.close()
+            raise
+        
+        self.entries = [BinEntry(i, name, offset, size) for i, (name, offset, size) in enumerate(raw)]
+        self._by_name: Dict[str, BinEntry] = {}
+        for entry in self.entries:
+            self._by_name.setdefault(entry.name, entry)  # First one wins on duplicates
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def close(self):
+        view = getattr(self, '_view', None)
+        if view is not None:
+            view.release()
+            self._view = None
+        mm = getattr(self, '_mmap', None)
+        if mm is not None:
+            try:
+                mm.close()
+            except BufferError:
+                pass  # An entry view is still alive, closed on collection
+            self._mmap = None
+        self._file.close()
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def __iter__(self) -> Iterator[BinEntry]:
+        return iter(self.entries)
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+    
+    def fileno(self) -> int:
+        return self._file.fileno()
+    
+    def __getitem__(self, key) -> BinEntry:
+        """Returns an entry by index (int) or by name (str)."""
+        if isinstance(key, BinEntry):
+            return key
+        if isinstance(key, int):
+            return self.entries[key]
+        entry = self._by_name.get(key)
+        if entry is None:
+            raise KeyError(f"No entry named '{key}' in {self.path.name}")
+        return entry
+    
+    def read(self, key) -> memoryview:
+        """Returns the entry's bytes as a memoryview of the mapped archive."""
+        entry = self[key]
+        end = entry.offset + entry.size
+        if end > len(self._view):
+            raise ValueError(f"Entry '{entry.name}' ends past the end of {self.path.name}")
+        return self._view[entry.offset:end]
+    
+    def read_header(self) -> bytearray:
+        """Returns a copy of the header, entry table and name block."""
+        return bytearray(self._view[:self.header_size])
+    
+    def copy_range(self, out, offset: int, size: int):
+        """
+        Appends size raw bytes at offset of the archive to the unbuffered
+        file out, inside the kernel where possible. Unlike extract() the
+        range may span several entries.
+        """
+        if offset + size > self.file_size:
+            raise ValueError(f"Range {offset}+{size} ends past the end of {self.path.name}")
+        _copy_range(self._file, out, offset, size)
+    
+    def extract(self, key, output_path: str) -> int:
+        """
+        Copies an entry to a file, inside the kernel where possible, else in
+        BIN_COPY_CHUNK writes from the mapping. Returns its size.
+        Safe to call from several threads at once.
+        """
+        entry = self[key]
+        data = self.read(entry)
+        size = len(data)
+        with data, open(output_path, 'wb', buffering=0) as out:
+            pos = _kernel_copy(self.fileno(), out.fileno(), entry.offset, size)
+            while pos < size:
+                pos += out.write(data[pos:pos + BIN_COPY_CHUNK])
+        return size
+
+
+def bin_extract(bin_path: str, output_folder: str, auto_ext: bool = True,
+                jobs: int = 1, quiet: bool = False):
+    """
+    Extracts files from a .bin archive.
+    With jobs > 1 entries are copied by a thread pool; each copy runs in
+    the kernel (copy_file_range/sendfile) where available, so entry data
+    does not pass through Python. quiet replaces the per-file lines with
+    a progress counter.
+    """
     bin_path = Path(bin_path)
     output_folder = Path(output_folder)
     output_folder.mkdir(parents=True, exist_ok=True)
 
-    with open(bin_path, 'rb') as f:
-        file_count = struct.unpack('<I', f.read(4))[0]
-        file_names_size = struct.unpack('<I', f.read(4))[0]
+    with BinArchive(bin_path) as archive:
+        file_count = len(archive)
         
-        table_size = file_count * 12
-        file_names_start = 8 + table_size
-
-        # Read file table
-        entries = []
-        for i in range(file_count):
-            name_offset, offset, size = struct.unpack('<III', f.read(12))
-            entries.append((name_offset, offset, size))
-
-        # Extract files
-        for i, (name_offset, offset, size) in enumerate(entries):
-            # Read filename (Shift_JIS, null-terminated)
-            f.seek(file_names_start + name_offset)
-            name_bytes = b''
-            while True:
-                b = f.read(1)
-                if b == b'\x00' or not b:
-                    break
-                name_bytes += b
+        def extract_one(entry: BinEntry) -> str:
+            output_name = f"{entry.index:04d}_{entry.name}"
             
-            name = name_bytes.decode('shift_jis', errors='replace')
-            output_name = f"{i:04d}_{name}"
-
-            # Read content
-            f.seek(offset)
-            content = f.read(size)
-
             # Auto-detect extension
             if auto_ext:
-                ext = detect_extension(content)
-                output_name += ext
-
-            # Save file
-            output_path = output_folder / output_name
-            output_path.write_bytes(content)
-            print(f"-> {output_path.name}")
+                with archive.read(entry) as data:
+                    output_name += detect_extension(bytes(data[:16]))
+            
+            archive.extract(entry, output_folder / output_name)
+            return output_name
+        
+        def report(names):
+            step = max(1, file_count // 100)
+            for done, output_name in enumerate(names, 1):
+                if not quiet:
+                    print(f"-> {output_name}")
+                elif done % step == 0 or done == file_count:
+                    print(f"\r  Extracted {done}/{file_count} files", end='', flush=True)
+        
+        if jobs > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                # map() keeps archive order, so the log is the same for any job count
+                report(pool.map(extract_one, archive))
+        else:
+            report(map(extract_one, archive))
+        if quiet:
+            print()
 
     print(f"\n[OK] Extraction complete: {file_count} files")
 
 
-def bin_pack(input_folder: str, bin_path: str):
-    """Packs files from a folder into a .bin archive"""
+def bin_list(bin_path: str):
+    """Lists the entries of a .bin archive without extracting anything."""
+    with BinArchive(bin_path) as archive:
+        for entry in archive:
+            print(f"{entry.index:04d}  {entry.size:>10}  {entry.name}")
+        print(f"\n{len(archive)} files")
+
+
+def bin_get(bin_path: str, key: str, output_path: str):
+    """Extracts one entry, given by name or index, from a .bin archive."""
+    with BinArchive(bin_path) as archive:
+        if key not in archive:
+            if not key.isdigit() or int(key) >= len(archive):
+                raise ValueError(f"No entry '{key}' in {archive.path.name}")
+            key = int(key)
+        entry = archive[key]
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        size = archive.extract(entry, output_path)
+    print(f"[OK] {entry.index:04d}_{entry.name} -> {output_path} ({size} bytes)")
+
+
+def _bin_entry_name(filename: str) -> bytes:
+    """Archive name of an extracted file: "0000_" prefix removed, Shift_JIS, null-terminated."""
+    if filename[4:5] == '_' and filename[:4].isdigit():
+        filename = filename[5:]
+    return filename.encode('shift_jis', errors='replace') + b'\x00'
+
+
+def _bin_layout(names: List[bytes], sizes: List[int],
+                duplicate_of: Optional[List[Optional[int]]] = None) -> Tuple[bytes, List[int]]:
+    """
+    Computes the whole archive layout before any data is written.
+    Returns the header, entry table and name block as one bytes object,
+    and the data offset of each entry (stored back to back, in order).
+    Entries with a duplicate_of index share that entry's data instead.
+    """
+    file_count = len(names)
+    names_size = sum(len(n) for n in names)
+    data_offset = _BIN_HEADER.size + file_count * _BIN_ENTRY.size + names_size
+    
+    table = bytearray(_BIN_HEADER.pack(file_count, names_size))
+    offsets = []
+    name_offset = 0
+    for i, (name, size) in enumerate(zip(names, sizes)):
+        original = duplicate_of[i] if duplicate_of else None
+        if original is not None:
+            table += _BIN_ENTRY.pack(name_offset, offsets[original], size)
+            offsets.append(offsets[original])
+        else:
+            table += _BIN_ENTRY.pack(name_offset, data_offset, size)
+            offsets.append(data_offset)
+            data_offset += size
+        name_offset += len(name)
+    table += b''.join(names)
+    return bytes(table), offsets
+
+
+def _write_all(out, data):
+    """Writes data to an unbuffered file, retrying short writes."""
+    with memoryview(data) as view:
+        pos = 0
+        while pos < len(view):
+            pos += out.write(view[pos:])
+
+
+def _copy_range(src, out, offset: int, size: int):
+    """
+    Appends size bytes of src (an open file) at offset to the unbuffered
+    file out: inside the kernel where possible, else in BIN_COPY_CHUNK reads.
+    """
+    copied = _kernel_copy(src.fileno(), out.fileno(), offset, size)
+    if copied < size:
+        src.seek(offset + copied)
+        while copied < size:
+            chunk = src.read(min(BIN_COPY_CHUNK, size - copied))
+            if not chunk:
+                raise ValueError(f"{Path(src.name).name} is shorter than expected")
+            _write_all(out, chunk)
+            copied += len(chunk)
+
+
+def _stat_sizes(entries: List[os.DirEntry]) -> List[int]:
+    """
+    Sizes of the given directory entries. The stat calls run in up to
+    BIN_STAT_WORKERS threads, one contiguous slice each, which hides the
+    latency of cold disks and network shares.
+    """
+    per_worker = -(-len(entries) // BIN_STAT_WORKERS)
+    if per_worker < 64:
+        return [e.stat().st_size for e in entries]
+    slices = [entries[i:i + per_worker] for i in range(0, len(entries), per_worker)]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=len(slices)) as pool:
+        return [size for sizes in pool.map(lambda part: [e.stat().st_size for e in part], slices)
+                for size in sizes]
+
+
+def _file_digest(path: str) -> bytes:
+    """blake2b digest of a file's contents, read in BIN_COPY_CHUNK pieces."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(BIN_COPY_CHUNK), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _find_duplicates(paths: List[str], sizes: List[int]) -> List[Optional[int]]:
+    """
+    For each file, the index of the first earlier file with identical
+    contents, else None. Only files sharing a (non-zero) size with another
+    file are hashed, in a thread pool.
+    """
+    by_size: Dict[int, List[int]] = {}
+    for i, size in enumerate(sizes):
+        if size:
+            by_size.setdefault(size, []).append(i)
+    candidates = [i for group in by_size.values() if len(group) > 1 for i in group]
+    
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=BIN_STAT_WORKERS) as pool:
+        digests = dict(zip(candidates, pool.map(_file_digest, [paths[i] for i in candidates])))
+    
+    duplicate_of: List[Optional[int]] = [None] * len(paths)
+    first: Dict[Tuple[int, bytes], int] = {}
+    for i in sorted(candidates):
+        key = (sizes[i], digests[i])
+        if key in first:
+            duplicate_of[i] = first[key]
+        else:
+            first[key] = i
+    return duplicate_of
+
+
+def bin_pack(input_folder: str, bin_path: str, quiet: bool = False, dedup: bool = False):
+    """
+    Packs files from a folder into a .bin archive.
+    
+    The layout is computed from file sizes (stat calls run in a thread
+    pool), so the header, table and names are written first and every
+    file is then streamed into place with kernel-side copies. Memory use
+    does not depend on the size of the inputs.
+    
+    With dedup, files with identical contents are stored once and their
+    table entries point to the same data.
+    """
     input_folder = Path(input_folder)
     bin_path = Path(bin_path)
 
-    # Get sorted files
-    files = sorted([f for f in input_folder.iterdir() if f.is_file()])
+    # Get sorted files (same order as sorting Path objects)
+    with os.scandir(input_folder) as it:
+        files = sorted((e for e in it if e.is_file()), key=lambda e: os.path.normcase(e.name))
     if not files:
         print("Error: Empty folder")
         return
 
-    # Prepare names (remove numeric prefix, encode as Shift_JIS)
-    names = []
-    for f in files:
-        # Remove "0000_" prefix
-        clean_name = f.name
-        if clean_name[4:5] == '_' and clean_name[:4].isdigit():
-            clean_name = clean_name[5:]
-        names.append(clean_name.encode('shift_jis', errors='replace') + b'\x00')
-
-    file_count = len(files)
-    table_size = file_count * 12
-    names_size = sum(len(n) for n in names)
-    file_names_start = 8 + table_size
-
-    with open(bin_path, 'wb') as out:
-        # Header
-        out.write(struct.pack('<I', file_count))
-        out.write(struct.pack('<I', names_size))
+    names = [_bin_entry_name(f.name) for f in files]
+    sizes = _stat_sizes(files)
+    duplicate_of = _find_duplicates([f.path for f in files], sizes) if dedup else None
+    header, offsets = _bin_layout(names, sizes, duplicate_of)
+    
+    with open(bin_path, 'wb', buffering=0) as out:
+        _write_all(out, header)
         
-        # Placeholder for table
-        out.write(b'\x00' * table_size)
-
-        # Write names
-        name_offsets = []
-        for name in names:
-            name_offsets.append(out.tell() - file_names_start)
-            out.write(name)
-
-        # Write files and save offsets
-        file_entries = []
-        for i, f in enumerate(files):
-            print(f"-> {f.name}")
-            file_offset = out.tell()
-            content = f.read_bytes()
-            out.write(content)
-            file_entries.append((name_offsets[i], file_offset, len(content)))
-
-        # Write table at the beginning
-        out.seek(8)
-        for name_off, file_off, file_size in file_entries:
-            out.write(struct.pack('<III', name_off, file_off, file_size))
+        step = max(1, len(files) // 100)
+        for done, (f, size) in enumerate(zip(files, sizes), 1):
+            original = duplicate_of[done - 1] if duplicate_of else None
+            if not quiet:
+                if original is None:
+                    print(f"-> {f.name}")
+                else:
+                    print(f"-> {f.name} (same as {files[original].name})")
+            elif done % step == 0 or done == len(files):
+                print(f"\r  Packed {done}/{len(files)} files", end='', flush=True)
+            if original is not None:
+                continue
+            with open(f.path, 'rb') as src:
+                _copy_range(src, out, 0, size)
+                if os.fstat(src.fileno()).st_size != size:
+                    raise ValueError(f"{f.name} changed size while packing")
+        if quiet:
+            print()
 
     print(f"\n[OK] Packing complete: {bin_path.name}")
+    if dedup:
+        duplicates = [i for i, original in enumerate(duplicate_of) if original is not None]
+        saved = sum(sizes[i] for i in duplicates)
+        print(f"  Deduplicated: {len(duplicates)} files, {saved} bytes saved "
+              f"({saved * 100 / max(1, sum(sizes)):.1f}% of the data)")
+
+
+_EXTRACTED_PREFIX = re.compile(r'(\d{4,})_')
+
+def _bin_match_entry(archive: BinArchive, filename: str) -> Optional[int]:
+    """
+    Index of the archive entry a file replaces: by the "0000_" prefix
+    written by bin-extract, else by entry name with or without the
+    extension bin-extract adds. None if nothing matches.
+    """
+    match = _EXTRACTED_PREFIX.match(filename)
+    if match:
+        index = int(match.group(1))
+        rest = filename[match.end():]
+        if index < len(archive) and archive[index].name in (rest, os.path.splitext(rest)[0]):
+            return index
+    for name in (filename, os.path.splitext(filename)[0]):
+        if name in archive:
+            return archive[name].index
+    return None
+
+
+def bin_update(original_bin: str, changed_folder: str, output_bin: str, quiet: bool = False):
+    """
+    Writes a copy of an archive with only the files in changed_folder replaced.
+    
+    Files are matched to entries by bin-extract's "0000_" prefix or by
+    name; entry names and order are kept. Unchanged entries are copied as
+    byte ranges straight from the original (runs of adjacent entries in one
+    kernel-side copy, shared payloads once), so the work done in Python
+    grows with the number of replaced files, not the archive size.
+    """
+    original_bin = Path(original_bin)
+    changed_folder = Path(changed_folder)
+    output_bin = Path(output_bin)
+    if output_bin.exists() and output_bin.samefile(original_bin):
+        raise ValueError("Output must be a different file than the original archive")
+    
+    with BinArchive(original_bin) as archive:
+        # Match replacement files to entries
+        replacements: Dict[int, os.DirEntry] = {}
+        with os.scandir(changed_folder) as it:
+            files = sorted((e for e in it if e.is_file()), key=lambda e: os.path.normcase(e.name))
+        for f in files:
+            index = _bin_match_entry(archive, f.name)
+            if index is None:
+                print(f"[WARN] No entry in {original_bin.name} for: {f.name}")
+            elif index in replacements:
+                print(f"[WARN] {f.name} and {replacements[index].name} both replace "
+                      f"{archive[index].name}, using {f.name}")
+                replacements[index] = f
+            else:
+                replacements[index] = f
+        new_sizes = dict(zip(replacements, _stat_sizes(list(replacements.values()))))
+        
+        # Layout: original header and names, new offsets/sizes
+        header = archive.read_header()
+        pos = len(header)
+        plan = []  # (replacement path or None for an original range, offset, size)
+        placed: Dict[Tuple[int, int], int] = {}  # original (offset, size) -> new offset
+        reused_bytes = 0
+        for entry in archive:
+            replacement = replacements.get(entry.index)
+            if replacement is not None:
+                offset, size = pos, new_sizes[entry.index]
+                plan.append((replacement.path, 0, size))
+                pos += size
+            else:
+                size = entry.size
+                offset = placed.get((entry.offset, size))
+                if offset is None:
+                    if entry.offset + size > archive.file_size:
+                        raise ValueError(f"Entry '{entry.name}' ends past the end of {original_bin.name}")
+                    offset = placed[(entry.offset, size)] = pos
+                    last = plan[-1] if plan else None
+                    if last is not None and last[0] is None and last[1] + last[2] == entry.offset:
+                        plan[-1] = (None, last[1], last[2] + size)  # Extend the copy run
+                    else:
+                        plan.append((None, entry.offset, size))
+                    pos += size
+                    reused_bytes += size
+            # Keep the name offset, patch data offset and size
+            struct.pack_into('<II', header, _BIN_HEADER.size + entry.index * _BIN_ENTRY.size + 4,
+                             offset, size)
+        
+        with open(output_bin, 'wb', buffering=0) as out:
+            _write_all(out, header)
+            for path, offset, size in plan:
+                if path is None:
+                    archive.copy_range(out, offset, size)
+                    continue
+                if not quiet:
+                    print(f"-> {os.path.basename(path)}")
+                with open(path, 'rb') as src:
+                    _copy_range(src, out, 0, size)
+                    if os.fstat(src.fileno()).st_size != size:
+                        raise ValueError(f"{os.path.basename(path)} changed size while packing")
+        
+        entry_count = len(archive)
+    
+    print(f"\n[OK] Update complete: {output_bin.name}")
+    print(f"  Replaced: {len(replacements)} of {entry_count} files "
+          f"({sum(new_sizes.values())} bytes)")
+    print(f"  Reused from original: {reused_bytes} bytes in {sum(1 for p in plan if p[0] is None)} copies")
+    print(f"  Size: {pos} bytes (original: {archive.file_size} bytes)")
 
 
 # =============================================================================
 # NVSG Tool - NVSG to PNG image converter
 # =============================================================================
 
-def nvsg_decode(nvsg_path: str, png_path: str) -> dict:
-    """Converts NVSG to PNG. Returns metadata."""
-    nvsg_path = Path(nvsg_path)
-    png_path = Path(png_path)
+# hzc1 container header followed by the NVSG header (44 bytes)
+_NVSG_HEADER = struct.Struct('<4sII4sHHHHHHHHIII')
+
+# zlib settings for encoding. Level 9 is the original output; --draft trades
+# size for speed on test builds
+NVSG_LEVEL = 9
+NVSG_DRAFT_LEVEL = 1
+NVSG_STRATEGIES = {
+    'default': zlib.Z_DEFAULT_STRATEGY,
+    'filtered': zlib.Z_FILTERED,
+    'rle': zlib.Z_RLE,
+    'huffman': zlib.Z_HUFFMAN_ONLY,
+    'fixed': zlib.Z_FIXED,
+}
 
-    with open(nvsg_path, 'rb') as f:
-        # hzc1 header
-        magic = f.read(4)
-        if magic != b'hzc1':
-            raise ValueError(f"Not a valid NVSG file (magic: {magic})")
-        
-        uncompressed_size = struct.unpack('<I', f.read(4))[0]
-        header_size = struct.unpack('<I', f.read(4))[0]
-
-        # NVSG header
-        nvsg_magic = f.read(4)
-        if nvsg_magic != b'NVSG':
-            raise ValueError("Missing NVSG header")
-
-        always_256 = struct.unpack('<H', f.read(2))[0]
-        fmt = struct.unpack('<H', f.read(2))[0]
-        width = struct.unpack('<H', f.read(2))[0]
-        height = struct.unpack('<H', f.read(2))[0]
-        x = struct.unpack('<H', f.read(2))[0]
-        y = struct.unpack('<H', f.read(2))[0]
-        unk1 = struct.unpack('<H', f.read(2))[0]
-        unk2 = struct.unpack('<H', f.read(2))[0]
-        image_count = struct.unpack('<I', f.read(4))[0]
-        unk3 = struct.unpack('<I', f.read(4))[0]
-        unk4 = struct.unpack('<I', f.read(4))[0]
-
-        # Compressed data
-        compressed = f.read()
-        data = zlib.decompress(compressed)
-
-    # Create image based on format
-    if fmt == 0:  # BGR 24-bit
-        img = Image.frombytes('RGB', (width, height), data, 'raw', 'BGR')
-    elif fmt == 1:  # BGRA 32-bit
-        img = Image.frombytes('RGBA', (width, height), data, 'raw', 'BGRA')
-    elif fmt == 2:  # BGRA with multiple frames
-        total_height = height * image_count
-        img = Image.frombytes('RGBA', (width, total_height), data, 'raw', 'BGRA')
-    elif fmt == 3:  # Grayscale
-        img = Image.frombytes('L', (width, height), data)
-    else:
+def _nvsg_compressor(level: int = NVSG_LEVEL, strategy: str = 'default'):
+    """zlib compressobj for NVSG pixel data, with the level (0-9) and strategy name checked."""
+    if not 0 <= level <= 9:
+        raise ValueError(f"Compression level must be 0-9, got {level}")
+    if strategy not in NVSG_STRATEGIES:
+        raise ValueError(f"Unknown compression strategy: {strategy} "
+                         f"(use {', '.join(NVSG_STRATEGIES)})")
+    return zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS, 8, NVSG_STRATEGIES[strategy])
+
+
+def nvsg_compress(pixels: bytes, level: int = NVSG_LEVEL, strategy: str = 'default') -> bytes:
+    """Compresses NVSG pixel data with the given zlib level (0-9) and strategy name."""
+    compressor = _nvsg_compressor(level, strategy)
+    return compressor.compress(pixels) + compressor.flush()
+
+# Bytes per pixel of each NVSG format (2 is BGRA frames stacked vertically)
+NVSG_CHANNELS = {0: 3, 1: 4, 2: 4, 3: 1}
+NVSG_INFLATE_CHUNK = 1 << 20  # Output per step when inflating frames that are skipped
+NVSG_INPUT_CHUNK = 1 << 16    # Compressed input fed to the inflater per step
+NVSG_STREAM_CHUNK = 1 << 20   # Pixel bytes per row block in streaming decode/encode
+
+def nvsg_read_header(data) -> dict:
+    """
+    Checks and parses the hzc1/NVSG header of NVSG file contents.
+    Returns every header field; image_count is as stored (0 for single images).
+    """
+    if len(data) < _NVSG_HEADER.size or data[:4] != b'hzc1':
+        raise ValueError(f"Not a valid NVSG file (magic: {bytes(data[:4])})")
+    (magic, uncompressed_size, header_size, nvsg_magic, always_256, fmt, width, height,
+     x, y, unk1, unk2, image_count, unk3, unk4) = _NVSG_HEADER.unpack_from(data, 0)
+    if nvsg_magic != b'NVSG':
+        raise ValueError("Missing NVSG header")
+    if fmt not in NVSG_CHANNELS:
         raise ValueError(f"Unsupported format: {fmt}")
+    return {
+        'uncompressed_size': uncompressed_size, 'header_size': header_size,
+        'format': fmt, 'width': width, 'height': height, 'x': x, 'y': y,
+        'unk1': unk1, 'unk2': unk2, 'image_count': image_count, 'unk3': unk3, 'unk4': unk4,
+    }
+
+
+def _nvsg_frame_count(header: dict) -> int:
+    return max(header['image_count'], 1) if header['format'] == 2 else 1
+
+
+def _nvsg_image(fmt: int, width: int, height: int, pixels) -> 'Image.Image':
+    """PIL image from raw NVSG pixel data of the given format."""
+    _require_imaging()
+    if fmt == 0:  # BGR 24-bit
+        return Image.frombytes('RGB', (width, height), pixels, 'raw', 'BGR')
+    elif fmt in (1, 2):  # BGRA 32-bit, format 2 with multiple frames
+        return Image.frombytes('RGBA', (width, height), pixels, 'raw', 'BGRA')
+    else:  # Grayscale
+        return Image.frombytes('L', (width, height), pixels)
+
+
+class _NvsgInflater:
+    """
+    Incremental inflate of an NVSG payload, handing out the pixel data in
+    exact byte counts. Compressed input is pulled from read() in
+    NVSG_INPUT_CHUNK pieces and output is bounded with max_length, so
+    neither buffer is ever held whole.
+    """
+    
+    def __init__(self, read: Callable[[int], bytes]):
+        self._read = read
+        self._inflater = zlib.decompressobj()
+    
+    @staticmethod
+    def from_buffer(data) -> '_NvsgInflater':
+        """Inflater over the payload of NVSG file contents held in memory."""
+        source = memoryview(data)[_NVSG_HEADER.size:]
+        pos = 0
+        
+        def read(size: int):
+            nonlocal pos
+            chunk = source[pos:pos + size]
+            pos += len(chunk)
+            return chunk
+        return _NvsgInflater(read)
+    
+    def _inflate(self, size: int, max_step: int, keep: bool) -> List[bytes]:
+        parts = []
+        while size > 0:
+            tail = self._inflater.unconsumed_tail
+            if not tail and not self._inflater.eof:
+                tail = self._read(NVSG_INPUT_CHUNK)
+            if not tail:
+                raise ValueError("NVSG pixel data is truncated")
+            chunk = self._inflater.decompress(tail, min(size, max_step))
+            if keep:
+                parts.append(chunk)
+            size -= len(chunk)
+        return parts
+    
+    def read(self, size: int) -> bytes:
+        """Next size bytes of pixel data."""
+        return b''.join(self._inflate(size, size, True))
+    
+    def skip(self, size: int):
+        """Inflates and drops size bytes, NVSG_INFLATE_CHUNK at a time."""
+        self._inflate(size, NVSG_INFLATE_CHUNK, False)
+
+
+def _nvsg_inflate_frames(data, header: dict, start: int = 0,
+                         stop: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Yields the raw pixel data of frames start..stop-1 of an NVSG image.
+    
+    Frames before start are inflated and dropped (deflate streams can only
+    be read in order), and nothing after the last requested frame is
+    inflated. At most one frame is held in memory.
+    """
+    frame_size = header['width'] * header['height'] * NVSG_CHANNELS[header['format']]
+    count = _nvsg_frame_count(header)
+    stop = count if stop is None else min(stop, count)
+    
+    inflater = _NvsgInflater.from_buffer(data)
+    if start > 0:
+        inflater.skip(start * frame_size)
+    for _ in range(start, stop):
+        yield inflater.read(frame_size)
 
-    img.save(png_path, 'PNG')
+
+def _pixel_digest(pixels: bytes = b''):
+    """blake2b of raw NVSG pixel data, the content hash kept in metadata.jsonl."""
+    return hashlib.blake2b(pixels, digest_size=16)
+
+
+def nvsg_decode_bytes(data) -> Tuple['Image.Image', dict]:
+    """
+    Decodes NVSG file contents (bytes or memoryview) to a PIL image.
+    Returns (image, metadata); metadata['header'] has every header field
+    and metadata['hash'] the pixel data digest.
+    """
+    header = nvsg_read_header(data)
+
+    # Compressed data
+    pixels = zlib.decompress(data[_NVSG_HEADER.size:])
+
+    # Format 2 frames are stacked vertically in one tall image
+    fmt, width, height = header['format'], header['width'], header['height']
+    img = _nvsg_image(fmt, width, height * _nvsg_frame_count(header), pixels)
 
     metadata = {
-        'x': x, 'y': y, 'image_count': image_count if image_count > 0 else 1,
-        'width': width, 'height': height, 'format': fmt
+        'x': header['x'], 'y': header['y'], 'image_count': max(header['image_count'], 1),
+        'width': width, 'height': height, 'format': fmt,
+        'header': header, 'hash': _pixel_digest(pixels).hexdigest(),
+    }
+    return img, metadata
+
+
+def nvsg_decode_frame(data, index: int) -> Tuple['Image.Image', dict]:
+    """
+    Decodes a single frame of NVSG file contents (format 2 sprite sheets;
+    other formats have one frame). Only the payload up to the end of that
+    frame is inflated. Returns (image, metadata).
+    """
+    header = nvsg_read_header(data)
+    count = _nvsg_frame_count(header)
+    if not 0 <= index < count:
+        raise ValueError(f"Frame {index} out of range (image has {count} frames)")
+    
+    pixels = next(_nvsg_inflate_frames(data, header, index, index + 1))
+    img = _nvsg_image(header['format'], header['width'], header['height'], pixels)
+    metadata = {
+        'x': header['x'], 'y': header['y'], 'image_count': count,
+        'width': header['width'], 'height': header['height'], 'format': header['format']
     }
+    return img, metadata
+
+
+def nvsg_frame_array(data, index: int) -> 'np.ndarray':
+    """
+    One frame of NVSG file contents as a NumPy array: (height, width, 4) RGBA,
+    (height, width, 3) RGB or (height, width) grayscale, uint8.
+    """
+    img, _ = nvsg_decode_frame(data, index)
+    _require_imaging()
+    return np.asarray(img)
+
+
+class PngStreamWriter:
+    """
+    Minimal PNG writer fed with blocks of rows, so an image never has to be
+    in memory whole. Writes 8-bit grayscale, RGB or RGBA. Filters are
+    computed for a whole block at once with NumPy; each row gets the Sub,
+    Up or Paeth filter with the smallest sum of absolute differences (the
+    usual libpng heuristic). IDAT chunks are written as the compressed
+    data grows.
+    """
+    
+    _COLOR_TYPES = {1: 0, 3: 2, 4: 6}  # channels -> PNG color type
+    _FILTER_TYPES = (1, 2, 4)  # Sub, Up, Paeth
+    IDAT_SIZE = 1 << 16
+    
+    def __init__(self, f, width: int, height: int, channels: int, level: int = 6):
+        _require_imaging()
+        self._f = f
+        self._channels = channels
+        self._height = height
+        self._rows = 0
+        self._previous = np.zeros((1, width * channels), dtype=np.uint8)
+        # Z_FILTERED suits filtered image rows (Pillow uses it too)
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS, 8, zlib.Z_FILTERED)
+        self._pending = []
+        self._pending_size = 0
+        
+        f.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8,
+                                         self._COLOR_TYPES[channels], 0, 0, 0))
+    
+    def _chunk(self, kind: bytes, payload: bytes):
+        self._f.write(struct.pack('>I', len(payload)) + kind)
+        self._f.write(payload)
+        self._f.write(struct.pack('>I', zlib.crc32(payload, zlib.crc32(kind))))
+    
+    def _add(self, data: bytes, flush: bool = False):
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+        if self._pending_size >= self.IDAT_SIZE or (flush and self._pending):
+            self._chunk(b'IDAT', b''.join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+    
+    def write_rows(self, rows: 'np.ndarray'):
+        """Appends rows given as a uint8 array of shape (n, width[, channels])."""
+        rows = rows.reshape(len(rows), -1)
+        bpp = self._channels
+        
+        # Predictors: a = left, b = above, c = above-left (0 outside the image)
+        b = np.concatenate((self._previous, rows[:-1]))
+        a = np.zeros_like(rows)
+        a[:, bpp:] = rows[:, :-bpp]
+        c = np.zeros_like(rows)
+        c[:, bpp:] = b[:, :-bpp]
+        
+        ia, ib, ic = a.astype(np.int16), b.astype(np.int16), c.astype(np.int16)
+        p = ia + ib - ic
+        pa, pb, pc = np.abs(p - ia), np.abs(p - ib), np.abs(p - ic)
+        paeth = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+        
+        # Uint8 subtraction wraps at 256, as the PNG filters do
+        candidates = np.stack((rows - a, rows - b, rows - paeth))  # Sub, Up, Paeth
+        cost = np.abs(candidates.view(np.int8).astype(np.int32)).sum(axis=2)
+        choice = cost.argmin(axis=0)
+        
+        filtered = np.empty((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = np.array(self._FILTER_TYPES, dtype=np.uint8)[choice]
+        filtered[:, 1:] = candidates[choice, np.arange(len(rows))]
+        
+        self._previous = rows[-1:].copy()
+        self._rows += len(rows)
+        self._add(self._compressor.compress(filtered))
+    
+    def close(self):
+        """Writes the remaining image data and the IEND chunk."""
+        if self._rows != self._height:
+            raise ValueError(f"PNG has {self._height} rows, {self._rows} were written")
+        self._add(self._compressor.flush(), flush=True)
+        self._chunk(b'IEND', b'')
+
+
+def nvsg_decode_stream(nvsg_path: str, png_path: str) -> dict:
+    """
+    Converts NVSG to PNG in blocks of rows: the payload is read from the
+    file and inflated NVSG_STREAM_CHUNK bytes at a time, the channels are
+    swapped from BGR(A) to RGB(A) per block and the rows go straight to a
+    PngStreamWriter. Memory use does not depend on the image size.
+    The PNG has the same pixels as nvsg_decode's, not the same bytes.
+    Returns metadata.
+    """
+    _require_imaging()
+    with open(nvsg_path, 'rb') as f:
+        header = nvsg_read_header(f.read(_NVSG_HEADER.size))
+        fmt, width, height = header['format'], header['width'], header['height']
+        count = _nvsg_frame_count(header)
+        channels = NVSG_CHANNELS[fmt]
+        rows = height * count
+        step = max(1, NVSG_STREAM_CHUNK // (width * channels))
+        inflater = _NvsgInflater(f.read)
+        digest = _pixel_digest()
+        
+        with open(png_path, 'wb') as out:
+            png = PngStreamWriter(out, width, rows, channels)
+            for first in range(0, rows, step):
+                n = min(step, rows - first)
+                pixels = inflater.read(n * width * channels)
+                digest.update(pixels)
+                block = np.frombuffer(pixels, dtype=np.uint8)
+                block = block.reshape(n, width, channels)
+                if channels == 3:
+                    block = block[:, :, 2::-1]
+                elif channels == 4:
+                    block = block[:, :, (2, 1, 0, 3)]
+                png.write_rows(block)
+            png.close()
+    
+    return {'x': header['x'], 'y': header['y'], 'image_count': count,
+            'width': width, 'height': height, 'format': fmt,
+            'header': header, 'hash': digest.hexdigest()}
+
+
+def nvsg_decode(nvsg_path: str, png_path: str, frame: Optional[int] = None,
+                split_frames: bool = False, stream: bool = False) -> dict:
+    """
+    Converts NVSG to PNG. Returns metadata.
+    
+    With frame, only that frame is decoded and saved. With split_frames,
+    every frame is saved to its own <png stem>_NN.png, one frame in memory
+    at a time. With stream, the image is converted in blocks of rows
+    (nvsg_decode_stream).
+    """
+    nvsg_path = Path(nvsg_path)
+    png_path = Path(png_path)
+    
+    if stream and frame is None and not split_frames:
+        metadata = nvsg_decode_stream(nvsg_path, png_path)
+        print(f"Decoded {nvsg_path.name} -> {png_path.name} "
+              f"(x={metadata['x']}, y={metadata['y']}, count={metadata['image_count']}, "
+              f"{metadata['width']}x{metadata['height']}, fmt={metadata['format']}, streamed)")
+        return metadata
+    data = nvsg_path.read_bytes()
+
+    if frame is not None:
+        img, metadata = nvsg_decode_frame(data, frame)
+        img.save(png_path, 'PNG')
+        print(f"Decoded {nvsg_path.name} frame {frame}/{metadata['image_count']} -> {png_path.name} "
+              f"({metadata['width']}x{metadata['height']}, fmt={metadata['format']})")
+        return metadata
+    
+    if split_frames:
+        header = nvsg_read_header(data)
+        count = _nvsg_frame_count(header)
+        fmt, width, height = header['format'], header['width'], header['height']
+        for i, pixels in enumerate(_nvsg_inflate_frames(data, header)):
+            _nvsg_image(fmt, width, height, pixels).save(
+                png_path.with_name(f"{png_path.stem}_{i:02d}.png"), 'PNG')
+        print(f"Decoded {nvsg_path.name} -> {png_path.stem}_00.png..{png_path.stem}_{count - 1:02d}.png "
+              f"({count} frames, {width}x{height}, fmt={fmt})")
+        return {'x': header['x'], 'y': header['y'], 'image_count': count,
+                'width': width, 'height': height, 'format': fmt}
+
+    img, metadata = nvsg_decode_bytes(data)
+    img.save(png_path, 'PNG')
+
     print(f"Decoded {nvsg_path.name} -> {png_path.name} "
-          f"(x={x}, y={y}, count={image_count}, {width}x{height}, fmt={fmt})")
+          f"(x={metadata['x']}, y={metadata['y']}, count={metadata['image_count']}, "
+          f"{metadata['width']}x{metadata['height']}, fmt={metadata['format']})")
     return metadata
 
 
-def nvsg_encode(png_path: str, nvsg_path: str, x: int, y: int, image_count: int = 1):
-    """Converts PNG to NVSG."""
-    png_path = Path(png_path)
-    nvsg_path = Path(nvsg_path)
+# PIL mode and raw (byte order) mode of each NVSG format
+_NVSG_MODES = {0: ('RGB', 'BGR'), 1: ('RGBA', 'BGRA'), 2: ('RGBA', 'BGRA'), 3: ('L', 'L')}
+
+# Header fields that metadata.jsonl records beyond decode_log.txt, so
+# re-encoding can reproduce the original header exactly
+NVSG_EXACT_FIELDS = ('format', 'header_size', 'unk1', 'unk2', 'unk3', 'unk4')
+
+def _nvsg_mode_loss(img: 'Image.Image', mode: str) -> Optional[str]:
+    """What converting img to mode throws away ("alpha", "color"), or None."""
+    if 'A' not in mode and ('A' in img.getbands() or 'transparency' in img.info):
+        return "alpha"
+    if mode == 'L' and img.mode not in ('1', 'L', 'LA', 'I', 'I;16', 'F'):
+        return "color"
+    return None
 
-    img = Image.open(png_path)
+
+def _nvsg_encode_format(img: 'Image.Image', image_count: int,
+                        fmt: Optional[int] = None) -> Tuple[int, str, str]:
+    """
+    NVSG format for a PIL image (fmt if given, else chosen from the mode
+    and image_count), with the PIL mode and raw mode its pixels are written in.
+    A given fmt is kept even if the image does not fit it, with a warning.
+    """
+    if fmt is None:
+        if image_count > 1:
+            fmt = 2
+        elif img.mode == 'RGBA':
+            fmt = 1
+        else:
+            fmt = 0
+    elif fmt in _NVSG_MODES:
+        lost = _nvsg_mode_loss(img, _NVSG_MODES[fmt][0])
+        if lost is not None:
+            print(f"  [WARN] {img.mode} PNG stored as recorded format {fmt} "
+                  f"({_NVSG_MODES[fmt][0]}): {lost} dropped")
+    if fmt not in _NVSG_MODES:
+        raise ValueError(f"Unsupported format: {fmt}")
+    return (fmt,) + _NVSG_MODES[fmt]
+
+
+def _nvsg_pack_header(fmt: int, width: int, height: int, x: int, y: int,
+                      image_count: int, pixel_bytes: int, fields: Optional[dict] = None) -> bytes:
+    fields = fields or {}
+    return _NVSG_HEADER.pack(
+        b'hzc1', pixel_bytes, fields.get('header_size', 0x20),
+        b'NVSG', 256, fmt, width, height, x, y,
+        fields.get('unk1', 0), fields.get('unk2', 0),
+        image_count,
+        fields.get('unk3', 0), fields.get('unk4', 0))
+
+
+def nvsg_encode_image(img: 'Image.Image', x: int, y: int, image_count: int = 1,
+                      level: int = NVSG_LEVEL, strategy: str = 'default',
+                      fields: Optional[dict] = None) -> Tuple[bytes, dict]:
+    """
+    Encodes a PIL image to NVSG file contents.
+    Returns (data, metadata) with the chosen format and frame size.
+    
+    fields holds the NVSG_EXACT_FIELDS of the original header (from
+    metadata.jsonl): the format is then kept instead of chosen from the
+    image, and header_size/unk1-unk4 are written back.
+    """
     width, height = img.size
 
     # Determine format
-    has_alpha = img.mode == 'RGBA'
-    if image_count > 1:
-        fmt = 2
-        height //= image_count
-    elif has_alpha:
-        fmt = 1
-    else:
-        fmt = 0
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+    fmt, mode, raw_mode = _nvsg_encode_format(img, image_count, (fields or {}).get('format'))
+    # The header keeps image_count as given, the metadata reports frames
+    frames = _nvsg_frame_count({'format': fmt, 'image_count': image_count})
+    height //= frames
 
     # Convert to BGRA/BGR bytes
-    if fmt in (1, 2):
-        if img.mode != 'RGBA':
-            img = img.convert('RGBA')
-        data = img.tobytes('raw', 'BGRA')
-    else:
-        data = img.tobytes('raw', 'BGR')
+    if img.mode != mode:
+        img = img.convert(mode)
+    pixels = img.tobytes('raw', raw_mode)
 
     # Compress
-    compressed = zlib.compress(data, level=9)
+    compressed = nvsg_compress(pixels, level, strategy)
 
-    with open(nvsg_path, 'wb') as f:
-        # hzc1 header
-        f.write(b'hzc1')
-        f.write(struct.pack('<I', len(data)))
-        f.write(struct.pack('<I', 0x20))  # header size
-        
-        # NVSG header
-        f.write(b'NVSG')
-        f.write(struct.pack('<H', 256))   # always 256
-        f.write(struct.pack('<H', fmt))
-        f.write(struct.pack('<H', width))
-        f.write(struct.pack('<H', height))
-        f.write(struct.pack('<H', x))
-        f.write(struct.pack('<H', y))
-        f.write(struct.pack('<H', 0))     # unk1
-        f.write(struct.pack('<H', 0))     # unk2
-        f.write(struct.pack('<I', image_count))
-        f.write(struct.pack('<I', 0))     # unk3
-        f.write(struct.pack('<I', 0))     # unk4
-        
-        f.write(compressed)
+    header = _nvsg_pack_header(fmt, width, height, x, y, image_count, len(pixels), fields)
+    
+    metadata = {
+        'x': x, 'y': y, 'image_count': frames,
+        'width': width, 'height': height, 'format': fmt
+    }
+    return header + compressed, metadata
+
+
+def _nvsg_encode_stream(img: 'Image.Image', nvsg_path: Path, x: int, y: int, image_count: int,
+                        level: int, strategy: str, fields: Optional[dict] = None) -> Tuple[int, dict]:
+    """
+    Writes a PIL image as NVSG in blocks of rows: each block is cropped,
+    converted to BGR(A), compressed and written before the next one, so
+    only Pillow's decoded image is held whole. The output is identical to
+    nvsg_encode_image's. Returns (file size, metadata).
+    """
+    width, total_height = img.size
+    fmt, mode, raw_mode = _nvsg_encode_format(img, image_count, (fields or {}).get('format'))
+    frames = _nvsg_frame_count({'format': fmt, 'image_count': image_count})
+    height = total_height // frames
+    row_bytes = width * len(mode)
+    step = max(1, NVSG_STREAM_CHUNK // row_bytes)
+    compressor = _nvsg_compressor(level, strategy)
+    
+    with open(nvsg_path, 'wb') as out:
+        size = out.write(_nvsg_pack_header(fmt, width, height, x, y, image_count,
+                                           row_bytes * total_height, fields))
+        for first in range(0, total_height, step):
+            block = img.crop((0, first, width, min(first + step, total_height)))
+            if block.mode != mode:
+                block = block.convert(mode)
+            size += out.write(compressor.compress(block.tobytes('raw', raw_mode)))
+        size += out.write(compressor.flush())
+    
+    metadata = {
+        'x': x, 'y': y, 'image_count': frames,
+        'width': width, 'height': height, 'format': fmt
+    }
+    return size, metadata
+
+
+def nvsg_encode(png_path: str, nvsg_path: str, x: int, y: int, image_count: int = 1,
+                level: int = NVSG_LEVEL, strategy: str = 'default', stream: bool = False,
+                fields: Optional[dict] = None) -> int:
+    """
+    Converts PNG to NVSG. Returns the NVSG file size.
+    With stream, rows are converted and compressed in blocks (_nvsg_encode_stream).
+    fields: exact header fields, see nvsg_encode_image.
+    """
+    _require_imaging()
+    png_path = Path(png_path)
+    nvsg_path = Path(nvsg_path)
+
+    with Image.open(png_path) as img:
+        if stream:
+            size, metadata = _nvsg_encode_stream(img, nvsg_path, x, y, image_count, level,
+                                                 strategy, fields)
+        else:
+            data, metadata = nvsg_encode_image(img, x, y, image_count, level, strategy, fields)
+            nvsg_path.write_bytes(data)
+            size = len(data)
 
     print(f"Encoded {png_path.name} -> {nvsg_path.name} "
-          f"(x={x}, y={y}, count={image_count}, {width}x{height}, fmt={fmt})")
+          f"(x={x}, y={y}, count={metadata['image_count']}, "
+          f"{metadata['width']}x{metadata['height']}, fmt={metadata['format']})")
+    return size
 
 
 # =============================================================================
 # Batch conversion
 # =============================================================================
 
-def batch_decode(input_folder: str, output_folder: str):
-    """Converts all NVSG files in a folder to PNG."""
+def _decode_log_line(png_name: str, meta: dict) -> str:
+    """One decode_log.txt line: PNG name and the metadata needed to re-encode it."""
+    return (f"{png_name} x={meta['x']} y={meta['y']} "
+            f"image_count={meta['image_count']} width={meta['width']} "
+            f"height={meta['height']} format={meta['format']}")
+
+
+def _read_decode_log(log_path: Path, text: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+    """Parses decode_log.txt into {png_name: {key: value}}."""
+    log_map = {}
+    if text is None:
+        text = log_path.read_text(encoding='cp932')
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 4:
+            png_name = parts[0]
+            vals = {}
+            for p in parts[1:]:
+                if '=' in p:
+                    k, v = p.split('=')
+                    vals[k] = int(v)
+            log_map[png_name] = vals
+    return log_map
+
+
+# Metadata index written next to decode_log.txt (JSON Lines). The first line
+# names the fields; every other line is one PNG as a JSON array in that
+# order, with every NVSG header field of the source and a hash of its pixels
+METADATA_NAME = "metadata.jsonl"
+METADATA_TYPE = "fvp-nvsg-metadata"
+METADATA_VERSION = 1
+METADATA_FIELDS = ('png', 'uncompressed_size', 'header_size', 'format', 'width', 'height',
+                   'x', 'y', 'unk1', 'unk2', 'image_count', 'unk3', 'unk4', 'hash')
+
+def _metadata_record(png_name: str, meta: dict) -> str:
+    """One metadata.jsonl line for a decoded image."""
+    values = {'png': png_name, 'hash': meta['hash'], **meta['header']}
+    return json.dumps([values[field] for field in METADATA_FIELDS], ensure_ascii=False)
+
+
+def _write_metadata(path: Path, records: List[str]):
+    header = json.dumps({'type': METADATA_TYPE, 'version': METADATA_VERSION,
+                         'fields': METADATA_FIELDS})
+    path.write_text(''.join(line + '\n' for line in [header] + records), encoding='utf-8')
+
+
+def read_metadata(path: str) -> Dict[str, dict]:
+    """
+    Loads a metadata.jsonl index into {png_name: {field: value}}, parsing
+    all records with a single json.loads call. A decode_log.txt is accepted
+    too (detected by its contents); its entries lack the NVSG_EXACT_FIELDS.
+    """
+    path = Path(path)
+    raw = path.read_bytes()
+    if not raw.lstrip().startswith(b'{'):
+        return _read_decode_log(path, raw.decode('cp932'))
+    
+    lines = [line for line in raw.decode('utf-8').splitlines() if line.strip()]
+    header = json.loads(lines[0])
+    if header.get('type') != METADATA_TYPE or header.get('version') != METADATA_VERSION:
+        raise ValueError(f"Unsupported metadata file: {path}")
+    fields = header['fields'][1:]
+    # json.dumps never writes raw newlines, so the lines join into one array
+    rows = json.loads('[' + ','.join(lines[1:]) + ']')
+    return {row[0]: dict(zip(fields, row[1:])) for row in rows}
+
+
+def _metadata_fields(vals: dict) -> Optional[dict]:
+    """The NVSG_EXACT_FIELDS of a metadata.jsonl entry, None for decode_log.txt entries."""
+    if 'header_size' not in vals:
+        return None
+    return {field: vals[field] for field in NVSG_EXACT_FIELDS}
+
+
+def _batch_run(func, tasks: list, jobs: int, initializer: Optional[Callable] = None,
+               initargs: tuple = ()) -> Iterator:
+    """
+    Yields func(task) for each task, in task order. With jobs > 1 the
+    tasks run in a process pool (image conversion is CPU-bound).
+    initializer(*initargs) runs once per worker, or once here when serial.
+    """
+    if jobs > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks)), initializer=initializer,
+                                 initargs=initargs) as pool:
+            yield from pool.map(func, tasks, chunksize=max(1, len(tasks) // (jobs * 8)))
+    else:
+        if initializer is not None:
+            initializer(*initargs)
+        yield from map(func, tasks)
+
+
+def _batch_decode_one(task: Tuple[str, str, bool]) -> Tuple[str, Optional[dict], Optional[str]]:
+    """Worker: decodes one NVSG file. Returns (console output, metadata, error)."""
+    nvsg_path, png_path, stream = task
+    output = StringIO()
+    try:
+        with redirect_stdout(output):
+            meta = nvsg_decode(nvsg_path, png_path, stream=stream)
+        return output.getvalue(), meta, None
+    except Exception as e:
+        return output.getvalue(), None, str(e)
+
+
+def _batch_encode_one(task: tuple) -> Tuple[str, int, Optional[str]]:
+    """Worker: encodes one PNG file. Returns (console output, NVSG size, error)."""
+    output = StringIO()
+    try:
+        with redirect_stdout(output):
+            size = nvsg_encode(*task)
+        return output.getvalue(), size, None
+    except Exception as e:
+        return output.getvalue(), 0, str(e)
+
+
+def _print_batch_errors(errors: List[Tuple[str, str]]):
+    """Summary of the files that failed in a batch run."""
+    if errors:
+        print(f"[ERROR] {len(errors)} files failed:")
+        for name, error in errors:
+            print(f"  {name}: {error}")
+
+
+def batch_decode(input_folder: str, output_folder: str, jobs: int = 1, stream: bool = False):
+    """
+    Converts all NVSG files in a folder to PNG, writing decode_log.txt and
+    metadata.jsonl (every header field, for exact re-encoding).
+    With jobs > 1 files are converted in a process pool; the console output
+    and the logs keep the sorted file order either way. With stream,
+    each image is converted in blocks of rows (nvsg_decode_stream).
+    """
     input_folder = Path(input_folder)
     output_folder = Path(output_folder)
     output_folder.mkdir(parents=True, exist_ok=True)
     
     log_path = output_folder / "decode_log.txt"
     log_entries = []
-
-    for f in sorted(input_folder.iterdir()):
-        if f.is_file():
-            png_name = f.stem + ".png"
-            png_path = output_folder / png_name
-            try:
-                meta = nvsg_decode(str(f), str(png_path))
-                log_entries.append(
-                    f"{png_name} x={meta['x']} y={meta['y']} "
-                    f"image_count={meta['image_count']} width={meta['width']} "
-                    f"height={meta['height']} format={meta['format']}"
-                )
-            except Exception as e:
-                print(f"[ERROR] {f.name}: {e}")
+    records = []
+    errors = []
+
+    files = [f for f in sorted(input_folder.iterdir()) if f.is_file()]
+    tasks = [(str(f), str(output_folder / (f.stem + ".png")), stream) for f in files]
+    for f, (output, meta, error) in zip(files, _batch_run(_batch_decode_one, tasks, jobs)):
+        print(output, end='')
+        if error is None:
+            log_entries.append(_decode_log_line(f.stem + ".png", meta))
+            records.append(_metadata_record(f.stem + ".png", meta))
+        else:
+            print(f"[ERROR] {f.name}: {error}")
+            errors.append((f.name, error))
 
     log_path.write_text('\n'.join(log_entries), encoding='cp932')
-    print(f"\n[OK] Log saved: {log_path}")
+    _write_metadata(output_folder / METADATA_NAME, records)
+    print(f"\n[OK] Log saved: {log_path} (full headers: {METADATA_NAME})")
+    _print_batch_errors(errors)
 
 
-def batch_encode(input_folder: str, output_folder: str, log_path: str):
-    """Converts all PNG files to NVSG using metadata from log."""
+# Build cache for batch-encode (<nvsg_folder>.encode_cache, next to the output
+# folder so bin-pack does not pick it up)
+ENCODE_CACHE_VERSION = 2
+
+class EncodeCache:
+    """
+    Inputs of every NVSG written by batch-encode: a digest of the PNG, its
+    x/y/image_count, the compression settings and the exact header fields
+    (metadata.jsonl only), plus the size and mtime
+    of the NVSG that was written from them. A PNG is skipped while all of
+    these still match, so a hand-edited or deleted NVSG is re-encoded.
+    """
+    
+    def __init__(self, entries: Optional[Dict[str, list]] = None):
+        self.entries = entries or {}  # png name -> [inputs, [nvsg size, mtime]]
+    
+    @staticmethod
+    def path_for(output_folder: Path) -> Path:
+        # Absolute first, so "." and ".." have a name to build the sibling from
+        output_folder = Path(os.path.abspath(output_folder))
+        return output_folder.with_name(output_folder.name + '.encode_cache')
+    
+    @staticmethod
+    def file_stat(path: Path) -> Optional[List[int]]:
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+    
+    @classmethod
+    def load(cls, path: Path) -> 'EncodeCache':
+        """Loads the cache, or returns an empty one if missing, unreadable or outdated."""
+        try:
+            raw = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return cls()
+        if (not isinstance(raw, dict) or raw.get('version') != ENCODE_CACHE_VERSION
+                or raw.get('tool') != __version__):
+            return cls()
+        return cls(raw.get('files'))
+    
+    def save(self, path: Path):
+        data = {'version': ENCODE_CACHE_VERSION, 'tool': __version__, 'files': self.entries}
+        path.write_text(json.dumps(data, sort_keys=True), encoding='utf-8')
+    
+    def is_current(self, png_name: str, inputs: list, nvsg_path: Path) -> bool:
+        entry = self.entries.get(png_name)
+        return entry is not None and entry[0] == inputs and entry[1] == self.file_stat(nvsg_path)
+
+
+def batch_encode(input_folder: str, output_folder: str, log_path: str, jobs: int = 1,
+                 level: int = NVSG_LEVEL, strategy: str = 'default', use_cache: bool = True,
+                 stream: bool = False):
+    """
+    Converts all PNG files to NVSG using metadata from log: metadata.jsonl
+    (headers are reproduced exactly) or decode_log.txt.
+    With jobs > 1 files are converted in a process pool. With stream, rows
+    are converted and compressed in blocks (same output, less memory).
+    
+    With use_cache, PNGs whose contents, metadata and compression settings
+    match the <output_folder>.encode_cache record of the existing NVSG are
+    skipped, and the cache is updated after the run.
+    """
     input_folder = Path(input_folder)
     output_folder = Path(output_folder)
     log_path = Path(log_path)
     output_folder.mkdir(parents=True, exist_ok=True)
+    nvsg_compress(b'', level, strategy)  # Reject bad settings before starting workers
 
     # Parse log
-    log_map = {}
-    for line in log_path.read_text(encoding='cp932').splitlines():
-        parts = line.split()
-        if len(parts) >= 4:
-            png_name = parts[0]
-            vals = {}
-            for p in parts[1:]:
-                if '=' in p:
-                    k, v = p.split('=')
-                    vals[k] = int(v)
-            log_map[png_name] = vals
+    log_map = read_metadata(log_path)
+
+    files = sorted(input_folder.glob('*.png'))
+    logged = [f for f in files if f.name in log_map]
+    
+    cache_path = EncodeCache.path_for(output_folder)
+    old_cache = EncodeCache.load(cache_path) if use_cache else EncodeCache()
+    cache = EncodeCache()
+    if use_cache:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=BIN_STAT_WORKERS) as pool:
+            digests = list(pool.map(_file_digest, [str(f) for f in logged]))
+    
+    tasks = []
+    inputs = {}
+    for i, f in enumerate(logged):
+        vals = log_map[f.name]
+        task = (str(f), str(output_folder / f.stem), vals['x'], vals['y'],
+                vals.get('image_count', 1), level, strategy, stream, _metadata_fields(vals))
+        if use_cache:
+            inputs[f.name] = [digests[i].hex(), *task[2:7], task[8]]
+            if old_cache.is_current(f.name, inputs[f.name], output_folder / f.stem):
+                cache.entries[f.name] = old_cache.entries[f.name]
+                continue
+        tasks.append(task)
+    
+    errors = []
+    total_size = 0
+    start = time.perf_counter()
+    results = _batch_run(_batch_encode_one, tasks, jobs)
+    for f in files:
+        if f.name not in log_map:
+            print(f"[WARN] No log entry for: {f.name}")
+            continue
+        if f.name in cache.entries:
+            print(f"[SKIP] {f.name}: unchanged")
+            continue
+        output, size, error = next(results)
+        print(output, end='')
+        total_size += size
+        if error is not None:
+            print(f"[ERROR] {f.name}: {error}")
+            errors.append((f.name, error))
+        elif use_cache:
+            cache.entries[f.name] = [inputs[f.name], EncodeCache.file_stat(output_folder / f.stem)]
+    
+    if use_cache:
+        cache.save(cache_path)
+    
+    print(f"\n[OK] Encoded {len(tasks) - len(errors)} images: {total_size} bytes "
+          f"in {time.perf_counter() - start:.2f}s (level {level}, strategy {strategy})")
+    if len(logged) > len(tasks):
+        print(f"[OK] Skipped {len(logged) - len(tasks)} unchanged images ({cache_path.name})")
+    _print_batch_errors(errors)
+
 
-    for f in sorted(input_folder.glob('*.png')):
+def bin_decode_images(bin_path: str, output_folder: str):
+    """
+    Decodes every NVSG entry of a .bin archive straight to PNG, with the
+    same file names and logs as bin-extract --no-ext followed by
+    batch-decode, without writing the NVSG files to disk. Other entries
+    are copied as-is under their bin-extract --no-ext name, so
+    bin-encode-images can pack them back.
+    """
+    bin_path = Path(bin_path)
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    
+    log_path = output_folder / "decode_log.txt"
+    log_entries = []
+    records = []
+    copied = 0
+    failed = 0
+
+    with BinArchive(bin_path) as archive:
+        for entry in archive:
+            entry_name = f"{entry.index:04d}_{entry.name}"
+            png_name = os.path.splitext(entry_name)[0] + ".png"
+            with archive.read(entry) as data:
+                is_nvsg = data[:4] == b'hzc1'
+            if not is_nvsg:
+                archive.extract(entry, output_folder / entry_name)
+                print(f"[COPY] {entry_name}: not an NVSG image, kept as is")
+                copied += 1
+                continue
+            try:
+                with archive.read(entry) as data:
+                    img, meta = nvsg_decode_bytes(data)
+                img.save(output_folder / png_name, 'PNG')
+            except Exception as e:
+                # Kept as a raw file, so bin-encode-images still packs it
+                (output_folder / png_name).unlink(missing_ok=True)
+                archive.extract(entry, output_folder / entry_name)
+                print(f"[ERROR] {entry_name}: {e} (copied as is)")
+                failed += 1
+                continue
+            log_entries.append(_decode_log_line(png_name, meta))
+            records.append(_metadata_record(png_name, meta))
+            print(f"Decoded {entry_name} -> {png_name} "
+                  f"(x={meta['x']}, y={meta['y']}, count={meta['image_count']}, "
+                  f"{meta['width']}x{meta['height']}, fmt={meta['format']})")
+
+    log_path.write_text('\n'.join(log_entries), encoding='cp932')
+    _write_metadata(output_folder / METADATA_NAME, records)
+    print(f"\n[OK] Decoded {len(log_entries)} images, copied {copied} other files")
+    if failed:
+        print(f"  {failed} NVSG entries could not be decoded and were copied as is")
+    print(f"[OK] Log saved: {log_path} (full headers: {METADATA_NAME})")
+
+
+def bin_encode_images(input_folder: str, bin_path: str, log_path: Optional[str] = None,
+                      level: int = NVSG_LEVEL, strategy: str = 'default'):
+    """
+    Encodes the PNGs listed in metadata.jsonl (or decode_log.txt) and packs
+    them into a .bin archive, like batch-encode followed by bin-pack without
+    the NVSG files on disk. Entry names and order match that two-step pipeline.
+    Other files of the folder (the entries bin-decode-images copied) are
+    packed unchanged in their place.
+    
+    Encoded sizes are only known after compression, so the table is
+    written last (each image is encoded and written in turn).
+    """
+    _require_imaging()
+    input_folder = Path(input_folder)
+    bin_path = Path(bin_path)
+    if log_path:
+        log_path = Path(log_path)
+    elif (input_folder / METADATA_NAME).exists():
+        log_path = input_folder / METADATA_NAME
+    else:
+        log_path = input_folder / "decode_log.txt"
+    log_map = read_metadata(log_path)
+    nvsg_compress(b'', level, strategy)
+    
+    # Same order as bin-pack over the NVSG files (named after the PNG stem)
+    # and the copied files. Only PNGs listed in the log are encoded; any
+    # other file, an unlisted .png included, is a raw entry.
+    skip_names = {METADATA_NAME, "decode_log.txt", log_path.name}
+    files = []  # (entry file name, path, is a PNG to encode)
+    for f in input_folder.iterdir():
+        if not f.is_file() or f.name in skip_names:
+            continue
         if f.name in log_map:
+            files.append((f.stem, f, True))
+        elif not (bin_path.exists() and f.samefile(bin_path)):
+            if f.suffix.lower() == '.png':
+                print(f"[WARN] No log entry for: {f.name} (packed as is)")
+            files.append((f.name, f, False))
+    files.sort(key=lambda item: os.path.normcase(item[0]))
+    if not files:
+        print("Error: Empty folder")
+        return
+    
+    names = [_bin_entry_name(name) for name, _, _ in files]
+    placeholder, _ = _bin_layout(names, [0] * len(names))
+    sizes = []
+    images = 0
+    
+    with open(bin_path, 'wb', buffering=0) as out:
+        _write_all(out, placeholder)
+        for name, f, is_png in files:
+            if not is_png:
+                size = f.stat().st_size
+                with open(f, 'rb') as src:
+                    _copy_range(src, out, 0, size)
+                sizes.append(size)
+                print(f"-> {f.name}")
+                continue
             vals = log_map[f.name]
-            out_path = output_folder / f.stem
-            nvsg_encode(str(f), str(out_path), vals['x'], vals['y'], vals.get('image_count', 1))
+            with Image.open(f) as img:
+                data, meta = nvsg_encode_image(img, vals['x'], vals['y'], vals.get('image_count', 1),
+                                               level, strategy, _metadata_fields(vals))
+            _write_all(out, data)
+            sizes.append(len(data))
+            images += 1
+            print(f"Encoded {f.name} -> {name} "
+                  f"(x={meta['x']}, y={meta['y']}, count={meta['image_count']}, "
+                  f"{meta['width']}x{meta['height']}, fmt={meta['format']})")
+        
+        # Table at the beginning, now that the sizes are known
+        header, _ = _bin_layout(names, sizes)
+        out.seek(0)
+        _write_all(out, header)
+
+    print(f"\n[OK] Packing complete: {bin_path.name} ({images} images, "
+          f"{len(files) - images} other files)")
+
+
+# =============================================================================
+# NVSG verification - compare original and rebuilt images
+# =============================================================================
+
+class NvsgSource:
+    """
+    NVSG files of a folder or a .bin archive, by name. Names from folders
+    lose the "0000_" prefix written by bin-extract, so a folder can be
+    compared with an archive.
+    """
+    
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.archive = None
+        self.refs: Dict[str, object] = {}  # name -> file path or archive entry index
+        if self.path.is_dir():
+            for f in sorted(self.path.iterdir()):
+                if f.is_file():
+                    match = _EXTRACTED_PREFIX.match(f.name)
+                    self.refs.setdefault(f.name[match.end():] if match else f.name, str(f))
         else:
-            print(f"[WARN] No log entry for: {f.name}")
+            self.archive = BinArchive(self.path)
+            for entry in self.archive:
+                self.refs.setdefault(entry.name, entry.index)
+    
+    def find(self, name: str) -> Optional[str]:
+        """Name as stored here: exact, else without the extension (batch-encode drops it)."""
+        for candidate in (name, os.path.splitext(name)[0]):
+            if candidate in self.refs:
+                return candidate
+        return None
+    
+    def is_nvsg(self, name: str) -> bool:
+        """Checks the 4-byte magic without reading the rest of the file."""
+        ref = self.refs[name]
+        if self.archive is not None:
+            with self.archive.read(ref) as data:
+                return bytes(data[:4]) == b'hzc1'
+        with open(ref, 'rb') as f:
+            return f.read(4) == b'hzc1'
+    
+    def read(self, name: str) -> bytes:
+        ref = self.refs[name]
+        if self.archive is not None:
+            with self.archive.read(ref) as data:
+                return bytes(data)
+        with open(ref, 'rb') as f:
+            return f.read()
+    
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+
+
+def _nvsg_pixels(data) -> Tuple[dict, 'np.ndarray']:
+    """
+    Header and pixels of NVSG file contents, as a (rows, width, 4) BGRA
+    array whatever the format (opaque alpha for BGR and grayscale images).
+    """
+    _require_imaging()
+    header = nvsg_read_header(data)
+    fmt, width = header['format'], header['width']
+    rows = header['height'] * _nvsg_frame_count(header)
+    channels = NVSG_CHANNELS[fmt]
+    pixels = np.frombuffer(zlib.decompress(data[_NVSG_HEADER.size:]), dtype=np.uint8)
+    if len(pixels) < rows * width * channels:
+        raise ValueError("NVSG pixel data is truncated")
+    pixels = pixels[:rows * width * channels].reshape(rows, width, channels)
+    if channels == 4:
+        return header, pixels
+    bgra = np.full((rows, width, 4), 255, dtype=np.uint8)
+    bgra[:, :, :3] = pixels  # Grayscale broadcasts to B, G and R
+    return header, bgra
+
+
+# Header fields compared by nvsg-verify (image_count as a frame count)
+NVSG_VERIFY_FIELDS = ('x', 'y', 'image_count', 'format', 'width', 'height')
+
+def nvsg_compare(original, rebuilt) -> dict:
+    """
+    Compares two NVSG images (file contents) pixel by pixel with NumPy.
+    Returns a dict with:
+    - drift: {field: (original, rebuilt)} for header fields that differ
+    - changed: number of pixels with any channel changed (None if the
+      sizes differ and pixels cannot be compared)
+    - bbox: (left, top, right, bottom) of the changed pixels, exclusive
+    - frames: format 2 frames containing changed pixels
+    - alpha_changed / alpha_max: pixels whose alpha changed, largest change
+    """
+    h1, a = _nvsg_pixels(original)
+    h2, b = _nvsg_pixels(rebuilt)
+    for h in (h1, h2):
+        h['image_count'] = _nvsg_frame_count(h)
+    result = {
+        'drift': {f: (h1[f], h2[f]) for f in NVSG_VERIFY_FIELDS if h1[f] != h2[f]},
+        'changed': None, 'bbox': None, 'frames': [], 'alpha_changed': 0, 'alpha_max': 0,
+    }
+    if a.shape != b.shape:
+        return result
+    
+    # One uint32 comparison per BGRA pixel instead of four byte comparisons
+    mask = a.view(np.uint32)[:, :, 0] != b.view(np.uint32)[:, :, 0]
+    result['changed'] = int(np.count_nonzero(mask))
+    if result['changed']:
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        result['bbox'] = (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+        if h1['format'] == 2 and h1['image_count'] > 1:
+            result['frames'] = np.unique(rows // h1['height']).tolist()
+        alpha = np.abs(a[:, :, 3].astype(np.int16) - b[:, :, 3])
+        result['alpha_changed'] = int(np.count_nonzero(alpha))
+        result['alpha_max'] = int(alpha.max())
+    return result
+
+
+_verify_sources: Dict[str, NvsgSource] = {}  # Per process: 'original' / 'rebuilt'
+
+def _nvsg_verify_init(original: str, rebuilt: str):
+    _verify_sources['original'] = NvsgSource(original)
+    _verify_sources['rebuilt'] = NvsgSource(rebuilt)
+
+
+def _nvsg_verify_close():
+    """Closes the sources opened by _nvsg_verify_init in this process (serial runs)."""
+    while _verify_sources:
+        _verify_sources.popitem()[1].close()
+
+
+def _nvsg_verify_one(names: Tuple[str, str]) -> Tuple[Optional[dict], Optional[str]]:
+    """Worker: compares one image. Returns (result, error); (None, None) if not an NVSG."""
+    try:
+        original, rebuilt = _verify_sources['original'], _verify_sources['rebuilt']
+        if not (original.is_nvsg(names[0]) or rebuilt.is_nvsg(names[1])):
+            return None, None
+        return nvsg_compare(original.read(names[0]), rebuilt.read(names[1])), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _format_verify_result(result: dict) -> str:
+    parts = []
+    if result['changed'] is None:
+        parts.append("size differs, pixels not compared")
+    elif result['changed']:
+        left, top, right, bottom = result['bbox']
+        parts.append(f"{result['changed']} pixels changed in ({left},{top})-({right},{bottom})")
+        if result['frames']:
+            parts.append(f"frames {','.join(map(str, result['frames']))}")
+        if result['alpha_changed']:
+            parts.append(f"alpha changed on {result['alpha_changed']} pixels (max {result['alpha_max']})")
+    for field, (old, new) in result['drift'].items():
+        parts.append(f"{field} {old} -> {new}")
+    return ", ".join(parts)
+
+
+def nvsg_verify(original: str, rebuilt: str, jobs: int = 1) -> bool:
+    """
+    Compares every NVSG image of two folders or .bin archives (any mix),
+    matched by name. Reports changed bounding boxes, alpha differences and
+    header drift (x, y, image_count, format, size) per image, plus images
+    missing on either side. Files that are not NVSG on either side are
+    skipped. Returns True if everything matches.
+    """
+    sources = NvsgSource(original), NvsgSource(rebuilt)
+    try:
+        pairs = []
+        missing = []
+        for name in sources[0].refs:
+            match = sources[1].find(name)
+            if match is not None:
+                pairs.append((name, match))
+            elif sources[0].is_nvsg(name):
+                missing.append(name)
+        matched = {match for _, match in pairs}
+        added = [name for name in sources[1].refs
+                 if name not in matched and sources[1].is_nvsg(name)]
+    finally:
+        for source in sources:
+            source.close()
+    
+    identical = changed = drifted = skipped = 0
+    errors = []
+    results = _batch_run(_nvsg_verify_one, pairs, jobs, _nvsg_verify_init, (original, rebuilt))
+    try:
+        for (name, _), (result, error) in zip(pairs, results):
+            if error is not None:
+                print(f"[ERROR] {name}: {error}")
+                errors.append((name, error))
+            elif result is None:
+                skipped += 1
+            elif result['changed'] == 0 and not result['drift']:
+                identical += 1
+            else:
+                print(f"[DIFF] {name}: {_format_verify_result(result)}")
+                changed += result['changed'] != 0
+                drifted += bool(result['drift'])
+    finally:
+        _nvsg_verify_close()
+    for name in missing:
+        print(f"[MISSING] {name}: not in {Path(rebuilt).name}")
+    for name in added:
+        print(f"[NEW] {name}: not in {Path(original).name}")
+    
+    compared = len(pairs) - skipped - len(errors)
+    print(f"\n[OK] Verified {compared} images: {identical} identical, {changed} with changed pixels, "
+          f"{drifted} with header drift")
+    if missing or added:
+        print(f"  Missing: {len(missing)}, new: {len(added)}")
+    _print_batch_errors(errors)
+    return identical == compared and not (missing or added or errors)
 
 
 # =============================================================================
@@ -988,27 +3229,49 @@ FVP Tools - Tools for Favorite View Point System
 
 Usage:
   BIN Archive:
-    python fvp_tools.py bin-extract <file.bin> <output_folder> [--no-ext]
-    python fvp_tools.py bin-pack <input_folder> <file.bin>
+    python fvp_tools.py bin-extract <file.bin> <output_folder> [--no-ext] [--jobs <N>] [--quiet]
+    python fvp_tools.py bin-pack <input_folder> <file.bin> [--dedup] [--quiet]
+    python fvp_tools.py bin-update <original.bin> <changed_folder> <output.bin> [--quiet]
+    python fvp_tools.py bin-list <file.bin>
+    python fvp_tools.py bin-get <file.bin> <name|index> <output_file>
   
   NVSG Images:
-    python fvp_tools.py nvsg-decode <nvsg_file> <png_file>
-    python fvp_tools.py nvsg-encode <png_file> <nvsg_file> --x <N> --y <N> [--count <N>]
+    python fvp_tools.py nvsg-decode <nvsg_file> <png_file> [--frame <N> | --split-frames] [--stream]
+    python fvp_tools.py nvsg-encode <png_file> <nvsg_file> --x <N> --y <N> [--count <N>] [--level <N>] [--strategy <name>] [--draft] [--stream]
   
   Batch Operations:
-    python fvp_tools.py batch-decode <nvsg_folder> <png_folder>
-    python fvp_tools.py batch-encode <png_folder> <nvsg_folder> <decode_log.txt>
+    python fvp_tools.py batch-decode <nvsg_folder> <png_folder> [--jobs <N>] [--stream]
+    python fvp_tools.py batch-encode <png_folder> <nvsg_folder> <metadata.jsonl|decode_log.txt> [--jobs <N>] [--level <N>] [--strategy <name>] [--draft] [--no-cache] [--stream]
+    python fvp_tools.py bin-decode-images <file.bin> <png_folder>
+    python fvp_tools.py bin-encode-images <png_folder> <file.bin> [<metadata.jsonl|decode_log.txt>] [--level <N>] [--strategy <name>] [--draft]
+    python fvp_tools.py nvsg-verify <original_folder|file.bin> <rebuilt_folder|file.bin> [--jobs <N>]
   
   HCB Scripts:
-    python fvp_tools.py hcb-decode <file.hcb> <output.txt> [--strings <strings.txt>]
-    python fvp_tools.py hcb-strings <file.hcb> <strings.txt>
-    python fvp_tools.py hcb-rebuild <original.hcb> <strings.txt> <output.hcb>
+    python fvp_tools.py hcb-decode <file.hcb> <output.txt> [--strings <strings.txt>] [--mmap] [--jobs <N>]
+    python fvp_tools.py hcb-strings <file.hcb> <strings.txt> [--mmap]
+    python fvp_tools.py hcb-rebuild <original.hcb> <strings.txt> <output.hcb> [--fixed-size] [--incremental] [--mmap]
+    python fvp_tools.py hcb-assemble <listing.txt> <base.hcb> <output.hcb>
     python fvp_tools.py hcb-split <strings.txt>
     python fvp_tools.py hcb-merge <build_script.txt> <output_strings.txt>
 
 Options:
   --no-ext    Do not add automatic extension (for NVSG files)
   --strings   Also export strings to separate file for translation
+  --fixed-size  Pad/truncate strings to their original length (no relocation)
+  --incremental Only patch strings changed since the last rebuild (keeps a .manifest);
+              only helps for same-length edits or with --fixed-size
+  --mmap      Read the HCB through a memory map instead of loading it
+  --no-cache  Do not use the <file.hcb>.idx index cache (hcb-*) or the
+              <nvsg_folder>.encode_cache build cache (batch-encode)
+  --jobs      Parallel workers for hcb-decode/bin-extract/batch-*/nvsg-verify (0: one per CPU core)
+  --quiet     Show a progress counter instead of one line per file
+  --dedup     Store identical files once in the archive (bin-pack)
+  --frame     Decode only frame N of a multi-frame NVSG (nvsg-decode)
+  --split-frames  Save each frame to <png_file stem>_NN.png (nvsg-decode)
+  --stream    Convert NVSG images in blocks of rows for bounded memory use
+  --level     NVSG zlib compression level 0-9 (default: 9)
+  --strategy  NVSG zlib strategy: default, filtered, rle, huffman, fixed
+  --draft     Fast, larger NVSG output for test builds (level 1)
   
 Note: NVSG files have no extension (engine requirement).
       Audio files (OGG/WAV) are detected automatically.
@@ -1016,6 +3279,27 @@ Note: NVSG files have no extension (engine requirement).
 """)
 
 
+def get_jobs(args: List[str]) -> int:
+    """Value of --jobs N (default 1, 0: one per CPU core)."""
+    if '--jobs' in args:
+        i = args.index('--jobs')
+        if i + 1 < len(args):
+            return int(args[i + 1]) or os.cpu_count() or 1
+    return 1
+
+
+def get_compression(args: List[str]) -> Dict[str, object]:
+    """NVSG compression settings from --level N, --strategy NAME and --draft."""
+    level = NVSG_DRAFT_LEVEL if '--draft' in args else NVSG_LEVEL
+    strategy = 'default'
+    for i, arg in enumerate(args[:-1]):
+        if arg == '--level':
+            level = int(args[i + 1])
+        elif arg == '--strategy':
+            strategy = args[i + 1].lower()
+    return {'level': level, 'strategy': strategy}
+
+
 def main():
     args = sys.argv[1:]
     
@@ -1028,13 +3312,27 @@ def main():
     try:
         if cmd == 'bin-extract' and len(args) >= 3:
             auto_ext = '--no-ext' not in args
-            bin_extract(args[1], args[2], auto_ext=auto_ext)
+            bin_extract(args[1], args[2], auto_ext=auto_ext, jobs=get_jobs(args),
+                        quiet='--quiet' in args)
         
         elif cmd == 'bin-pack' and len(args) >= 3:
-            bin_pack(args[1], args[2])
+            bin_pack(args[1], args[2], quiet='--quiet' in args, dedup='--dedup' in args)
+        
+        elif cmd == 'bin-update' and len(args) >= 4:
+            bin_update(args[1], args[2], args[3], quiet='--quiet' in args)
+        
+        elif cmd == 'bin-list' and len(args) >= 2:
+            bin_list(args[1])
+        
+        elif cmd == 'bin-get' and len(args) >= 4:
+            bin_get(args[1], args[2], args[3])
         
         elif cmd == 'nvsg-decode' and len(args) >= 3:
-            nvsg_decode(args[1], args[2])
+            frame = None
+            if '--frame' in args and args.index('--frame') + 1 < len(args):
+                frame = int(args[args.index('--frame') + 1])
+            nvsg_decode(args[1], args[2], frame=frame, split_frames='--split-frames' in args,
+                        stream='--stream' in args)
         
         elif cmd == 'nvsg-encode' and len(args) >= 3:
             # Parse optional arguments
@@ -1049,13 +3347,27 @@ def main():
                     count = int(args[i + 1]); i += 2
                 else:
                     i += 1
-            nvsg_encode(args[1], args[2], x, y, count)
+            nvsg_encode(args[1], args[2], x, y, count, stream='--stream' in args,
+                        **get_compression(args))
         
         elif cmd == 'batch-decode' and len(args) >= 3:
-            batch_decode(args[1], args[2])
+            batch_decode(args[1], args[2], jobs=get_jobs(args), stream='--stream' in args)
         
         elif cmd == 'batch-encode' and len(args) >= 4:
-            batch_encode(args[1], args[2], args[3])
+            batch_encode(args[1], args[2], args[3], jobs=get_jobs(args),
+                         use_cache='--no-cache' not in args, stream='--stream' in args,
+                         **get_compression(args))
+        
+        elif cmd == 'bin-decode-images' and len(args) >= 3:
+            bin_decode_images(args[1], args[2])
+        
+        elif cmd == 'bin-encode-images' and len(args) >= 3:
+            log_path = args[3] if len(args) >= 4 and not args[3].startswith('--') else None
+            bin_encode_images(args[1], args[2], log_path, **get_compression(args))
+        
+        elif cmd == 'nvsg-verify' and len(args) >= 3:
+            if not nvsg_verify(args[1], args[2], jobs=get_jobs(args)):
+                sys.exit(1)
         
         elif cmd == 'hcb-decode' and len(args) >= 3:
             # Parse optional --strings argument
@@ -1067,13 +3379,22 @@ def main():
                     i += 2
                 else:
                     i += 1
-            hcb_decode(args[1], args[2], strings_path)
+            hcb_decode(args[1], args[2], strings_path, use_mmap='--mmap' in args,
+                       use_cache='--no-cache' not in args, jobs=get_jobs(args))
         
         elif cmd == 'hcb-strings' and len(args) >= 3:
-            hcb_extract_strings(args[1], args[2])
+            hcb_extract_strings(args[1], args[2], use_mmap='--mmap' in args,
+                                use_cache='--no-cache' not in args)
         
         elif cmd == 'hcb-rebuild' and len(args) >= 4:
-            hcb_rebuild(args[1], args[2], args[3])
+            fixed_size = '--fixed-size' in args
+            incremental = '--incremental' in args
+            hcb_rebuild(args[1], args[2], args[3], fixed_size=fixed_size,
+                        incremental=incremental, use_mmap='--mmap' in args,
+                        use_cache='--no-cache' not in args)
+        
+        elif cmd == 'hcb-assemble' and len(args) >= 4:
+            hcb_assemble(args[1], args[2], args[3], use_cache='--no-cache' not in args)
         
         elif cmd == 'hcb-split' and len(args) >= 2:
             hcb_split_strings(args[1])
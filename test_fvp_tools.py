@@ -0,0 +1,1368 @@
+"""Regression tests for fvp_tools (run with: python -m pytest -q)."""
+
+import contextlib
+import errno
+import io
+import json
+import os
+import re
+import struct
+import tempfile
+import unittest
+import zlib
+from pathlib import Path
+from unittest import mock
+
+import fvp_tools
+
+
+# =============================================================================
+# Synthetic inputs
+# =============================================================================
+
+class HcbBuilder:
+    """Writes a small HCB script by hand, with branch targets given by name."""
+
+    def __init__(self):
+        self.code = bytearray(4)  # Entry point, patched by build()
+        self.symbols = {}
+        self.fixups = []  # (operand position, symbol)
+
+    def label(self, name):
+        self.symbols[name] = len(self.code)
+
+    def function(self, name, args=0, local_count=0):
+        self.label(name)
+        self.op(0x01, bytes((args, local_count)))
+
+    def op(self, opcode, operand=b''):
+        self.code.append(opcode)
+        self.code += operand
+
+    def ref(self, opcode, symbol):
+        """Instruction whose 32-bit operand is the address of symbol."""
+        self.op(opcode)
+        self.fixups.append((len(self.code), symbol))
+        self.code += bytes(4)
+
+    def string(self, text):
+        raw = text if isinstance(text, bytes) else text.encode('cp932') + b'\x00'
+        self.op(0x0E, bytes((len(raw),)) + raw)
+
+    def build(self, start):
+        """Returns the script; its data section starts with the address of start."""
+        code = bytearray(self.code)
+        for pos, symbol in self.fixups:
+            struct.pack_into('<I', code, pos, self.symbols[symbol])
+        struct.pack_into('<I', code, 0, len(code))
+        title = b'Test\x00'
+        data = struct.pack('<IHHH', self.symbols[start], 16, 16, 0) + bytes((len(title),)) + title
+        return bytes(code) + data + bytes(2)
+
+
+def relocation_script():
+    """
+    Three functions with strings before, between and right at branch
+    targets, forward and backward jumps, calls, pushint function pointers,
+    a stray byte and a start function that is not the first one.
+    """
+    hcb = HcbBuilder()
+    hcb.function('f0')
+    hcb.string("alpha")
+    hcb.label('top')
+    hcb.ref(0x0A, 'f2')  # Function pointer
+    hcb.string("beta")
+    hcb.ref(0x07, 'target')  # Forward
+    hcb.ref(0x02, 'f1')
+    hcb.string("gamma")
+    hcb.label('target')
+    hcb.string("delta")  # String at a branch target
+    hcb.ref(0x06, 'top')  # Backward
+    hcb.op(0x04)
+
+    hcb.function('f1', 1)
+    hcb.string("epsilon")
+    hcb.op(0xFF)  # Stray byte
+    hcb.ref(0x02, 'f2')
+    hcb.op(0x04)
+
+    hcb.function('f2')
+    hcb.string("zeta")
+    hcb.ref(0x0A, 'f0')
+    hcb.ref(0x06, 'f1')  # Jump to a function start
+    hcb.op(0x04)
+    return hcb.build('f1')
+
+
+def listing_script():
+    """
+    Every opcode once with a plain operand, plus each listing special case:
+    stray bytes (.byte), non-minimal pushint encodings (.i16/.i32), pushint
+    function pointers, NaN/inf floats, strings that need x"hex" or escapes,
+    labels, a jump to a function start and a target outside the code.
+    """
+    plain = {
+        fvp_tools.OPARG_NULL: b'', fvp_tools.OPARG_I32: struct.pack('<i', -100000),
+        fvp_tools.OPARG_I16: struct.pack('<h', -300), fvp_tools.OPARG_I8: struct.pack('<b', -5),
+    }
+    hcb = HcbBuilder()
+    hcb.function('f0', 2, 0xFE)  # initstack 2, -2
+    hcb.label('back')
+    for opcode, name, arg_type in fvp_tools.HCB_OPCODES:
+        if name == "initstack":
+            continue
+        if opcode in fvp_tools.HCB_BRANCH_OPCODES:
+            hcb.ref(opcode, 'f1')
+        elif name == "pushfloat":
+            hcb.op(opcode, struct.pack('<f', 1.5))
+        elif arg_type == fvp_tools.OPARG_STRING:
+            hcb.string("こんにちは")
+        else:
+            hcb.op(opcode, plain[arg_type])
+    hcb.op(0xFF)  # Stray bytes
+    hcb.op(0x28)
+    hcb.op(0x0A, struct.pack('<i', 5))  # pushint.i32 5
+    hcb.op(0x0A, struct.pack('<i', -1))
+    hcb.op(0x0B, struct.pack('<h', 3))  # pushint.i16 3
+    hcb.op(0x0B, struct.pack('<h', 1000))
+    hcb.ref(0x0A, 'f1')  # pushint FUNCTION_1
+    hcb.op(0x0D, struct.pack('<I', 0x7FC00001))  # NaN with payload
+    hcb.op(0x0D, struct.pack('<f', float('inf')))
+    hcb.string(b'ab\x00\x00')  # Trailing nulls: x"hex"
+    hcb.string(b'\x81\x20\x00')  # Invalid CP932: x"hex"
+    hcb.string('quote" back\\ new\nline\r')
+    hcb.string(b'\x00')
+    hcb.ref(0x07, 'forward')
+    hcb.ref(0x06, 'back')
+    hcb.label('forward')
+    hcb.op(0x06, struct.pack('<I', 0xFFFFFFF0))  # Outside the code section
+    hcb.op(0x04)
+
+    hcb.function('f1', 1)
+    hcb.ref(0x06, 'f0')  # Jump to an earlier function start
+    hcb.ref(0x02, 'f0')
+    hcb.op(0x05)
+    return hcb.build('f1')
+
+
+def functions_script(count):
+    """
+    count functions, each with three strings, a backward loop label, a
+    forward label, calls and a function pointer to other functions.
+    """
+    hcb = HcbBuilder()
+    for i in range(count):
+        hcb.function(f'f{i}', i % 3)
+        hcb.string(f"line {i}")
+        hcb.label(f'loop{i}')
+        hcb.op(0x03, struct.pack('<h', i))  # syscall
+        hcb.ref(0x0A, f'f{(i + 1) % count}')
+        hcb.string(f"line {i} again")
+        hcb.ref(0x07, f'loop{i}')
+        hcb.ref(0x02, f'f{(i * 7 + 3) % count}')
+        hcb.ref(0x06, f'end{i}')
+        hcb.string(f"skipped {i}")
+        hcb.label(f'end{i}')
+        hcb.op(0x04)
+    return hcb.build('f0')
+
+
+class TempDirTest(unittest.TestCase):
+    """Runs each test in a fresh temporary folder."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.cwd = os.getcwd()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def run_quiet(self, func, *args, **kwargs) -> str:
+        """Calls func and returns what it printed."""
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            func(*args, **kwargs)
+        return output.getvalue()
+
+
+# =============================================================================
+# HCB
+# =============================================================================
+
+class HcbReadTest(TempDirTest):
+
+    def setUp(self):
+        super().setUp()
+        self.hcb = self.root / "script.hcb"
+        self.hcb.write_bytes(relocation_script())
+
+    def decode(self, name, with_strings=True, **kwargs):
+        """Runs hcb-decode on script.hcb. Returns (listing, strings file or None)."""
+        listing, strings = self.root / f"{name}.txt", self.root / f"{name}_strings.txt"
+        self.run_quiet(fvp_tools.hcb_decode, self.hcb, listing,
+                       strings if with_strings else None, **kwargs)
+        return listing.read_bytes(), strings.read_bytes() if with_strings else None
+
+    def test_mmap_matches_buffered(self):
+        self.assertEqual(self.decode("mmap", use_mmap=True, use_cache=False),
+                         self.decode("read", use_cache=False))
+        # Every opcode and listing special case (its strings are not all valid CP932)
+        self.hcb.write_bytes(listing_script())
+        self.assertEqual(self.decode("mmap", False, use_mmap=True, use_cache=False),
+                         self.decode("read", False, use_cache=False))
+        self.hcb.write_bytes(relocation_script())
+
+        outputs = []
+        for use_mmap in (False, True):
+            path = self.root / f"strings{int(use_mmap)}.txt"
+            self.run_quiet(fvp_tools.hcb_extract_strings, self.hcb, path, use_mmap=use_mmap,
+                           use_cache=False)
+            outputs.append(path.read_bytes())
+        self.assertEqual(outputs[1], outputs[0])
+        self.assertEqual(outputs[0], self.decode("read", use_cache=False)[1])
+
+        texts = self.root / "texts.txt"
+        addr = fvp_tools.hcb_scan(relocation_script()).str_offsets[0]
+        texts.write_text(f"0000|0x{addr:08X}|longer than it was\n", encoding='cp932')
+        rebuilt = []
+        for use_mmap in (False, True):
+            path = self.root / f"rebuilt{int(use_mmap)}.hcb"
+            self.run_quiet(fvp_tools.hcb_rebuild, self.hcb, texts, path, use_mmap=use_mmap,
+                           use_cache=False)
+            rebuilt.append(path.read_bytes())
+        self.assertEqual(rebuilt[1], rebuilt[0])
+        self.assertNotEqual(rebuilt[0], self.hcb.read_bytes())
+
+    def test_mmap_refuses_to_overwrite_the_original(self):
+        texts = self.root / "texts.txt"
+        texts.write_text("0000|0x00000000|x\n", encoding='cp932')
+        with self.assertRaises(ValueError):
+            self.run_quiet(fvp_tools.hcb_rebuild, self.hcb, texts, self.hcb, use_mmap=True,
+                           use_cache=False)
+        self.assertEqual(self.hcb.read_bytes(), relocation_script())
+
+    def test_decode_writes_while_listing(self):
+        self.hcb.write_bytes(functions_script(200))
+        expected = self.decode("buffered", use_cache=False)
+        listing_path = self.root / "streamed.txt"
+        listing = fvp_tools._hcb_listing
+        sizes = []
+
+        def watched_listing(*args, **kwargs):
+            for line in listing(*args, **kwargs):
+                sizes.append(listing_path.stat().st_size)
+                yield line
+
+        with mock.patch.object(fvp_tools, 'HCB_WRITE_BUFFER', 64), \
+                mock.patch.object(fvp_tools, '_hcb_listing', watched_listing):
+            self.assertEqual(self.decode("streamed", use_cache=False), expected)
+        # Lines reach the file while later ones are still being decoded
+        self.assertEqual(sizes[0], 0)
+        self.assertGreater(sizes[-1], len(expected[0]) // 2)
+
+    def test_jobs_match_serial(self):
+        self.hcb.write_bytes(functions_script(60))
+        index = fvp_tools.hcb_scan(self.hcb.read_bytes())
+        self.assertGreater(len(fvp_tools._hcb_function_chunks(index, 3 * fvp_tools.HCB_CHUNKS_PER_JOB)), 3)
+
+        expected = self.decode("serial", use_cache=False)
+        for jobs, use_mmap in ((2, False), (3, True)):
+            with self.subTest(jobs=jobs, mmap=use_mmap):
+                self.assertEqual(self.decode(f"jobs{jobs}", use_cache=False, jobs=jobs,
+                                             use_mmap=use_mmap), expected)
+
+        # Numbering runs on across chunk boundaries
+        listing, strings = (data.decode('cp932') for data in expected)
+        functions = [int(n) for n in re.findall(r'# ===== FUNCTION (\d+) =====', listing)]
+        self.assertEqual(functions, list(range(60)))
+        listed_ids = [int(n) for n in re.findall(r'\[STR_(\d+)\]', listing)]
+        self.assertEqual(listed_ids, list(range(180)))
+        self.assertEqual([int(line[:4]) for line in strings.splitlines()], list(range(180)))
+        labels = [int(n, 16) for n in re.findall(r'^label_([0-9a-f]{8}):$', listing, re.M)]
+        self.assertGreaterEqual(len(labels), 120)  # Loops and ends, plus calls to later functions
+        self.assertEqual(labels, sorted(labels))
+
+    def test_index_cache_reused_until_stale(self):
+        sidecar = fvp_tools.HcbIndex.cache_path_for(self.hcb)
+        expected = self.decode("uncached", use_cache=False)
+        self.assertFalse(sidecar.exists())
+
+        def decode_counting_scans(name, **kwargs):
+            with mock.patch.object(fvp_tools, 'hcb_scan', wraps=fvp_tools.hcb_scan) as scan:
+                result = self.decode(name, **kwargs)
+            return result, scan.call_count
+
+        self.assertEqual(decode_counting_scans("first"), (expected, 1))
+        self.assertTrue(sidecar.is_file())
+        for use_mmap in (False, True):
+            with self.subTest(reused=use_mmap):
+                self.assertEqual(decode_counting_scans("again", use_mmap=use_mmap), (expected, 0))
+
+        with self.subTest("tool version changed"), \
+                mock.patch.object(fvp_tools, '__version__', "0.0.1"):
+            self.assertEqual(decode_counting_scans("version"), (expected, 1))
+            self.assertEqual(decode_counting_scans("version"), (expected, 0))
+        self.assertEqual(decode_counting_scans("version back")[1], 1)
+
+        with self.subTest("content changed"):
+            # Same size and mtime, other bytes: only the content hash tells them apart
+            st = self.hcb.stat()
+            data = bytearray(relocation_script())
+            data[data.index(b'alpha')] = ord('A')
+            self.hcb.write_bytes(data)
+            os.utime(self.hcb, ns=(st.st_atime_ns, st.st_mtime_ns))
+            (listing, strings), scans = decode_counting_scans("changed")
+            self.assertEqual(scans, 1)
+            self.assertIn(b'"Alpha"', listing)
+            self.assertEqual(self.decode("changed", use_cache=False), (listing, strings))
+
+        with self.subTest("corrupt sidecar"):
+            sidecar.write_bytes(sidecar.read_bytes()[:-3])
+            self.assertEqual(decode_counting_scans("corrupt")[1], 1)
+            self.assertEqual(decode_counting_scans("corrupt")[1], 0)
+
+
+class HcbRebuildTest(TempDirTest):
+
+    def rebuild(self, data, texts, name="out.hcb", **kwargs):
+        """Rebuilds data with {string index: text}. Returns (output, its path)."""
+        original = self.root / "original.hcb"
+        if not original.exists() or original.read_bytes() != data:
+            original.write_bytes(data)  # Left alone otherwise, --incremental checks its mtime
+        index = fvp_tools.hcb_scan(data)
+        lines = [f"{i:04d}|0x{index.str_offsets[i]:08X}|{text}\n" for i, text in texts.items()]
+        strings = self.root / "strings.txt"
+        strings.write_text(''.join(lines), encoding='cp932')
+        output = self.root / name
+        self.last_output = self.run_quiet(fvp_tools.hcb_rebuild, original, strings, output,
+                                          use_cache=False, **kwargs)
+        return output.read_bytes(), output
+
+    def assert_relocated(self, old, new):
+        """Every code address in new points at the same instruction as in old."""
+        a, b = fvp_tools.hcb_scan(old), fvp_tools.hcb_scan(new)
+        self.assertEqual(list(a.opcodes), list(b.opcodes))
+        moved = dict(zip(a.offsets, b.offsets))
+        boundaries = set(b.offsets)
+        functions = set(a.func_offsets)
+
+        self.assertEqual(struct.unpack_from('<I', new, 0)[0], b.entry_point)
+        self.assertEqual(len(new) - b.entry_point, len(old) - a.entry_point)
+        for i, opcode in enumerate(a.opcodes):
+            if opcode in fvp_tools.HCB_BRANCH_OPCODES or (opcode == 0x0A and a.values[i] in functions):
+                self.assertIn(b.values[i], boundaries)
+                self.assertEqual(b.values[i], moved[a.values[i]])
+            elif opcode != 0x0E:
+                self.assertEqual(b.values[i], a.values[i])
+
+        start = struct.unpack_from('<I', old, a.entry_point)[0]
+        self.assertEqual(struct.unpack_from('<I', new, b.entry_point)[0], moved[start])
+        self.assertEqual(new[b.entry_point + 4:], old[a.entry_point + 4:])
+
+    def strings_of(self, data):
+        return [text for _, _, text in fvp_tools._hcb_iter_strings(data, fvp_tools.hcb_scan(data))]
+
+    def test_relocates_grown_and_shrunk_strings(self):
+        old = relocation_script()
+        texts = {0: "alpha, a good deal longer", 2: "g", 3: "delta grows at a branch target",
+                 4: "eps", 5: "zeta " * 20}
+        new, _ = self.rebuild(old, texts)
+        self.assert_relocated(old, new)
+        expected = self.strings_of(old)
+        for i, text in texts.items():
+            expected[i] = text
+        self.assertEqual(self.strings_of(new), expected)
+
+    def test_shrink_only_and_grow_only(self):
+        old = relocation_script()
+        for texts in ({i: "" for i in range(6)}, {i: "x" * 200 for i in range(6)}):
+            with self.subTest(length=len(texts[0])):
+                new, _ = self.rebuild(old, texts)
+                self.assert_relocated(old, new)
+                self.assertEqual(self.strings_of(new), list(texts.values()))
+
+    def test_pushint_equal_to_a_function_start_is_relocated(self):
+        # Known limitation: the bytecode does not mark pointers, so an integer
+        # constant that equals a function address is moved like a pointer
+        hcb = HcbBuilder()
+        hcb.function('f0')
+        hcb.string("grows")
+        hcb.ref(0x0A, 'f1')  # Meant as a plain integer
+        hcb.op(0x0A, struct.pack('<i', 7))  # Not a function start
+        hcb.op(0x04)
+        hcb.function('f1')
+        hcb.op(0x04)
+        old = hcb.build('f0')
+        constant = hcb.symbols['f1']
+        self.root.joinpath("original.hcb").write_bytes(old)
+        listing = self.root / "listing.txt"
+        self.run_quiet(fvp_tools.hcb_decode, self.root / "original.hcb", listing, use_cache=False)
+        self.assertEqual(listing.read_text(encoding='cp932').count("pushint FUNCTION_1"), 1)
+
+        new, _ = self.rebuild(old, {0: "grows by twelve"})
+        self.assert_relocated(old, new)
+        b = fvp_tools.hcb_scan(new)
+        pushed = [b.values[i] for i, opcode in enumerate(b.opcodes) if opcode == 0x0A]
+        self.assertEqual(pushed, [constant + 10, 7])
+        self.assertIn("Relocated pushint function pointers: 1", self.last_output)
+
+        # Nothing to report when no pushint matches a function start
+        hcb = HcbBuilder()
+        hcb.function('f0')
+        hcb.string("grows")
+        hcb.op(0x0A, struct.pack('<i', 7))
+        hcb.op(0x04)
+        self.rebuild(hcb.build('f0'), {0: "grows by twelve"})
+        self.assertIn("Relocated references:", self.last_output)
+        self.assertNotIn("pushint function pointers", self.last_output)
+
+    def test_fixed_size_matches_padding(self):
+        old = relocation_script()
+        index = fvp_tools.hcb_scan(old)
+        texts = {0: "al", 1: "beta", 3: "much longer than delta", 5: "zeta\\nz"}
+        new, _ = self.rebuild(old, texts, fixed_size=True)
+
+        # Old behavior: spaces before the null when shorter, cut (null kept) when longer
+        expected = bytearray(old)
+        for i, text in texts.items():
+            addr, length = index.str_offsets[i], index.str_lengths[i]
+            raw = fvp_tools._hcb_unescape(text).encode('cp932') + b'\x00'
+            if len(raw) < length:
+                raw = raw[:-1] + b' ' * (length - len(raw)) + b'\x00'
+            raw = raw[:length - 1] + b'\x00'
+            expected[addr + 2:addr + 2 + length] = raw
+        self.assertEqual(new, bytes(expected))
+
+    def test_incremental_matches_full_rebuild(self):
+        old = relocation_script()
+        steps = [
+            ("no manifest", {0: "alpha grows", 4: "eps"}, "No usable manifest"),
+            ("same length", {0: "ALPHA GROWS", 4: "EPS"}, "patched 2 strings in place"),
+            ("stale output", {0: "ALPHA GROWS", 4: "EPS", 5: "ZETA"}, "changed since last rebuild"),
+            ("length changed", {0: "ALPHA", 4: "EPS", 5: "ZETA"}, "changed size"),
+            ("unchanged", {0: "ALPHA", 4: "EPS", 5: "ZETA"}, "patched 0 strings in place"),
+        ]
+        for step, texts, message in steps:
+            with self.subTest(step):
+                if step == "stale output":
+                    output = self.root / "inc.hcb"
+                    st = output.stat()
+                    os.utime(output, ns=(st.st_atime_ns, st.st_mtime_ns + 2_000_000_000))
+                incremental, _ = self.rebuild(old, texts, "inc.hcb", incremental=True)
+                self.assertIn(message, self.last_output)
+                full, _ = self.rebuild(old, texts, "full.hcb")
+                self.assertEqual(incremental, full)
+
+    def test_incremental_fixed_size_patches_in_place(self):
+        old = relocation_script()
+        first, _ = self.rebuild(old, {1: "b"}, "inc.hcb", fixed_size=True, incremental=True)
+        second, _ = self.rebuild(old, {1: "a much longer beta"}, "inc.hcb", fixed_size=True,
+                                 incremental=True)
+        self.assertIn("patched 1 strings in place", self.last_output)
+        full, _ = self.rebuild(old, {1: "a much longer beta"}, "full.hcb", fixed_size=True)
+        self.assertEqual(second, full)
+        self.assertEqual(len(first), len(old))
+
+
+class HcbAssembleTest(TempDirTest):
+
+    def decode(self, data):
+        """Writes data as base.hcb and returns its hcb-decode listing."""
+        base = self.root / "base.hcb"
+        base.write_bytes(data)
+        listing = self.root / "listing.txt"
+        self.run_quiet(fvp_tools.hcb_decode, base, listing, use_cache=False)
+        return listing.read_text(encoding='cp932')
+
+    def assemble(self, listing):
+        path = self.root / "edited.txt"
+        path.write_text(listing, encoding='cp932')
+        output = self.root / "out.hcb"
+        self.run_quiet(fvp_tools.hcb_assemble, path, self.root / "base.hcb", output,
+                       use_cache=False)
+        return output.read_bytes()
+
+    def test_round_trip_is_byte_identical(self):
+        data = listing_script()
+        listing = self.decode(data)
+        for form in ('.byte 0xFF', 'pushint.i32 5', 'pushint.i32 -1', 'pushint.i16 3',
+                     'pushint FUNCTION_1', 'pushfloat 0x7FC00001', 'pushfloat inf',
+                     'pushstring x"61620000"', 'pushstring x"812000"', 'jmp FUNCTION_0',
+                     'jmp 0xFFFFFFF0', 'pushstring "quote\\" back\\\\ new\\nline\\r"'):
+            self.assertIn(f"  {form}", listing)
+        self.assertEqual(self.assemble(listing), data)
+
+    def test_wide_pushint_keeps_its_encoding(self):
+        # i32 values a pushint.i16 could hold and i16 values a pushint.i8 could hold
+        wide = {0x0A: ('<i', (1000, -200, 128, -129, 32767, -32768, 127, -128)),
+                0x0B: ('<h', (0, 127, -128, -1))}
+        hcb = HcbBuilder()
+        hcb.function('f0')
+        for opcode, (fmt, values) in wide.items():
+            for value in values:
+                hcb.op(opcode, struct.pack(fmt, value))
+        hcb.op(0x0A, struct.pack('<i', 32768))  # Needs i32 anyway: no suffix
+        hcb.op(0x0B, struct.pack('<h', 128))
+        hcb.op(0x04)
+        data = hcb.build('f0')
+
+        listing = self.decode(data)
+        for value in wide[0x0A][1]:
+            self.assertIn(f"  pushint.i32 {value}\n", listing)
+        for value in wide[0x0B][1]:
+            self.assertIn(f"  pushint.i16 {value}\n", listing)
+        self.assertIn("  pushint 32768\n", listing)
+        self.assertIn("  pushint 128\n", listing)
+        self.assertEqual(self.assemble(listing), data)
+
+    def test_inserted_instruction_moves_targets(self):
+        old = listing_script()
+        lines = self.decode(old).splitlines(True)
+        first = next(i for i, line in enumerate(lines) if line.startswith("  initstack"))
+        lines.insert(first + 1, "  pushtrue\n")
+        new = self.assemble(''.join(lines))
+
+        a, b = fvp_tools.hcb_scan(old), fvp_tools.hcb_scan(new)
+        self.assertEqual(len(b), len(a) + 1)
+        self.assertEqual(b.entry_point, a.entry_point + 1)
+        self.assertEqual(b.opcodes[1], 0x08)
+        # Instruction j of the old script is instruction j + 1 after the insert
+        moved = {a.offsets[j]: b.offsets[j + (j >= 1)] for j in range(len(a))}
+        functions = set(a.func_offsets)
+        for j, opcode in enumerate(a.opcodes):
+            value, new_value = a.values[j], b.values[j + (j >= 1)]
+            if opcode in fvp_tools.HCB_BRANCH_OPCODES and value < a.entry_point:
+                self.assertEqual(new_value, moved[value])
+            elif opcode == 0x0A and value in functions:
+                self.assertEqual(new_value, moved[value])
+            else:
+                self.assertEqual(new_value, value)
+
+        start = struct.unpack_from('<I', old, a.entry_point)[0]
+        self.assertEqual(struct.unpack_from('<I', new, b.entry_point)[0], moved[start])
+        self.assertEqual(new[b.entry_point + 4:], old[a.entry_point + 4:])
+
+
+# =============================================================================
+# BIN
+# =============================================================================
+
+class BinWriterTest(TempDirTest):
+
+    # Files packed into the test archives, in archive order; c and g repeat a and b
+    FILES = {
+        'a.dat': b'payload A' * 50, 'b.dat': b'payload B' * 30, 'c.dat': b'payload A' * 50,
+        'd.dat': b'payload D' * 50, 'e.dat': b'', 'f.dat': b'', 'g.dat': b'payload B' * 30,
+    }
+
+    def write_folder(self, name, files):
+        folder = self.root / name
+        folder.mkdir()
+        for filename, data in files.items():
+            (folder / filename).write_bytes(data)
+        return folder
+
+    def read_archive(self, path):
+        """Returns ({entry name: contents}, {entry name: data offset})."""
+        with fvp_tools.BinArchive(path) as archive:
+            contents = {entry.name: bytes(archive.read(entry)) for entry in archive}
+            offsets = {entry.name: entry.offset for entry in archive}
+        return contents, offsets
+
+    # Layout written by the original packer: files in sorted order, "0000_" prefixes dropped
+    PACK_FILES = {
+        '0001_voice.ogg': b'OggS' + bytes(range(256)) * 40, '0002_empty': b'',
+        'bg001': b'hzc1' + b'\x07' * 5000, 'script.hcb': bytes(range(200)),
+        '背景.dat': b'shift_jis name',
+    }
+
+    @staticmethod
+    def reference_archive(files):
+        names = [(name[5:] if name[4:5] == '_' and name[:4].isdigit() else name)
+                 .encode('shift_jis') + b'\x00' for name in sorted(files)]
+        contents = [files[name] for name in sorted(files)]
+        names_size = sum(len(n) for n in names)
+        table = bytearray(struct.pack('<II', len(names), names_size))
+        name_offset, offset = 0, 8 + 12 * len(names) + names_size
+        for name, data in zip(names, contents):
+            table += struct.pack('<III', name_offset, offset, len(data))
+            name_offset += len(name)
+            offset += len(data)
+        return bytes(table) + b''.join(names) + b''.join(contents)
+
+    def test_pack_matches_original_layout_on_every_copy_path(self):
+        folder = self.write_folder("files", self.PACK_FILES)
+        expected = self.reference_archive(self.PACK_FILES)
+
+        def unsupported(*args):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+        def nothing_copied(*args):
+            return 0
+
+        paths = {
+            "kernel": {},
+            "sendfile": {'copy_file_range': unsupported},
+            "empty copy_file_range": {'copy_file_range': nothing_copied},
+            "read-write": {'copy_file_range': unsupported, 'sendfile': unsupported},
+        }
+        for path, broken in paths.items():
+            with self.subTest(path), \
+                    mock.patch.dict(fvp_tools._kernel_copy_calls), \
+                    mock.patch.object(fvp_tools, 'BIN_COPY_CHUNK', 1000), \
+                    (mock.patch.multiple(os, **broken) if broken else contextlib.nullcontext()), \
+                    mock.patch.object(fvp_tools, '_write_all', wraps=fvp_tools._write_all) as writes:
+                archive = self.root / f"{path}.bin"
+                self.run_quiet(fvp_tools.bin_pack, folder, archive, quiet=True)
+                self.assertEqual(archive.read_bytes(), expected)
+
+                extracted = self.root / f"{path}_files"
+                self.run_quiet(fvp_tools.bin_extract, archive, extracted, auto_ext=False, jobs=2,
+                               quiet=True)
+                for i, name in enumerate(sorted(self.PACK_FILES)):
+                    entry = name[5:] if name[4:5] == '_' else name
+                    self.assertEqual((extracted / f"{i:04d}_{entry}").read_bytes(),
+                                     self.PACK_FILES[name])
+                # Only the header goes through Python unless both kernel calls fail
+                payloads = [len(c.args[1]) for c in writes.call_args_list[1:]]
+                if path == "read-write":
+                    self.assertIn(1000, payloads)
+                    self.assertFalse(any(fvp_tools._kernel_copy_calls.values()))
+                else:
+                    self.assertEqual(payloads, [])
+                if path == "sendfile":
+                    self.assertEqual(fvp_tools._kernel_copy_calls,
+                                     {'copy_file_range': False, 'sendfile': True})
+
+    def test_dedup_shares_identical_files(self):
+        folder = self.write_folder("files", self.FILES)
+        plain, deduped = self.root / "plain.bin", self.root / "dedup.bin"
+        self.run_quiet(fvp_tools.bin_pack, folder, plain)
+        output = self.run_quiet(fvp_tools.bin_pack, folder, deduped, dedup=True)
+
+        contents, offsets = self.read_archive(deduped)
+        self.assertEqual(contents, self.FILES)
+        self.assertEqual(self.read_archive(plain)[0], self.FILES)
+        self.assertEqual(offsets['a.dat'], offsets['c.dat'])
+        self.assertEqual(offsets['b.dat'], offsets['g.dat'])
+        self.assertNotEqual(offsets['a.dat'], offsets['d.dat'])  # Same size, other bytes
+        saved = len(self.FILES['c.dat']) + len(self.FILES['g.dat'])
+        self.assertEqual(plain.stat().st_size - deduped.stat().st_size, saved)
+        self.assertIn(f"Deduplicated: 2 files, {saved} bytes saved", output)
+
+        extracted = self.root / "extracted"
+        self.run_quiet(fvp_tools.bin_extract, deduped, extracted, auto_ext=False, jobs=2)
+        for i, (name, data) in enumerate(self.FILES.items()):
+            self.assertEqual((extracted / f"{i:04d}_{name}").read_bytes(), data)
+
+    def test_update_keeps_shared_payloads(self):
+        folder = self.write_folder("files", self.FILES)
+        original = self.root / "original.bin"
+        self.run_quiet(fvp_tools.bin_pack, folder, original, dedup=True)
+        changed = self.write_folder("changed", {'0000_a.dat': b'new A', 'd.dat': b'new D' * 99})
+        updated = self.root / "updated.bin"
+        output = self.run_quiet(fvp_tools.bin_update, original, changed, updated, quiet=True)
+
+        expected = dict(self.FILES, **{'a.dat': b'new A', 'd.dat': b'new D' * 99})
+        contents, offsets = self.read_archive(updated)
+        self.assertEqual(list(contents), list(self.FILES))
+        self.assertEqual(contents, expected)
+        # b and g still share one payload; c keeps A although a was replaced
+        self.assertEqual(offsets['b.dat'], offsets['g.dat'])
+        self.assertNotEqual(offsets['a.dat'], offsets['c.dat'])
+        self.assertIn("Replaced: 2 of 7 files", output)
+        # A moves to c, the old D is dropped, the replacements are appended
+        self.assertEqual(updated.stat().st_size, original.stat().st_size - len(self.FILES['d.dat'])
+                         + len(expected['d.dat']) + len(expected['a.dat']))
+
+        # Extracting the update gives the same files as the expected folder
+        extracted = self.root / "extracted"
+        self.run_quiet(fvp_tools.bin_extract, updated, extracted, auto_ext=False)
+        for i, (name, data) in enumerate(expected.items()):
+            self.assertEqual((extracted / f"{i:04d}_{name}").read_bytes(), data)
+
+
+class BinExtractTest(TempDirTest):
+
+    def test_jobs_and_quiet_match_serial(self):
+        from bench_fvp import make_bin
+        archive = self.root / "archive.bin"
+        archive.write_bytes(make_bin(60, seed=2))
+        extra = self.root / "extra"
+        extra.mkdir()
+        for name, data in (('photo', b'\xff\xd8\xff\xe0jpeg'), ('icon', b'\x89PNG\r\n'),
+                           ('名前', b'RIFF....WAVE'), ('empty', b'')):
+            (extra / name).write_bytes(data)
+        mixed = self.root / "mixed.bin"
+        self.run_quiet(fvp_tools.bin_pack, extra, mixed)
+
+        for path in (archive, mixed):
+            with fvp_tools.BinArchive(path) as bin_archive:
+                entries = [(entry.name, bytes(bin_archive.read(entry))) for entry in bin_archive]
+            for auto_ext in (True, False):
+                # File names the original extractor wrote, from the entry table
+                expected = {
+                    f"{i:04d}_{name}" + (fvp_tools.detect_extension(data[:16]) if auto_ext else ''): data
+                    for i, (name, data) in enumerate(entries)}
+                serial = None
+                for jobs, quiet in ((1, False), (4, False), (4, True), (1, True)):
+                    with self.subTest(archive=path.name, auto_ext=auto_ext, jobs=jobs, quiet=quiet):
+                        folder = self.root / f"{path.stem}_{auto_ext}_{jobs}_{quiet}"
+                        output = self.run_quiet(fvp_tools.bin_extract, path, folder,
+                                                auto_ext=auto_ext, jobs=jobs, quiet=quiet)
+                        files = {f.name: f.read_bytes() for f in folder.iterdir()}
+                        self.assertEqual(files, expected)
+                        if quiet:
+                            self.assertNotIn("-> ", output)
+                            self.assertIn(f"Extracted {len(entries)}/{len(entries)} files", output)
+                        elif serial is None:
+                            serial = output
+                            self.assertEqual(re.findall(r"^-> (.+)$", output, re.M), list(expected))
+                        else:
+                            self.assertEqual(output, serial)
+        self.assertTrue((self.root / "mixed_True_1_False" / "0003_名前.wav").is_file())
+        self.assertTrue((self.root / "mixed_True_4_True" / "0002_photo.jpg").is_file())
+
+
+# =============================================================================
+# NVSG
+# =============================================================================
+
+def png_chunks(data):
+    """Yields (type, payload) for each chunk of PNG file contents."""
+    pos = 8
+    while pos < len(data):
+        length, kind = struct.unpack_from('>I4s', data, pos)
+        payload = data[pos + 8:pos + 8 + length]
+        crc = struct.unpack_from('>I', data, pos + 8 + length)[0]
+        assert crc == zlib.crc32(payload, zlib.crc32(kind)), kind
+        yield kind, payload
+        pos += 12 + length
+
+
+class NvsgFrameTest(TempDirTest):
+
+    def setUp(self):
+        super().setUp()
+        from bench_fvp import make_nvsg
+        self.data = make_nvsg(2, 40, 30, 5, seed=3)
+        self.frame_size = 40 * 30 * 4
+
+    def test_frame_matches_full_decode(self):
+        import numpy as np
+        full = np.asarray(fvp_tools.nvsg_decode_bytes(self.data)[0])
+        for index in range(5):
+            with self.subTest(frame=index), \
+                    mock.patch.object(fvp_tools._NvsgInflater, 'read', autospec=True,
+                                      side_effect=fvp_tools._NvsgInflater.read) as read, \
+                    mock.patch.object(fvp_tools._NvsgInflater, 'skip', autospec=True,
+                                      side_effect=fvp_tools._NvsgInflater.skip) as skip:
+                frame = fvp_tools.nvsg_frame_array(self.data, index)
+                np.testing.assert_array_equal(frame, full[index * 30:(index + 1) * 30])
+                # Earlier frames are skipped, only the selected one is kept
+                self.assertEqual([c.args[1] for c in read.call_args_list], [self.frame_size])
+                self.assertEqual([c.args[1] for c in skip.call_args_list],
+                                 [index * self.frame_size] if index else [])
+
+    def test_frame_stops_after_the_selected_one(self):
+        # Pixel data cut after frame 1: frames 0-1 still decode, frame 2 does not
+        compressed = self.data[fvp_tools._NVSG_HEADER.size:]
+        partial = zlib.decompressobj().decompress(compressed, 2 * self.frame_size)
+        truncated = self.data[:fvp_tools._NVSG_HEADER.size] + zlib.compress(partial)
+        with mock.patch.object(fvp_tools, 'NVSG_INPUT_CHUNK', 64):
+            for index in (0, 1):
+                fvp_tools.nvsg_decode_frame(truncated, index)
+            with self.assertRaisesRegex(ValueError, "truncated"):
+                fvp_tools.nvsg_decode_frame(truncated, 2)
+
+    def test_frame_out_of_range(self):
+        from bench_fvp import make_nvsg
+        for data, index, count in ((self.data, 5, 5), (self.data, -1, 5),
+                                   (make_nvsg(1, 8, 8), 1, 1)):
+            with self.subTest(index=index, count=count):
+                with self.assertRaisesRegex(ValueError, rf"Frame {index} out of range "
+                                                        rf"\(image has {count} frames\)"):
+                    fvp_tools.nvsg_decode_frame(data, index)
+        path = self.root / "sprite"
+        path.write_bytes(self.data)
+        with self.assertRaises(ValueError):
+            self.run_quiet(fvp_tools.nvsg_decode, path, self.root / "out.png", frame=7)
+        self.assertFalse((self.root / "out.png").exists())
+
+
+class BinImagesTest(TempDirTest):
+
+    def round_trip(self, files, copied=()):
+        """
+        Packs files, runs bin-decode-images then bin-encode-images and checks
+        the rebuilt archive against the original: NVSG entries (except those
+        in copied) by header and pixels, the rest byte for byte. Returns both
+        outputs.
+        """
+        folder = self.root / "files"
+        folder.mkdir()
+        for name, data in files.items():
+            (folder / name).write_bytes(data)
+        original = self.root / "original.bin"
+        self.run_quiet(fvp_tools.bin_pack, folder, original)
+
+        png = self.root / "png"
+        decoded = self.run_quiet(fvp_tools.bin_decode_images, original, png)
+        rebuilt = self.root / "rebuilt.bin"
+        encoded = self.run_quiet(fvp_tools.bin_encode_images, png, rebuilt)
+
+        size = fvp_tools._NVSG_HEADER.size
+        with fvp_tools.BinArchive(original) as a, fvp_tools.BinArchive(rebuilt) as b:
+            self.assertEqual([entry.name for entry in b], [entry.name for entry in a])
+            for old, new in zip(a, b):
+                with self.subTest(entry=old.name):
+                    old_data, new_data = bytes(a.read(old)), bytes(b.read(new))
+                    if old_data[:4] != b'hzc1' or old.name in copied:
+                        self.assertEqual(new_data, old_data)
+                        continue
+                    self.assertEqual(new_data[:size], old_data[:size])
+                    self.assertEqual(zlib.decompress(new_data[size:]),
+                                     zlib.decompress(old_data[size:]))
+        return decoded, encoded
+
+    def test_decode_encode_round_trip(self):
+        from bench_fvp import make_nvsg
+        decoded, encoded = self.round_trip({
+            'bg001': make_nvsg(0, 24, 16, x=3, y=4, seed=1, unk2=0x1234),
+            'bg002': make_nvsg(1, 24, 16, seed=2),
+            'se001': b'RIFF' + bytes(range(200)),
+            'sprite': make_nvsg(2, 12, 10, 3, seed=3, unk4=7),
+            'text.dat': b'not an image',
+            'mask': make_nvsg(3, 24, 16, seed=4),
+            'empty': b'',
+        })
+        self.assertIn("Decoded 4 images, copied 3 other files", decoded)
+        self.assertIn("(4 images, 3 other files)", encoded)
+
+    def test_raw_png_entries_are_kept(self):
+        from bench_fvp import make_nvsg
+        decoded, encoded = self.round_trip({
+            'bg001': make_nvsg(1, 8, 8), 'logo.png': b'\x89PNG raw bytes, not from an NVSG',
+        })
+        self.assertIn("[COPY] 0001_logo.png", decoded)
+        self.assertIn("[WARN] No log entry for: 0001_logo.png (packed as is)", encoded)
+        self.assertIn("(1 images, 1 other files)", encoded)
+
+    def test_archive_without_images(self):
+        decoded, encoded = self.round_trip({'logo.png': b'raw', 'data': b'bytes'})
+        self.assertIn("Decoded 0 images, copied 2 other files", decoded)
+        self.assertIn("(0 images, 2 other files)", encoded)
+
+    def test_undecodable_image_is_copied(self):
+        from bench_fvp import make_nvsg
+        decoded, encoded = self.round_trip({
+            'bg001': make_nvsg(1, 8, 8), 'broken': make_nvsg(1, 16, 16)[:60],
+        }, copied={'broken'})
+        self.assertIn("[ERROR] 0001_broken:", decoded)
+        self.assertIn("1 NVSG entries could not be decoded and were copied as is", decoded)
+        self.assertFalse((self.root / "png" / "0001_broken.png").exists())
+        self.assertIn("(1 images, 1 other files)", encoded)
+
+
+def edit_nvsg(data, edit=None, **fields):
+    """
+    NVSG file contents with edit(pixels) applied to the (rows, width,
+    channels) pixel array and header fields (x, y, width, height,
+    image_count) replaced.
+    """
+    import numpy as np
+    size = fvp_tools._NVSG_HEADER.size
+    header = list(fvp_tools._NVSG_HEADER.unpack_from(data, 0))
+    pixels = zlib.decompress(data[size:])
+    if edit is not None:
+        fmt, width = header[5], header[6]
+        array = np.frombuffer(pixels, dtype=np.uint8).reshape(
+            -1, width, fvp_tools.NVSG_CHANNELS[fmt]).copy()
+        edit(array)
+        pixels = array.tobytes()
+    for name, value in fields.items():
+        header[{'width': 6, 'height': 7, 'x': 8, 'y': 9, 'image_count': 12}[name]] = value
+    header[1] = len(pixels)
+    return fvp_tools._NVSG_HEADER.pack(*header) + zlib.compress(pixels)
+
+
+class NvsgVerifyTest(TempDirTest):
+
+    def setUp(self):
+        super().setUp()
+        from bench_fvp import make_nvsg
+        self.files = {
+            'bg': make_nvsg(1, 32, 24, seed=1), 'rgb': make_nvsg(0, 20, 10, seed=2),
+            'sprite': make_nvsg(2, 16, 12, 3, seed=3), 'mask': make_nvsg(3, 24, 16, seed=4),
+            'voice.ogg': b'OggS' + bytes(100),
+        }
+
+    def write_folder(self, name, files):
+        folder = self.root / name
+        folder.mkdir()
+        for filename, data in files.items():
+            (folder / filename).write_bytes(data)
+        return folder
+
+    def write_bin(self, name, files):
+        path = self.root / f"{name}.bin"
+        self.run_quiet(fvp_tools.bin_pack, self.write_folder(name, files), path)
+        return path
+
+    def verify(self, original, rebuilt, **kwargs):
+        """Returns (passed, printed report)."""
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            passed = fvp_tools.nvsg_verify(original, rebuilt, **kwargs)
+        return passed, output.getvalue()
+
+    def edited_files(self):
+        """Originals with one change of each kind, and the [DIFF] lines they give."""
+        def recolor(pixels):
+            pixels[5:8, 10:14, :3] ^= 0x40  # 12 pixels, color only
+
+        def alpha(pixels):
+            pixels[12 + 7, 9, 3] ^= 0x10  # Frame 1
+
+        files = dict(self.files)
+        files['bg'] = edit_nvsg(files['bg'], recolor)
+        files['sprite'] = edit_nvsg(files['sprite'], alpha)
+        files['rgb'] = edit_nvsg(files['rgb'], x=5)
+        files['mask'] = edit_nvsg(files['mask'], width=20, height=19)
+        expected = [
+            "[DIFF] bg: 12 pixels changed in (10,5)-(14,8)\n",
+            "[DIFF] sprite: 1 pixels changed in (9,19)-(10,20), frames 1, "
+            "alpha changed on 1 pixels (max 16)\n",
+            "[DIFF] rgb: x 0 -> 5\n",
+            "[DIFF] mask: size differs, pixels not compared, width 24 -> 20, height 16 -> 19\n",
+        ]
+        return files, expected
+
+    def test_compare_reports_region_and_alpha(self):
+        files, _ = self.edited_files()
+        result = fvp_tools.nvsg_compare(self.files['bg'], files['bg'])
+        self.assertEqual((result['changed'], result['bbox']), (12, (10, 5, 14, 8)))
+        self.assertEqual((result['alpha_changed'], result['drift'], result['frames']), (0, {}, []))
+
+        result = fvp_tools.nvsg_compare(self.files['sprite'], files['sprite'])
+        self.assertEqual((result['changed'], result['bbox'], result['frames']),
+                         (1, (9, 19, 10, 20), [1]))
+        self.assertEqual((result['alpha_changed'], result['alpha_max']), (1, 16))
+
+        fewer = edit_nvsg(self.files['sprite'], image_count=2)
+        result = fvp_tools.nvsg_compare(self.files['sprite'], fewer)
+        self.assertIsNone(result['changed'])
+        self.assertEqual(result['drift'], {'image_count': (3, 2)})
+
+        identical = fvp_tools.nvsg_compare(self.files['mask'], self.files['mask'])
+        self.assertEqual((identical['changed'], identical['drift']), (0, {}))
+
+    def test_folders_and_archives(self):
+        files, expected = self.edited_files()
+        originals = {
+            "folder": self.write_folder("original", self.files),
+            "bin": self.write_bin("original_bin", self.files),
+        }
+        rebuilt = {
+            "folder": self.write_folder("rebuilt", files),
+            "bin": self.write_bin("rebuilt_bin", files),
+            "same": self.write_bin("same_bin", self.files),
+        }
+        # bin-extract names (0000_ prefix) match the archive entry names
+        extracted = self.root / "extracted"
+        self.run_quiet(fvp_tools.bin_extract, originals["bin"], extracted, auto_ext=False)
+
+        for original, source in (("folder", originals["folder"]), ("bin", originals["bin"]),
+                                 ("extracted", extracted)):
+            for jobs in (1, 2):
+                with self.subTest(original=original, jobs=jobs):
+                    passed, output = self.verify(source, rebuilt["same"], jobs=jobs)
+                    self.assertTrue(passed, output)
+                    self.assertIn("Verified 4 images: 4 identical, 0 with changed pixels, "
+                                  "0 with header drift", output)
+
+                    for kind in ("folder", "bin"):
+                        passed, output = self.verify(source, rebuilt[kind], jobs=jobs)
+                        self.assertFalse(passed)
+                        self.assertEqual(sorted(line + "\n" for line in output.splitlines()
+                                                if line.startswith("[DIFF]")), sorted(expected))
+                        self.assertIn("Verified 4 images: 0 identical, 3 with changed pixels, "
+                                      "2 with header drift", output)
+
+    def test_missing_and_new_images_fail(self):
+        from bench_fvp import make_nvsg
+        files = dict(self.files)
+        del files['bg']
+        files['extra'] = make_nvsg(3, 4, 4)
+        passed, output = self.verify(self.write_folder("original", self.files),
+                                     self.write_bin("rebuilt", files))
+        self.assertFalse(passed)
+        self.assertIn("[MISSING] bg: not in rebuilt.bin", output)
+        self.assertIn("[NEW] extra: not in original", output)
+        self.assertIn("Verified 3 images: 3 identical", output)
+
+        passed, output = self.verify(self.root / "original", self.root / "original")
+        self.assertTrue(passed)
+        self.assertNotIn("voice.ogg", output)
+
+    def test_command_exit_status(self):
+        files, _ = self.edited_files()
+        original = str(self.write_folder("original", self.files))
+        same, rebuilt = str(self.write_bin("same", self.files)), str(self.write_bin("rebuilt", files))
+        argv = ['fvp_tools.py', 'nvsg-verify', original]
+        with mock.patch('sys.argv', argv + [same, '--jobs', '2']):
+            self.run_quiet(fvp_tools.main)  # No SystemExit
+        with mock.patch('sys.argv', argv + [rebuilt]), self.assertRaises(SystemExit) as exit:
+            self.run_quiet(fvp_tools.main)
+        self.assertEqual(exit.exception.code, 1)
+
+
+class PngStreamTest(TempDirTest):
+
+    def test_stream_decode_matches_buffered(self):
+        from PIL import Image
+        from bench_fvp import make_nvsg
+        for fmt, count in ((0, 0), (1, 0), (2, 3), (3, 0)):
+            with self.subTest(format=fmt):
+                nvsg = self.root / f"fmt{fmt}"
+                nvsg.write_bytes(make_nvsg(fmt, 157, 131, count, seed=fmt))
+                buffered, streamed = self.root / f"b{fmt}.png", self.root / f"s{fmt}.png"
+                self.run_quiet(fvp_tools.nvsg_decode, nvsg, buffered)
+                # Small blocks and IDAT chunks, so rows span several of each
+                with mock.patch.object(fvp_tools, 'NVSG_STREAM_CHUNK', 157 * 4 * 9), \
+                        mock.patch.object(fvp_tools.PngStreamWriter, 'IDAT_SIZE', 4096):
+                    self.run_quiet(fvp_tools.nvsg_decode, nvsg, streamed, stream=True)
+
+                with Image.open(buffered) as a, Image.open(streamed) as b:
+                    self.assertEqual((b.mode, b.size), (a.mode, a.size))
+                    self.assertEqual(b.tobytes(), a.tobytes())
+
+                chunks = list(png_chunks(streamed.read_bytes()))
+                self.assertEqual([kind for kind, _ in chunks[:1] + chunks[-1:]], [b'IHDR', b'IEND'])
+                idat = [payload for kind, payload in chunks if kind == b'IDAT']
+                self.assertGreater(len(idat), 1)
+                width, height = struct.unpack_from('>II', chunks[0][1])
+                stride = 1 + width * fvp_tools.NVSG_CHANNELS[fmt]
+                raw = zlib.decompress(b''.join(idat))
+                self.assertEqual(len(raw), height * stride)
+                # Sub, Up and Paeth all get picked on these pixels
+                self.assertEqual({raw[i] for i in range(0, len(raw), stride)}, {1, 2, 4})
+
+    def test_writer_checks_row_count(self):
+        import numpy as np
+        with open(self.root / "short.png", 'wb') as f:
+            png = fvp_tools.PngStreamWriter(f, 4, 3, 3)
+            png.write_rows(np.zeros((2, 4, 3), dtype=np.uint8))
+            with self.assertRaises(ValueError):
+                png.close()
+
+
+class BatchEncodeTest(TempDirTest):
+
+    def test_output_folder_is_cwd(self):
+        from PIL import Image
+        png_folder = self.root / "png"
+        out_folder = self.root / "nvsg"
+        png_folder.mkdir()
+        out_folder.mkdir()
+        Image.new('RGBA', (4, 3), (10, 20, 30, 255)).save(png_folder / "bg001.png")
+        (png_folder / "decode_log.txt").write_text(
+            "bg001.png x=1 y=2 image_count=0 width=4 height=3 format=1", encoding='cp932')
+
+        os.chdir(out_folder)
+        self.run_quiet(fvp_tools.batch_encode, "../png", ".", "../png/decode_log.txt")
+        # Second run reads the cache back and skips the unchanged PNG
+        output = self.run_quiet(fvp_tools.batch_encode, "../png", ".", "../png/decode_log.txt")
+
+        self.assertIn("[SKIP] bg001.png", output)
+        self.assertTrue((out_folder / "bg001").is_file())
+        self.assertTrue((self.root / "nvsg.encode_cache").is_file())
+        self.assertFalse((out_folder / ".encode_cache").exists())
+        meta = fvp_tools.nvsg_decode_bytes((out_folder / "bg001").read_bytes())[1]
+        self.assertEqual((meta['x'], meta['y'], meta['width'], meta['height']), (1, 2, 4, 3))
+
+    def decode_folder(self):
+        """NVSG files in formats 0-3 with unusual header fields, decoded to png/."""
+        from bench_fvp import make_nvsg
+        nvsg_folder = self.root / "nvsg"
+        nvsg_folder.mkdir()
+        for fmt, count in ((0, 0), (1, 0), (2, 4), (3, 0)):
+            (nvsg_folder / f"img{fmt}").write_bytes(make_nvsg(
+                fmt, 24, 16, count, x=fmt * 7, y=fmt + 3, seed=fmt, header_size=0x20,
+                unk1=fmt + 1, unk2=0x1234, unk3=0xDEAD, unk4=fmt * 100))
+        self.run_quiet(fvp_tools.batch_decode, nvsg_folder, self.root / "png")
+        return nvsg_folder
+
+    def test_cache_reencodes_only_what_changed(self):
+        from PIL import Image
+        self.decode_folder()
+        png, out = self.root / "png", self.root / "out"
+        metadata = png / "metadata.jsonl"
+        cache = self.root / "out.encode_cache"
+        all_images = [f"img{fmt}.png" for fmt in range(4)]
+
+        def encode(**kwargs):
+            """Names of the PNGs encoded, after checking the others were skipped."""
+            output = self.run_quiet(fvp_tools.batch_encode, png, out, metadata, **kwargs)
+            encoded = re.findall(r"^Encoded (\S+) ", output, re.M)
+            skipped = re.findall(r"^\[SKIP\] (\S+): unchanged$", output, re.M)
+            self.assertEqual(sorted(encoded + skipped), all_images)
+            return encoded
+
+        self.assertEqual(encode(), all_images)
+        self.assertTrue(cache.is_file())
+        self.assertEqual(encode(), [])
+
+        with self.subTest("edited PNG"):
+            with Image.open(png / "img1.png") as img:
+                img.load()
+            img.putpixel((3, 4), (1, 2, 3, 4))
+            img.save(png / "img1.png")
+            self.assertEqual(encode(), ["img1.png"])
+            self.assertEqual(encode(), [])
+
+        with self.subTest("x changed"):
+            lines = metadata.read_text(encoding='utf-8').splitlines()
+            fields = json.loads(lines[0])['fields']
+            for i, line in enumerate(lines[1:], 1):
+                row = json.loads(line)
+                if row[0] == "img2.png":
+                    row[fields.index('x')] += 1
+                    lines[i] = json.dumps(row)
+            metadata.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+            self.assertEqual(encode(), ["img2.png"])
+            self.assertEqual(fvp_tools.nvsg_read_header((out / "img2").read_bytes())['x'], 15)
+
+        with self.subTest("level changed"):
+            self.assertEqual(encode(level=6), all_images)
+            self.assertEqual(encode(level=6), [])
+            self.assertEqual(encode(), all_images)
+
+        with self.subTest("NVSG deleted or edited by hand"):
+            (out / "img3").unlink()
+            with open(out / "img0", 'ab') as f:
+                f.write(b'\x00')
+            self.assertEqual(encode(), ["img0.png", "img3.png"])
+            self.assertEqual(encode(), [])
+
+        with self.subTest("--no-cache"):
+            before = cache.read_bytes(), cache.stat().st_mtime_ns
+            self.assertEqual(encode(use_cache=False), all_images)
+            self.assertEqual((cache.read_bytes(), cache.stat().st_mtime_ns), before)
+            # The NVSGs were rewritten since the cache was saved
+            self.assertEqual(encode(), all_images)
+
+    def test_metadata_reproduces_headers(self):
+        nvsg_folder = self.decode_folder()
+        size = fvp_tools._NVSG_HEADER.size
+        for stream in (False, True):
+            with self.subTest(stream=stream):
+                out = self.root / f"out{int(stream)}"
+                output = self.run_quiet(fvp_tools.batch_encode, self.root / "png", out,
+                                        self.root / "png" / "metadata.jsonl", use_cache=False,
+                                        stream=stream)
+                for fmt in range(4):
+                    original = (nvsg_folder / f"img{fmt}").read_bytes()
+                    rebuilt = (out / f"img{fmt}").read_bytes()
+                    self.assertEqual(rebuilt[:size], original[:size])
+                    self.assertEqual(zlib.decompress(rebuilt[size:]), zlib.decompress(original[size:]))
+                # Frame counts, not the stored image_count (0 for single images)
+                self.assertIn("count=1, 24x16, fmt=0", output)
+                self.assertIn("count=4, 24x16, fmt=2", output)
+                self.assertNotIn("count=0", output)
+                self.assertNotIn("[WARN]", output)
+
+    def test_warns_when_png_does_not_fit_format(self):
+        from PIL import Image
+        self.decode_folder()
+        png = self.root / "png"
+        with Image.open(png / "img0.png") as img:
+            img.convert('RGBA').save(png / "img0.png")  # Gained an alpha channel
+        with Image.open(png / "img3.png") as img:
+            img.convert('RGB').save(png / "img3.png")  # Now a color image
+        output = self.run_quiet(fvp_tools.batch_encode, png, self.root / "out",
+                                png / "metadata.jsonl", use_cache=False)
+        self.assertIn("[WARN] RGBA PNG stored as recorded format 0 (RGB): alpha dropped", output)
+        self.assertIn("[WARN] RGB PNG stored as recorded format 3 (L): color dropped", output)
+        self.assertEqual(output.count("[WARN]"), 2)
+
+
+class NvsgCompressionTest(TempDirTest):
+
+    def test_options(self):
+        for args, expected in (([], (9, 'default')), (['--draft'], (1, 'default')),
+                               (['--level', '6'], (6, 'default')),
+                               (['--strategy', 'RLE'], (9, 'rle')),
+                               (['--draft', '--level', '4', '--strategy', 'filtered'], (4, 'filtered'))):
+            with self.subTest(args=args):
+                settings = fvp_tools.get_compression(['batch-encode', 'a', 'b', 'c'] + args)
+                self.assertEqual((settings['level'], settings['strategy']), expected)
+
+    def test_default_matches_original_output(self):
+        from bench_fvp import make_nvsg
+        size = fvp_tools._NVSG_HEADER.size
+        for fmt, count in ((0, 0), (1, 0), (2, 3), (3, 0)):
+            with self.subTest(format=fmt):
+                pixels = zlib.decompress(make_nvsg(fmt, 33, 17, count, seed=fmt)[size:])
+                self.assertEqual(fvp_tools.nvsg_compress(pixels), zlib.compress(pixels, 9))
+                img, meta = fvp_tools.nvsg_decode_bytes(make_nvsg(fmt, 33, 17, count, seed=fmt))
+                fields = {k: meta['header'][k] for k in fvp_tools.NVSG_EXACT_FIELDS}
+                data, _ = fvp_tools.nvsg_encode_image(img, 0, 0, meta['image_count'], fields=fields)
+                self.assertEqual(data[size:], zlib.compress(pixels, 9))
+
+    def test_every_setting_round_trips(self):
+        from bench_fvp import make_nvsg
+        data = make_nvsg(1, 40, 30, seed=5)
+        pixels = zlib.decompress(data[fvp_tools._NVSG_HEADER.size:])
+        for level in range(10):
+            for strategy in fvp_tools.NVSG_STRATEGIES:
+                compressed = fvp_tools.nvsg_compress(pixels, level, strategy)
+                self.assertEqual(zlib.decompress(compressed), pixels, (level, strategy))
+        self.assertLess(len(fvp_tools.nvsg_compress(pixels, 9)),
+                        len(fvp_tools.nvsg_compress(pixels, 0)))
+
+    def test_bad_settings_are_rejected(self):
+        from PIL import Image
+        for level, strategy, message in ((10, 'default', "Compression level must be 0-9, got 10"),
+                                         (-1, 'default', "Compression level must be 0-9, got -1"),
+                                         (9, 'zip', "Unknown compression strategy: zip")):
+            with self.subTest(level=level, strategy=strategy):
+                with self.assertRaisesRegex(ValueError, re.escape(message)):
+                    fvp_tools.nvsg_compress(b'pixels', level, strategy)
+
+        png = self.root / "bg.png"
+        Image.new('RGBA', (4, 3)).save(png)
+        for stream in (False, True):
+            with self.subTest(stream=stream):
+                with self.assertRaises(ValueError):
+                    fvp_tools.nvsg_encode(png, self.root / "bg", 0, 0, level=12, stream=stream)
+                self.assertFalse((self.root / "bg").exists())
+
+        (self.root / "png").mkdir()
+        with self.assertRaisesRegex(ValueError, "Unknown compression strategy"):
+            self.run_quiet(fvp_tools.batch_encode, self.root / "png", self.root / "out",
+                           self.root / "missing.jsonl", strategy='zip')
+        argv = ['fvp_tools.py', 'nvsg-encode', str(png), str(self.root / "bg"), '--level', '12']
+        with mock.patch('sys.argv', argv), self.assertRaises(SystemExit) as exit:
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                fvp_tools.main()
+        self.assertEqual(exit.exception.code, 1)
+        self.assertEqual(output.getvalue(), "Error: Compression level must be 0-9, got 12\n")
+
+
+class BatchJobsTest(TempDirTest):
+
+    def run_batch(self, func, output_folder, *args, **kwargs):
+        """Printed output of func with the output folder path and timings blanked."""
+        output = self.run_quiet(func, *args, **kwargs)
+        output = output.replace(str(output_folder), "<out>")
+        return re.sub(r"in \d+\.\d+s", "in <t>", output)
+
+    def test_jobs_match_serial(self):
+        from bench_fvp import make_nvsg
+        nvsg = self.root / "nvsg"
+        nvsg.mkdir()
+        for i in range(8):
+            fmt = i % 4
+            (nvsg / f"img{i}").write_bytes(make_nvsg(fmt, 20 + i, 12, 3 if fmt == 2 else 0,
+                                                     x=i, y=2 * i, seed=i))
+        (nvsg / "img3b").write_bytes(make_nvsg(1, 16, 16)[:70])  # Truncated pixel data
+        (nvsg / "aaa.txt").write_bytes(b'not an image')
+
+        decoded = {}
+        for jobs in (1, 3):
+            png = self.root / f"png{jobs}"
+            decoded[jobs] = self.run_batch(fvp_tools.batch_decode, png, nvsg, png, jobs=jobs)
+        png1, png3 = self.root / "png1", self.root / "png3"
+        self.assertEqual(decoded[3], decoded[1])
+        names = sorted(f.name for f in png1.iterdir())
+        self.assertEqual(sorted(f.name for f in png3.iterdir()), names)
+        for name in names:
+            self.assertEqual((png3 / name).read_bytes(), (png1 / name).read_bytes(), name)
+        # Sorted file order in the console output and the logs, failures summed up
+        decoded_names = re.findall(r"^Decoded (\S+) ", decoded[1], re.M)
+        self.assertEqual(decoded_names, [f"img{i}" for i in range(8)])
+        log = (png1 / "decode_log.txt").read_text(encoding='cp932').splitlines()
+        self.assertEqual([line.split()[0] for line in log], [f"img{i}.png" for i in range(8)])
+        self.assertEqual(list(fvp_tools.read_metadata(png1 / "metadata.jsonl")),
+                         [f"img{i}.png" for i in range(8)])
+        summary = decoded[1][decoded[1].index("[ERROR] 2 files failed:"):].splitlines()
+        self.assertEqual([line.split(':')[0] for line in summary[1:]], ["  aaa.txt", "  img3b"])
+
+        from PIL import Image
+        Image.new('RGB', (4, 4)).save(png1 / "img5.png")  # Edited: no alpha, other size
+        (png1 / "img6.png").write_bytes(b'not a PNG')
+        encoded = {}
+        for jobs in (1, 3):
+            out = self.root / f"out{jobs}"
+            encoded[jobs] = self.run_batch(fvp_tools.batch_encode, out, png1, out,
+                                           png1 / "metadata.jsonl", jobs=jobs, use_cache=False)
+        self.assertEqual(encoded[3], encoded[1])
+        out1, out3 = self.root / "out1", self.root / "out3"
+        self.assertEqual(sorted(f.name for f in out1.iterdir()),
+                         [f"img{i}" for i in range(8) if i != 6])
+        for f in out1.iterdir():
+            self.assertEqual((out3 / f.name).read_bytes(), f.read_bytes(), f.name)
+        self.assertIn("[OK] Encoded 7 images", encoded[1])
+        self.assertIn("[ERROR] 1 files failed:\n  img6.png: ", encoded[1])
+
+
+# =============================================================================
+# Start-up
+# =============================================================================
+
+class LazyImportTest(TempDirTest):
+
+    # Runs the CLI with Pillow and NumPy unimportable (None in sys.modules)
+    BLOCKED_MAIN = ("import sys; sys.modules['PIL'] = sys.modules['numpy'] = None; "
+                    "import fvp_tools; sys.argv[0] = 'fvp_tools.py'; fvp_tools.main()")
+
+    def python(self, *args):
+        import subprocess
+        import sys
+        env = dict(os.environ, PYTHONPATH=str(Path(fvp_tools.__file__).parent))
+        return subprocess.run([sys.executable, *args], capture_output=True, text=True,
+                              cwd=self.root, env=env)
+
+    def test_import_leaves_imaging_out(self):
+        result = self.python('-c', "import sys, fvp_tools; "
+                                   "print(sorted({'PIL', 'numpy', 'concurrent.futures'} & set(sys.modules)))")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout, "[]\n")
+
+    def test_hcb_and_bin_commands_run_without_imaging(self):
+        (self.root / "script.hcb").write_bytes(relocation_script())
+        files = self.root / "files"
+        files.mkdir()
+        (files / "a.dat").write_bytes(b'OggS' + bytes(50))
+        (files / "b.dat").write_bytes(b'data')
+        commands = [
+            ['hcb-decode', 'script.hcb', 'listing.txt', '--strings', 'strings.txt'],
+            ['hcb-strings', 'script.hcb', 'strings2.txt'],
+            ['hcb-rebuild', 'script.hcb', 'strings.txt', 'rebuilt.hcb'],
+            ['hcb-assemble', 'listing.txt', 'script.hcb', 'assembled.hcb'],
+            ['bin-pack', 'files', 'archive.bin'],
+            ['bin-list', 'archive.bin'],
+            ['bin-extract', 'archive.bin', 'extracted', '--jobs', '2'],
+        ]
+        for command in commands:
+            with self.subTest(command=command[0]):
+                result = self.python('-c', self.BLOCKED_MAIN, *command)
+                self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+                self.assertNotIn("Error", result.stdout)
+        self.assertEqual((self.root / "assembled.hcb").read_bytes(), relocation_script())
+        self.assertEqual((self.root / "extracted" / "0000_a.dat.ogg").read_bytes(), b'OggS' + bytes(50))
+
+        # Image commands say what is missing
+        from bench_fvp import make_nvsg
+        (self.root / "bg").write_bytes(make_nvsg(1, 4, 4))
+        result = self.python('-c', self.BLOCKED_MAIN, 'nvsg-decode', 'bg', 'bg.png')
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("NVSG images require Pillow and NumPy", result.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()